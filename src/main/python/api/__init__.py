@@ -1,2 +1,3 @@
 import api.games
+import api.matchmaking
 import api.users
\ No newline at end of file
@@ -1,3 +1,4 @@
+import secrets
 from functools import wraps
 
 from flask import request, g, Response
@@ -5,7 +6,13 @@ from flask import request, g, Response
 from gameauth import is_valid_password
 from gamedb import NoSuchUserError
 
-from .app import user_repository
+import api.config as config
+
+from .app import app, user_repository
+from .credential_cache import CredentialCache
+from .errors import ForbiddenError, NotFoundError
+from .props import *
+from .session_tokens import SessionTokens
 
 AUTH_REALM = "game-db"
 
@@ -30,6 +37,47 @@ def is_valid_credential(username: str, password: str) -> bool:
         return False
 
 
+# Successful verifications are remembered for CREDENTIAL_CACHE_TTL seconds,
+# so repeated requests with the same credentials skip the database and the
+# (deliberately slow) password hash.
+credential_cache = CredentialCache(is_valid_credential,
+                                   ttl=float(config.CREDENTIAL_CACHE_TTL),
+                                   capacity=int(config.CREDENTIAL_CACHE_SIZE)) \
+    if int(config.CREDENTIAL_CACHE_SIZE) else None
+
+
+def verify_credential(username: str, password: str) -> bool:
+    """ Validates a username and password, as `is_valid_credential` does,
+        but through the credential cache when it is enabled. """
+    if credential_cache is None:
+        return is_valid_credential(username, password)
+    return credential_cache.is_valid(username, password)
+
+
+# Clients can log in once and then send a session token as a Bearer token,
+# which is checked by its signature alone.
+session_tokens = SessionTokens(config.SESSION_TOKEN_SECRET.encode() or secrets.token_bytes(32),
+                               issuer_uri=config.TOKEN_ISSUER_URI,
+                               lifetime_seconds=int(config.SESSION_TOKEN_LIFETIME))
+
+
+def forget_credentials(uid: str):
+    """ Call this after changing a user's password or deleting a user, so
+        that the old credential is no longer accepted from the cache, nor
+        are session tokens issued for it. """
+    if credential_cache is not None:
+        credential_cache.invalidate(uid)
+    session_tokens.revoke(uid)
+
+
+def unauthorized() -> Response:
+    """ Produces the response for a request that failed authentication """
+    response = Response("", 401)
+    response.headers.add("WWW-Authenticate", f"Basic realm=\"{AUTH_REALM}\"")
+    response.headers.add("WWW-Authenticate", f"Bearer realm=\"{AUTH_REALM}\"")
+    return response
+
+
 def authenticate(f):
     """ Use this function as a decorator by adding it after the @app.route decorator
         for API functions that require authentication. """
@@ -38,19 +86,55 @@ def authenticate(f):
     def wrapper(*args, **kwargs):
         """ This wrapper gets in invoked before the API function that it wraps """
 
+        # A session token from the login endpoint is sent as a Bearer token; it needs no database access
+        scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+        if scheme.lower() == "bearer":
+            uid = session_tokens.verify(token.strip())
+            if not uid:
+                return unauthorized()
+            g.uid = uid
+            g.session = True
+            return f(*args, **kwargs)
+
         # Flask puts the contents of the Authorization header into the `authorization` attribute of the request
         auth = request.authorization
 
         # If the request doesn't have an auth attribute value or it doesn't have a username or doesn't have a
         # password or if the password isn't valid for the given user, we reject the request
-        if not auth or not auth.username or not auth.password or not is_valid_credential(auth.username, auth.password):
-            return Response("", 401, {"WWW-Authenticate": f"Basic realm=\"{AUTH_REALM}\""})
+        if not auth or not auth.username or not auth.password or not verify_credential(auth.username, auth.password):
+            return unauthorized()
 
         # Otherwise, we put the user ID for the authenticated user into the `g` namespace so we can access it
         # our API functions
         g.uid = auth.username
+        g.session = False
 
         # Now we invoke the function that handles the request (or the next wrapper)
         return f(*args, **kwargs)
 
     return wrapper
+
+
+@app.route(f"{AUTH_PATH}/token", methods=["POST"])
+@authenticate
+def login():
+    """ Issue a session token in exchange for the user's credentials """
+
+    # A session token can't be used to get another, or it would never expire
+    if g.session:
+        raise ForbiddenError()
+
+    data = {
+        TOKEN: session_tokens.issue(g.uid),
+        TOKEN_TYPE: "Bearer",
+        EXPIRES_IN: session_tokens.lifetime_seconds,
+    }
+    return data, 200, {"Cache-Control": "no-store"}
+
+
+@app.route(f"{AUTH_PATH}/stats")
+def credential_cache_stats():
+    """ Hit rate of the credential cache """
+    if credential_cache is None:
+        raise NotFoundError("credential cache is disabled")
+    return credential_cache.stats()
@@ -27,3 +27,29 @@ PRIVATE_KEY_PASSPHRASE = os.environ.get("PRIVATE_KEY_PASSPHRASE", "secret")
 GAME_SERVER_HOST = os.environ.get("GAME_SERVER_HOST", "localhost")
 GAME_SERVER_WS_SCHEME = os.environ.get("GAME_SERVER_WS_SCHEME", "ws")
 GAME_SERVER_WS_PORT = os.environ.get("GAME_SERVER_WS_PORT", "10020")
+
+# Credentials that pass verification are cached for CREDENTIAL_CACHE_TTL seconds
+# (at most CREDENTIAL_CACHE_SIZE of them); set the size to 0 to check every
+# request against the database. When running more than one API process, keep the
+# TTL short: a password change only clears the cache of the process that made it.
+CREDENTIAL_CACHE_SIZE = os.environ.get("CREDENTIAL_CACHE_SIZE", "10000")
+CREDENTIAL_CACHE_TTL = os.environ.get("CREDENTIAL_CACHE_TTL", "60")
+
+# A client can trade its credentials for a session token at /auth/token and send
+# that as a Bearer token instead, for SESSION_TOKEN_LIFETIME seconds. Session tokens
+# are signed with SESSION_TOKEN_SECRET, which must be the same for every API process
+# behind a load balancer; if it isn't set, each process makes up its own secret and
+# its tokens stop working when it restarts.
+SESSION_TOKEN_SECRET = os.environ.get("SESSION_TOKEN_SECRET", "")
+SESSION_TOKEN_LIFETIME = os.environ.get("SESSION_TOKEN_LIFETIME", "900")
+
+# Players who ask to be matched wait up to MATCHMAKING_WAIT seconds per request
+# for a table; if none fills in that time they get a 202 and poll again. Tables
+# hold from 2 to MATCHMAKING_MAX_SIZE players. Each pass of the matcher creates
+# up to MATCHMAKING_BATCH games, MATCHMAKING_WORKERS at a time. A player who
+# hasn't polled for MATCHMAKING_TICKET_TTL seconds is dropped from the queue.
+MATCHMAKING_WAIT = os.environ.get("MATCHMAKING_WAIT", "20")
+MATCHMAKING_MAX_SIZE = os.environ.get("MATCHMAKING_MAX_SIZE", "6")
+MATCHMAKING_BATCH = os.environ.get("MATCHMAKING_BATCH", "64")
+MATCHMAKING_WORKERS = os.environ.get("MATCHMAKING_WORKERS", "8")
+MATCHMAKING_TICKET_TTL = os.environ.get("MATCHMAKING_TICKET_TTL", "120")
@@ -0,0 +1,97 @@
+import hashlib
+import hmac
+import secrets
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Callable
+
+
+class CredentialCache:
+    """ Remembers credentials that have been verified, so that a client that
+        sends the same user ID and password on every request doesn't pay for
+        a database lookup and a password hash check each time.
+
+    Entries are keyed by an HMAC of the user ID and password, under a key
+    that is made up when the process starts and never leaves it, so the
+    cache holds no passwords. An entry is good for `ttl` seconds, and the
+    least recently used entries are evicted to keep at most `capacity` of
+    them. Credentials that fail verification aren't cached.
+
+    Call `invalidate` after changing a user's password or deleting the
+    user; a verification that was already under way when that happened
+    isn't cached either.
+    """
+
+    def __init__(self, verifier: Callable[[str, str], bool], ttl: float = 60, capacity: int = 10000):
+        self.verifier = verifier
+        self.ttl = ttl
+        self.capacity = capacity
+        self._key = secrets.token_bytes(32)
+        self._entries: OrderedDict[bytes, tuple[str, float]] = OrderedDict()
+        self._digests_by_uid: dict[str, set[bytes]] = {}
+        self._epoch = 0
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.invalidated = 0
+
+    def _digest(self, uid: str, password: str) -> bytes:
+        message = b"\0".join((uid.encode(), password.encode()))
+        return hmac.digest(self._key, message, hashlib.sha256)
+
+    def is_valid(self, uid: str, password: str) -> bool:
+        """ Returns True if and only if the password is valid for the user,
+            like the verifier this cache was created with """
+        digest = self._digest(uid, password)
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry:
+                if time.monotonic() < entry[1]:
+                    self._entries.move_to_end(digest)
+                    self.hits += 1
+                    return True
+                self._remove(digest)
+                self.expired += 1
+            self.misses += 1
+            epoch = self._epoch
+
+        if not self.verifier(uid, password):
+            return False
+
+        with self._lock:
+            if epoch == self._epoch:
+                self._entries[digest] = (uid, time.monotonic() + self.ttl)
+                self._digests_by_uid.setdefault(uid, set()).add(digest)
+                if len(self._entries) > self.capacity:
+                    self._remove(next(iter(self._entries)))
+        return True
+
+    def invalidate(self, uid: str):
+        """ Forgets every verified credential for the user """
+        with self._lock:
+            self._epoch += 1
+            for digest in self._digests_by_uid.pop(uid, ()):
+                del self._entries[digest]
+                self.invalidated += 1
+
+    def _remove(self, digest: bytes):
+        # called with the lock held
+        uid, _ = self._entries.pop(digest)
+        digests = self._digests_by_uid[uid]
+        digests.discard(digest)
+        if not digests:
+            del self._digests_by_uid[uid]
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "expired": self.expired,
+                "invalidated": self.invalidated,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
@@ -28,6 +28,12 @@ class NotFoundError(ClientError):
         super().__init__(404, *args)
 
 
+class ConflictError(ClientError):
+
+    def __init__(self, *args):
+        super().__init__(409, *args)
+
+
 class PreconditionFailedError(ClientError):
 
     def __init__(self, *args):
@@ -0,0 +1,282 @@
+import itertools
+import logging
+import time
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from threading import Condition, Event, Thread
+from typing import Optional
+
+from gameauth import TokenGenerator
+from gamedb import Game, GameRepository
+
+
+logger = logging.getLogger(__name__)
+
+
+class SeatingError(Exception):
+    """ Raised when a player tries to leave or change tables while the game
+        for the table they were taken to is being created """
+
+    def __init__(self, uid: str):
+        super().__init__(f"user {uid} is being seated at a table")
+
+
+class Ticket:
+    """ A player's place in the matchmaking queue, and later their match """
+
+    __slots__ = ("uid", "key", "queued_at", "polled_at", "matched_at", "seating", "game", "token", "_matched")
+
+    def __init__(self, uid: str, key: tuple):
+        self.uid = uid
+        self.key = key
+        self.queued_at = self.polled_at = time.monotonic()
+        self.matched_at = None
+        self.seating = False
+        self.game: Optional[Game] = None
+        self.token: Optional[str] = None
+        self._matched = Event()
+
+    @property
+    def size(self) -> int:
+        return self.key[0]
+
+    @property
+    def preferences(self) -> dict:
+        return dict(self.key[1])
+
+    @property
+    def matched(self) -> bool:
+        return self._matched.is_set()
+
+    def wait(self, timeout: float) -> bool:
+        """ Waits up to `timeout` seconds for a match; returns True if matched """
+        self.polled_at = time.monotonic()
+        matched = self._matched.wait(timeout)
+        self.polled_at = time.monotonic()
+        return matched
+
+
+class Matchmaker:
+    """ An in-process matchmaking queue.
+
+    Players wait in pools keyed by table size and preferences, so only
+    players who asked for the same thing are seated together, longest
+    waiting first. A single matcher thread takes every full table at once,
+    up to `batch_size` of them, and creates their games and tokens on a
+    small pool of workers; joining a pool only appends to a dict, so the
+    request path never waits on the database. Everyone at a table is told
+    of the match at the same moment, when all of its tokens are ready.
+    """
+
+    def __init__(self, game_repository: GameRepository, token_generator: TokenGenerator,
+                 batch_size: int = 64, workers: int = 8, ticket_ttl: float = 120):
+        self.game_repository = game_repository
+        self.token_generator = token_generator
+        self.batch_size = batch_size
+        self.ticket_ttl = ticket_ttl
+        self._pools: dict[tuple, dict[str, Ticket]] = {}
+        self._tickets: dict[str, Ticket] = {}
+        self._ready: set[tuple] = set()
+        self._cond = Condition()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="matchmaker")
+        self._thread = None
+        self._stopped = False
+        self._purged_at = time.monotonic()
+        self._fill_times = deque(maxlen=1000)
+        self.games_created = 0
+        self.players_matched = 0
+        self.failures = 0
+
+    @staticmethod
+    def pool_key(size: int, preferences: Optional[dict]) -> tuple:
+        return size, tuple(sorted((preferences or {}).items()))
+
+    def join(self, uid: str, size: int, preferences: Optional[dict] = None) -> Ticket:
+        """ Queues a player for a table of the given size and preferences.
+
+        A player who is already queued for the same table keeps their place;
+        one queued for a different table is moved, unless they are already
+        being seated at a table, which raises SeatingError. A player who has
+        been matched but hasn't yet collected the match gets that ticket back.
+        """
+        key = self.pool_key(size, preferences)
+        with self._cond:
+            self._start()
+            ticket = self._tickets.get(uid)
+            if ticket is not None:
+                if ticket.matched or ticket.key == key:
+                    ticket.polled_at = time.monotonic()
+                    return ticket
+                if ticket.seating:
+                    raise SeatingError(uid)
+                self._unqueue(ticket)
+            ticket = Ticket(uid, key)
+            self._tickets[uid] = ticket
+            pool = self._pools.setdefault(key, {})
+            pool[uid] = ticket
+            if len(pool) >= size and key not in self._ready:
+                self._ready.add(key)
+                self._cond.notify()
+            return ticket
+
+    def ticket(self, uid: str) -> Optional[Ticket]:
+        """ Gets the player's current ticket, if any """
+        with self._cond:
+            return self._tickets.get(uid)
+
+    def leave(self, uid: str) -> bool:
+        """ Takes a player out of the queue; returns False if they weren't waiting,
+            and raises SeatingError if their game is already being created """
+        with self._cond:
+            ticket = self._tickets.get(uid)
+            if ticket is None or ticket.matched:
+                return False
+            if ticket.seating:
+                raise SeatingError(uid)
+            del self._tickets[uid]
+            self._unqueue(ticket)
+            return True
+
+    def collect(self, ticket: Ticket):
+        """ Forgets a matched ticket once its player has been told of the match """
+        with self._cond:
+            if self._tickets.get(ticket.uid) is ticket:
+                del self._tickets[ticket.uid]
+
+    def queued(self, key: tuple) -> int:
+        """ Number of players waiting in the pool with the given key """
+        with self._cond:
+            return len(self._pools.get(key, ()))
+
+    def stats(self) -> dict:
+        with self._cond:
+            fill_times = sorted(self._fill_times)
+            queued = sum(len(pool) for pool in self._pools.values())
+        return {
+            "queued": queued,
+            "games_created": self.games_created,
+            "players_matched": self.players_matched,
+            "failures": self.failures,
+            "fill_seconds_p50": _percentile(fill_times, 0.50),
+            "fill_seconds_p99": _percentile(fill_times, 0.99),
+        }
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        if self._thread:
+            self._thread.join()
+        self._executor.shutdown()
+
+    def _start(self):
+        # called with the lock held
+        if self._thread is None:
+            self._thread = Thread(target=self._run, name="matchmaker", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._ready and not self._stopped:
+                    self._cond.wait(self.ticket_ttl / 4)
+                    self._purge()
+                if self._stopped:
+                    return
+                self._purge()
+                tables = self._take_tables()
+            # the next batch fills while this one is being created
+            futures = [self._executor.submit(self._create_game, table) for table in tables]
+            if not all([future.result() for future in futures]):
+                # don't spin on requeued tables while the repository is failing
+                time.sleep(1)
+
+    def _unqueue(self, ticket: Ticket):
+        # called with the lock held; the ticket may already be on its way to a table
+        pool = self._pools.get(ticket.key)
+        if pool is None or pool.pop(ticket.uid, None) is None:
+            return
+        if len(pool) < ticket.size:
+            self._ready.discard(ticket.key)
+        if not pool:
+            del self._pools[ticket.key]
+
+    def _take_tables(self) -> list[list[Ticket]]:
+        # called with the lock held
+        tables = []
+        for key in list(self._ready):
+            size = key[0]
+            pool = self._pools[key]
+            while len(pool) >= size and len(tables) < self.batch_size:
+                uids = list(itertools.islice(pool, size))
+                table = [pool.pop(uid) for uid in uids]
+                for ticket in table:
+                    ticket.seating = True
+                tables.append(table)
+            if len(pool) < size:
+                self._ready.discard(key)
+            if not pool:
+                del self._pools[key]
+        return tables
+
+    def _create_game(self, table: list[Ticket]) -> bool:
+        players = [ticket.uid for ticket in table]
+        preferences = table[0].preferences
+        try:
+            game = self.game_repository.create_game(players[0], players, custom=preferences or None)
+            tokens = [self.token_generator.generate(uid, game.gid, game.players) for uid in players]
+        except Exception:
+            logger.exception("error creating game for players %s", players)
+            self._requeue(table)
+            return False
+
+        matched_at = time.monotonic()
+        with self._cond:
+            self.games_created += 1
+            self.players_matched += len(table)
+            for ticket, token in zip(table, tokens):
+                ticket.game = game
+                ticket.token = token
+                ticket.matched_at = matched_at
+                ticket.seating = False
+                self._fill_times.append(matched_at - ticket.queued_at)
+        for ticket in table:
+            ticket._matched.set()
+        logger.debug("matched players %s in game %s", players, game.gid)
+        return True
+
+    def _requeue(self, table: list[Ticket]):
+        # players go back to the head of their pool, ahead of later arrivals
+        with self._cond:
+            self.failures += 1
+            key = table[0].key
+            for ticket in table:
+                ticket.seating = False
+            waiting = [ticket for ticket in table if self._tickets.get(ticket.uid) is ticket]
+            pool = {ticket.uid: ticket for ticket in waiting}
+            pool.update(self._pools.get(key, {}))
+            if pool:
+                self._pools[key] = pool
+            if len(pool) >= key[0]:
+                self._ready.add(key)
+
+    def _purge(self):
+        # called with the lock held; drops tickets whose players stopped polling
+        now = time.monotonic()
+        if now - self._purged_at < self.ticket_ttl / 4:
+            return
+        self._purged_at = now
+        stale = [ticket for ticket in self._tickets.values()
+                 if not ticket.seating and now - ticket.polled_at > self.ticket_ttl]
+        for ticket in stale:
+            del self._tickets[ticket.uid]
+            self._unqueue(ticket)
+        if stale:
+            logger.info("dropped %d abandoned matchmaking tickets", len(stale))
+
+
+def _percentile(values: list, fraction: float) -> Optional[float]:
+    if not values:
+        return None
+    return values[min(int(len(values) * fraction), len(values) - 1)]
@@ -0,0 +1,103 @@
+from flask import request, g
+
+import api.config as config
+
+from .app import app, game_repository, token_generator
+from .auth import authenticate
+from .errors import ConflictError, NotFoundError, ValidationError
+from .matchmaker import Matchmaker, SeatingError, Ticket
+from .props import *
+
+
+###########################################################################
+# This module handles API requests for matchmaking: instead of creating a
+# game for a list of players it already knows, a player asks for a table
+# of some size and waits to be seated with other players who asked for
+# the same thing.
+#
+# A player POSTs the table size and (optionally) preferences to join the
+# queue. The request waits for the table to fill; when it does, every
+# player at the table gets the new game's representation, including their
+# own token and the game server URL. If the table doesn't fill within
+# MATCHMAKING_WAIT seconds, the response is 202 and the player GETs the
+# same path to keep waiting, or DELETEs it to leave the queue. Once a
+# player's table is full and its game is being created, they can no longer
+# leave or change tables (409); they just wait for the match.
+#
+
+matchmaker = Matchmaker(game_repository, token_generator,
+                        batch_size=int(config.MATCHMAKING_BATCH),
+                        workers=int(config.MATCHMAKING_WORKERS),
+                        ticket_ttl=float(config.MATCHMAKING_TICKET_TTL))
+
+
+def wait_for_match(ticket: Ticket):
+    """ Waits for the ticket's table to fill, and produces the response """
+    if not ticket.wait(float(config.MATCHMAKING_WAIT)):
+        data = {
+            HREF: MATCHMAKING_PATH,
+            SIZE: ticket.size,
+            PREFERENCES: ticket.preferences,
+            QUEUED: matchmaker.queued(ticket.key),
+        }
+        return data, 202, {"Location": MATCHMAKING_PATH}
+
+    matchmaker.collect(ticket)
+    return game_to_dict(ticket.game, ticket.token)
+
+
+@app.route(MATCHMAKING_PATH, methods=["POST"])
+@authenticate
+def join_queue():
+    """ Queue the authenticated user for a table and wait for it to fill """
+
+    if not request.is_json:
+        raise ValidationError("request body must be JSON")
+
+    input_data = request.get_json()
+    size = input_data.get(SIZE)
+    preferences = input_data.get(PREFERENCES) or {}
+
+    max_size = int(config.MATCHMAKING_MAX_SIZE)
+    if type(size) is not int or not 2 <= size <= max_size:
+        raise ValidationError(f"size must be a number of players from 2 to {max_size}")
+
+    if not isinstance(preferences, dict) \
+            or not all(isinstance(value, (str, int, float, bool)) for value in preferences.values()):
+        raise ValidationError("preferences must be an object with simple values")
+
+    try:
+        ticket = matchmaker.join(g.uid, size, preferences)
+    except SeatingError as err:
+        raise ConflictError(str(err))
+    return wait_for_match(ticket)
+
+
+@app.route(MATCHMAKING_PATH)
+@authenticate
+def poll_queue():
+    """ Keep waiting for the authenticated user's table to fill """
+
+    ticket = matchmaker.ticket(g.uid)
+    if ticket is None:
+        raise NotFoundError(f"user {g.uid} is not waiting for a game")
+    return wait_for_match(ticket)
+
+
+@app.route(MATCHMAKING_PATH, methods=["DELETE"])
+@authenticate
+def leave_queue():
+    """ Take the authenticated user out of the queue """
+
+    try:
+        if not matchmaker.leave(g.uid):
+            raise NotFoundError(f"user {g.uid} is not waiting for a game")
+    except SeatingError as err:
+        raise ConflictError(str(err))
+    return "", 204
+
+
+@app.route(f"{MATCHMAKING_PATH}/stats")
+def matchmaking_stats():
+    """ Queue length, games created and fill latency """
+    return matchmaker.stats()
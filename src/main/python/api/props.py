@@ -11,6 +11,7 @@ COUNT = "count"
 CREATION_DATE = "creation_date"
 CREATOR = "creator"
 CUSTOM = "custom"
+EXPIRES_IN = "expires_in"
 FULL_NAME = "full_name"
 GAMES = "games"
 GID = "gid"
@@ -20,11 +21,17 @@ NICKNAME = "nickname"
 PASSWORD = "password"
 PLAYER = "player"
 PLAYERS = "players"
+PREFERENCES = "preferences"
+QUEUED = "queued"
+SIZE = "size"
 TOKEN = "token"
+TOKEN_TYPE = "token_type"
 UID = "uid"
 SERVER = "server"
 GAMES_PATH = "/games"
 USERS_PATH = "/users"
+AUTH_PATH = "/auth"
+MATCHMAKING_PATH = "/matchmaking"
 
 
 def user_to_dict(user: User) -> dict:
@@ -0,0 +1,65 @@
+import time
+from threading import Lock
+from typing import Optional
+
+import jwt
+
+ALGORITHM = "HS256"
+
+
+class SessionTokens:
+    """ Issues and verifies the short-lived session tokens that a client can
+        send as `Authorization: Bearer` instead of its user ID and password.
+
+    A session token is a JWT signed with HMAC-SHA256 under a secret shared by
+    the API processes, so verifying one is a signature check alone, with no
+    trip to the database. Game tokens are signed with RSA and so are never
+    accepted here, nor are session tokens accepted by the game server.
+
+    `revoke` rejects every token issued to a user before the call, for use
+    when the user's password is changed or the user is deleted. Revocations
+    are only known to the process that made them; tokens are short-lived
+    to bound what another process will accept.
+    """
+
+    def __init__(self, secret: bytes, issuer_uri: str, lifetime_seconds: int = 900):
+        self.secret = secret
+        self.issuer_uri = issuer_uri
+        self.lifetime_seconds = lifetime_seconds
+        self._revoked_at: dict[str, float] = {}
+        self._lock = Lock()
+
+    def issue(self, uid: str) -> str:
+        """ Issues a session token for the given (already authenticated) user """
+        iat = time.time()
+        claims = {
+            "sub": uid,
+            "iss": self.issuer_uri,
+            "iat": iat,
+            "exp": int(iat) + self.lifetime_seconds,
+        }
+        return jwt.encode(claims, self.secret, algorithm=ALGORITHM)
+
+    def verify(self, token: str) -> Optional[str]:
+        """ Returns the user ID of a valid session token, or None if the token
+            is malformed, badly signed, expired or revoked """
+        try:
+            claims = jwt.decode(token, self.secret, algorithms=[ALGORITHM], issuer=self.issuer_uri,
+                                options={"require": ["sub", "iss", "iat", "exp"]})
+        except jwt.InvalidTokenError:
+            return None
+        uid = claims["sub"]
+        revoked_at = self._revoked_at.get(uid)
+        if revoked_at is not None and claims["iat"] <= revoked_at:
+            return None
+        return uid
+
+    def revoke(self, uid: str):
+        """ Rejects every token issued to the user until now """
+        now = time.time()
+        with self._lock:
+            self._revoked_at[uid] = now
+            # a revocation only matters until the tokens it covers expire
+            cutoff = now - self.lifetime_seconds
+            if len(self._revoked_at) > 1000:
+                self._revoked_at = {user: at for user, at in self._revoked_at.items() if at > cutoff}
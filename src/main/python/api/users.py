@@ -4,7 +4,7 @@ from gamedb import DuplicateUserIdError, NoSuchUserError
 from .app import app, user_repository
 from .errors import ForbiddenError, NotFoundError, PreconditionFailedError, PreconditionRequiredError, ValidationError
 
-from .auth import authenticate
+from .auth import authenticate, forget_credentials
 from .props import *
 
 
@@ -65,6 +65,8 @@ def change_password(uid: str):
         user_repository.change_password(uid, password)
     except NoSuchUserError:
         raise NotFoundError(f"user '{uid}' not found")
+    finally:
+        forget_credentials(uid)
 
     return "", 204
 
@@ -80,6 +82,7 @@ def delete_user(uid: str):
     # The user repository doesn't complain when you try to delete
     # a user that doesn't exist, so no error handling needed here.
     user_repository.delete_user(uid)
+    forget_credentials(uid)
     return "", 204
 
 
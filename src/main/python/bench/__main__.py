@@ -0,0 +1,45 @@
+import argparse
+import json
+import platform
+import sys
+
+from .suite import BENCHMARKS, compare, run_benchmark
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-k", "--filter", nargs="+", help="run only the named benchmarks")
+    parser.add_argument("-s", "--scale", type=float, default=1.0, help="multiplier for the number of iterations")
+    parser.add_argument("-o", "--output", help="save the results as a JSON baseline")
+    parser.add_argument("-b", "--baseline", help="compare the results with a saved baseline")
+    parser.add_argument("-t", "--threshold", type=float, default=0.20,
+                        help="fraction by which a result may be worse than the baseline (default 0.20)")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    benchmarks = [b for b in BENCHMARKS if not args.filter or b.name in args.filter]
+
+    results = {}
+    print(f"{'benchmark':<20} {'ops/sec':>12} {'p50 (us)':>10} {'p99 (us)':>10}")
+    for benchmark in benchmarks:
+        result = run_benchmark(benchmark, args.scale)
+        results[benchmark.name] = result
+        print(f"{benchmark.name:<20} {result['ops_per_sec']:>12.1f} {result['p50_us']:>10.2f} {result['p99_us']:>10.2f}")
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump({
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "benchmarks": results,
+            }, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file)["benchmarks"], args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
@@ -0,0 +1,102 @@
+import argparse
+import json
+import random
+import timeit
+
+from server import codec
+from server.messages import EncodedMessage
+from server.session import MessageLog
+
+from .fakes import FakeConnection, InlineExecutor
+
+# Compares the JSON and binary (MessagePack) encodings of the messages of
+# whole games: the bytes sent per move, and the time to encode and decode
+# them. Run with `python -m bench.codecs`.
+
+
+def record_game(num_players: int, rng: random.Random) -> tuple[list[EncodedMessage], int]:
+    """ Plays a game through the server's controllers, asking at random and
+        drawing after each Go Fish; returns the messages recorded for the
+        game's clients (a broadcast once) and the number of moves """
+    from server.server import GameServer
+
+    server = GameServer("bench")
+    server.executor.stop()
+    server.executor = InlineExecutor()
+    server.message_log = MessageLog(1 << 20)
+    controllers = [server._add_controller(FakeConnection("bench", f"uid-{i}")) for i in range(num_players)]
+    for controller in controllers:
+        controller.handle_request({"action": "player_ready"})
+
+    game = server.go_fish_game
+    moves = 0
+    while not game.check_game_end()[0]:
+        current = game.players[game.current_player_index]
+        controller = next(c for c in controllers if c.player_name == current.name)
+        hand = current.hand
+        if hand and rng.random() < 0.6:
+            target = rng.choice([p.name for p in game.players if p is not current])
+            request = {"action": "ask_for_card", "targetPlayerName": target, "rank": rng.choice(hand).rank}
+        else:
+            request = {"action": "draw_card"}
+        controller.handle_request(request)
+        moves += 1
+    server.stop()
+    return [message for _, _, message in server.message_log._entries], moves
+
+
+def best_time(run, repeat: int) -> float:
+    return min(timeit.repeat(run, number=1, repeat=repeat))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-g", "--games", type=int, default=20, help="games to record")
+    parser.add_argument("-p", "--players", type=int, default=4, help="players in each game")
+    parser.add_argument("-r", "--repeat", type=int, default=5, help="measurements of each codec")
+    parser.add_argument("--seed", type=int, default=1)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if codec.MSGPACK not in codec.CODECS:
+        raise SystemExit("msgpack is not installed")
+
+    rng = random.Random(args.seed)
+    recorded, moves = [], 0
+    for _ in range(args.games):
+        game_messages, game_moves = record_game(args.players, rng)
+        recorded.extend(game_messages)
+        moves += game_moves
+
+    texts = [message.text for message in recorded]
+    payloads = [json.loads(text) for text in texts]
+    frames = [codec.to_frame(payload) for payload in payloads]
+    binaries = [codec.encode(frame) for frame in frames]
+
+    # encoding starts from the message as the server builds it: a dict, or
+    # (for the messages the server lays out itself) a ready-made frame
+    timings = {
+        "json": (
+            best_time(lambda: [json.dumps(payload) for payload in payloads], args.repeat),
+            best_time(lambda: [json.loads(text) for text in texts], args.repeat),
+            sum(len(text.encode()) for text in texts),
+        ),
+        "msgpack": (
+            best_time(lambda: [codec.encode(codec.to_frame(payload)) for payload in payloads], args.repeat),
+            best_time(lambda: [m for data in binaries for m in codec.decode(data)], args.repeat),
+            sum(map(len, binaries)),
+        ),
+        "msgpack (frames)": (
+            best_time(lambda: [codec.encode(frame) for frame in frames], args.repeat),
+            best_time(lambda: [codec.msgpack.unpackb(data) for data in binaries], args.repeat),
+            sum(map(len, binaries)),
+        ),
+    }
+
+    print(f"{len(recorded)} messages, {moves} moves in {args.games} games of {args.players} players")
+    print(f"{'codec':<18} {'bytes/move':>11} {'encode (us/move)':>17} {'decode (us/move)':>17}")
+    for name, (encode_seconds, decode_seconds, size) in timings.items():
+        print(f"{name:<18} {size / moves:>11.1f} {encode_seconds / moves * 1e6:>17.2f} "
+              f"{decode_seconds / moves * 1e6:>17.2f}")
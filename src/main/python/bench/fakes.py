@@ -0,0 +1,48 @@
+import json
+from typing import Callable, Optional
+
+from gamecomm.server import ConnectionClosedOK
+
+
+class FakeConnection:
+    """ An in-process stand-in for a GameConnection.
+
+    Requests come from `next_request`, which is called each time the
+    controller receives; returning None closes the connection. Sent messages
+    are encoded as the websocket transport would encode them, then dropped.
+    """
+
+    def __init__(self, gid: str, uid: str, next_request: Optional[Callable[[], Optional[dict]]] = None):
+        self.gid = gid
+        self.uid = uid
+        self.next_request = next_request
+        self.messages_sent = 0
+        self.bytes_sent = 0
+
+    def send(self, message):
+        self.send_text(json.dumps(message))
+
+    def send_text(self, text: str):
+        self.messages_sent += 1
+        self.bytes_sent += len(text)
+
+    def recv(self, timeout=None):
+        request = self.next_request() if self.next_request else None
+        if request is None:
+            raise ConnectionClosedOK()
+        return request
+
+    def __repr__(self):
+        return f"FakeConnection({self.uid})"
+
+
+class InlineExecutor:
+    """ Runs each command as soon as it is submitted, on the caller's thread """
+
+    queue_depth = 0
+
+    def submit(self, command, *args):
+        command(*args)
+
+    def stop(self):
+        pass
@@ -0,0 +1,239 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Optional
+
+import websockets
+
+from model.game import CARDS, GoFishGame
+from server import codec
+
+# Plays whole games against a running server over websockets, using the same
+# protocol as a real client, and reports the server's capacity. Run the server
+# with authentication off (ENABLE_AUTH unset), then
+# `python -m bench.load -g 500 -p 4`; see bench/README.md.
+
+STRATEGIES = ("random", "fisher")
+
+
+@dataclass
+class LoadStats:
+    connections: int = 0
+    connect_seconds: float = 0.0
+    games_finished: int = 0
+    moves: int = 0
+    # response latencies, in seconds
+    latencies: list = field(default_factory=list)
+    errors: Counter = field(default_factory=Counter)
+
+    def percentile(self, fraction: float) -> float:
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class LoadPlayer:
+    """ One simulated player: keeps track of its hand from the messages it
+        is sent, and on its turn asks an opponent for a rank it holds (or
+        draws when it has nothing to ask for) """
+
+    def __init__(self, game: "LoadGame", websocket, strategy: str, rng: random.Random):
+        self.game = game
+        self.websocket = websocket
+        self.strategy = strategy
+        self.rng = rng
+        self.name: Optional[str] = None
+        self.opponents: list[str] = []
+        self.hand: Counter = Counter()
+        self.my_turn = False
+        self.fished = False
+        # one player of each game keeps count of the game's moves
+        self.counts_moves = not game.players
+        # when the request awaiting its response was sent
+        self.sent_at: Optional[float] = None
+
+    async def send(self, request: dict):
+        self.sent_at = time.perf_counter()
+        await self.websocket.send(json.dumps(request))
+
+    def received_response(self):
+        stats = self.game.stats
+        stats.latencies.append(time.perf_counter() - self.sent_at)
+        stats.moves += 1
+        self.sent_at = None
+
+    async def move(self):
+        if not self.my_turn or self.sent_at is not None or not self.opponents or self.game.over:
+            return
+        self.my_turn = False
+        held = [rank for rank, count in self.hand.items() if count]
+        if not held or (self.strategy == "fisher" and self.fished):
+            self.fished = False
+            await self.send({"action": "draw_card"})
+        else:
+            await self.send({"action": "ask_for_card", "targetPlayerName": self.rng.choice(self.opponents),
+                             "rank": self.rng.choice(held)})
+
+    def handle(self, message: dict):
+        action = message.get("action")
+        if action == "session":
+            self.name = message["playerName"]
+        elif action == "initial_hand":
+            self.hand.update(card["rank"] for card in message["cards"])
+        elif action == "update_player_list":
+            self.opponents = [name for name in message["playerNames"] if name != self.name]
+        elif action == "your_turn":
+            self.my_turn = True
+        elif action == "ask_response":
+            self.received_response()
+            if message["cardsReceived"]:
+                self.hand.update(card["rank"] for card in message["newCards"])
+            else:
+                self.fished = True
+        elif "card" in message:
+            self.received_response()
+            self.hand[message["card"]["rank"]] += 1
+        elif action == "player_asked":
+            if message["targetPlayerName"] == self.name:
+                self.hand[message["rank"]] = 0
+            if self.counts_moves:
+                self.game.moved()
+        elif action == "player_drew":
+            if self.counts_moves:
+                self.game.drew()
+        elif action == "book_done":
+            if message["playerName"] == self.name:
+                self.hand[message["rank"]] = 0
+        elif "error" in message:
+            if self.sent_at is not None:
+                self.received_response()
+            if message["error"] == "No more cards in the deck":
+                self.game.over = True
+            else:
+                self.game.stats.errors["error response"] += 1
+
+    async def play(self):
+        await self.websocket.send(json.dumps({"action": "player_ready"}))
+        while not self.game.over:
+            try:
+                message = await asyncio.wait_for(self.websocket.recv(), self.game.timeout)
+            except asyncio.TimeoutError:
+                self.game.stats.errors["timeout"] += 1
+                self.game.over = True
+                break
+            for decoded in codec.decode(message) if isinstance(message, bytes) else [json.loads(message)]:
+                self.handle(decoded)
+            await self.move()
+
+
+class LoadGame:
+    """ The players of one game, and what they have seen of it """
+
+    def __init__(self, url: str, num_players: int, stats: LoadStats, strategy: str,
+                 max_moves: int, timeout: float, rng: random.Random):
+        self.url = url
+        self.num_players = num_players
+        self.stats = stats
+        self.strategy = strategy
+        self.max_moves = max_moves
+        self.timeout = timeout
+        self.rng = rng
+        self.players: list[LoadPlayer] = []
+        self.deck_size = len(CARDS) - GoFishGame.initial_hand_size(num_players) * num_players
+        self.moves_seen = 0
+        self.over = False
+
+    def moved(self):
+        self.moves_seen += 1
+        if self.moves_seen >= self.max_moves:
+            self.over = True
+
+    def drew(self):
+        self.deck_size -= 1
+        self.moved()
+        if self.deck_size <= 0:
+            self.over = True
+
+    async def connect(self, connecting: asyncio.Semaphore):
+        for _ in range(self.num_players):
+            async with connecting:
+                websocket = await websockets.connect(self.url, compression=None, max_queue=None)
+            self.players.append(LoadPlayer(self, websocket, self.strategy, self.rng))
+            self.stats.connections += 1
+
+    async def play(self):
+        try:
+            await asyncio.gather(*(player.play() for player in self.players))
+            self.stats.games_finished += 1
+        except websockets.ConnectionClosed:
+            self.stats.errors["connection closed"] += 1
+        finally:
+            await asyncio.gather(*(player.websocket.close() for player in self.players))
+
+
+async def run_load(base_url: str, num_games: int, num_players: int, strategy: str, concurrency: int,
+                   max_moves: int, timeout: float, seed: Optional[int],
+                   wire_codec: str = codec.JSON) -> tuple[LoadStats, float]:
+    """ Connects all the players of all the games, then plays the games at
+        once; returns the stats and the time spent playing """
+    stats = LoadStats()
+    rng = random.Random(seed)
+    run_id = uuid.uuid4().hex[:8]
+    query = f"?codec={wire_codec}" if wire_codec != codec.JSON else ""
+    games = [LoadGame(f"{base_url.rstrip('/')}/load-{run_id}-{number}{query}", num_players, stats, strategy,
+                      max_moves, timeout, rng)
+             for number in range(num_games)]
+
+    connecting = asyncio.Semaphore(concurrency)
+    start = time.perf_counter()
+    results = await asyncio.gather(*(game.connect(connecting) for game in games), return_exceptions=True)
+    stats.connect_seconds = time.perf_counter() - start
+    for result in results:
+        if isinstance(result, Exception):
+            stats.errors[f"connect: {type(result).__name__}"] += 1
+    connected = [game for game, result in zip(games, results) if not isinstance(result, Exception)]
+
+    start = time.perf_counter()
+    await asyncio.gather(*(game.play() for game in connected))
+    return stats, time.perf_counter() - start
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-u", "--url", default="ws://127.0.0.1:10020", help="the server's websocket URL")
+    parser.add_argument("-g", "--games", type=int, default=100, help="number of games to play at once")
+    parser.add_argument("-p", "--players", type=int, default=2, help="players in each game")
+    parser.add_argument("-s", "--strategy", choices=STRATEGIES, default="fisher",
+                        help="random: ask for a random held rank, drawing only with an empty hand; "
+                             "fisher: also draw on the turn after a Go Fish (default)")
+    parser.add_argument("-c", "--concurrency", type=int, default=100, help="connections opened at once")
+    parser.add_argument("-m", "--max-moves", type=int, default=500, help="moves after which a game is abandoned")
+    parser.add_argument("-t", "--timeout", type=float, default=10.0,
+                        help="seconds a player waits for a message before counting an error")
+    parser.add_argument("--seed", type=int, help="seed for the players' choices")
+    parser.add_argument("--codec", choices=codec.CODECS, default=codec.JSON,
+                        help="the encoding the players ask the server for")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    stats, play_seconds = asyncio.run(run_load(args.url, args.games, args.players, args.strategy,
+                                               args.concurrency, args.max_moves, args.timeout, args.seed,
+                                               args.codec))
+    print(f"connections      {stats.connections:>10} in {stats.connect_seconds:.2f}s "
+          f"({stats.connections / stats.connect_seconds if stats.connect_seconds else 0:.1f}/sec)")
+    print(f"games finished   {stats.games_finished:>10} of {args.games}")
+    print(f"moves            {stats.moves:>10} in {play_seconds:.2f}s "
+          f"({stats.moves / play_seconds if play_seconds else 0:.1f}/sec)")
+    print(f"latency p50 (ms) {stats.percentile(0.50) * 1000:>10.2f}")
+    print(f"latency p99 (ms) {stats.percentile(0.99) * 1000:>10.2f}")
+    print(f"errors           {sum(stats.errors.values()):>10}")
+    for kind, count in sorted(stats.errors.items()):
+        print(f"  {kind:<30} {count:>6}")
@@ -0,0 +1,46 @@
+import argparse
+import timeit
+
+from model.game import GoFishGame
+
+# Compares the linear scan that GoFishGame used to find players by name with
+# the name index it now maintains. Run with `python -m bench.player_lookup`.
+
+DEFAULT_TABLE_SIZES = (4, 16, 128, 1024, 8192)
+
+
+def scan_lookup(game: GoFishGame, name: str):
+    return next((p for p in game.players if p.name == name), None)
+
+
+def indexed_lookup(game: GoFishGame, name: str):
+    return game.find_player(name)
+
+
+def time_lookup(lookup, game: GoFishGame, names: list, repeat: int) -> float:
+    """ Returns the best mean time (in seconds) of a single lookup """
+    def run():
+        for name in names:
+            lookup(game, name)
+    return min(timeit.repeat(run, number=1, repeat=repeat)) / len(names)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-s", "--sizes", type=int, nargs="+", default=DEFAULT_TABLE_SIZES,
+                        help="table sizes (number of players) to measure")
+    parser.add_argument("-n", "--lookups", type=int, default=2000, help="lookups per measurement")
+    parser.add_argument("-r", "--repeat", type=int, default=5, help="measurements per table size")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    print(f"{'players':>8} {'scan (ns)':>12} {'index (ns)':>12} {'speedup':>9}")
+    for size in args.sizes:
+        game = GoFishGame([f"Player {i + 1}" for i in range(size)])
+        # spread the lookups evenly over the table so the scan cost is the average case
+        names = [game.players[i % size].name for i in range(0, args.lookups * 7, 7)]
+        scan = time_lookup(scan_lookup, game, names, args.repeat)
+        indexed = time_lookup(indexed_lookup, game, names, args.repeat)
+        print(f"{size:>8} {scan * 1e9:>12.0f} {indexed * 1e9:>12.0f} {scan / indexed:>8.1f}x")
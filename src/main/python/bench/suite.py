@@ -0,0 +1,166 @@
+import random
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
+
+from model.game import CARDS, NUM_SUITS, Deck, GoFishGame, Player
+
+from .fakes import FakeConnection, InlineExecutor
+
+# Each benchmark times one operation many times. Work that the operation
+# needs but that isn't part of what is measured (such as building a fresh
+# game to ask in) is done by `setup`, outside the timed region.
+
+
+@dataclass
+class Benchmark:
+    name: str
+    op: Optional[Callable[[Any], Any]] = None
+    setup: Callable[[], Any] = lambda: None
+    iterations: int = 10000
+    # measures the latencies (in nanoseconds) itself instead of timing `op`
+    measure: Optional[Callable[[int], list]] = None
+
+
+def _players(count):
+    return [f"Player {i + 1}" for i in range(count)]
+
+
+def _started_game(num_players=4):
+    game = GoFishGame([])
+    game.start_game(_players(num_players))
+    return game
+
+
+def _random_ask(game: GoFishGame, rng: random.Random):
+    player = game.players[game.current_player_index]
+    hand = player.hand
+    if not hand:
+        return None
+    target = rng.choice([p.name for p in game.players if p is not player])
+    return player.name, target, rng.choice(hand).rank
+
+
+def _setup_deal():
+    game = GoFishGame([])
+    game.players = [Player(name) for name in _players(4)]
+    return game
+
+
+def _setup_ask(rng=random.Random(1)):
+    game = _started_game()
+    return game, _random_ask(game, rng)
+
+
+def _ask(state):
+    game, ask = state
+    if ask:
+        game.ask_for_card(*ask)
+
+
+def _setup_book():
+    player = Player("Player 1")
+    for card in CARDS[:NUM_SUITS - 1]:
+        player.add_card(card)
+    return player, CARDS[NUM_SUITS - 1]
+
+
+def _complete_book(state):
+    player, card = state
+    player.add_card(card)
+
+
+def _playout(game: GoFishGame, rng=random.Random(2)):
+    """ Plays a game to the end: random asks, and a draw after each Go Fish """
+    while not game.check_game_end()[0]:
+        ask = _random_ask(game, rng)
+        player_name = game.players[game.current_player_index].name
+        if not ask or not game.request_cards(*ask):
+            game.draw_card(player_name)
+        game.next_player()
+
+
+def _measure_controller(iterations: int) -> list:
+    """ Feeds requests to GameController.run through a fake connection and
+        records the time between successive receives """
+    from server.server import GameServer
+
+    server = GameServer("bench")
+    server.executor.stop()
+    server.executor = InlineExecutor()
+    game = server.go_fish_game
+    rng = random.Random(3)
+    stamps = []
+
+    def next_request():
+        stamps.append(time.perf_counter_ns())
+        if len(stamps) > iterations:
+            return None
+        me = controller.player_name
+        if not game.is_current_player_turn(me):
+            game.next_player()
+        player = game.find_player(me)
+        if not player.hand_size:
+            return {"action": "draw_card"}
+        return {"action": "ask_for_card", "targetPlayerName": other.player_name,
+                "rank": rng.choice(player.hand).rank}
+
+    controller = server._add_controller(FakeConnection("bench", "uid-1", next_request))
+    other = server._add_controller(FakeConnection("bench", "uid-2"))
+    controller.handle_request({"action": "player_ready"})
+    other.handle_request({"action": "player_ready"})
+    controller.run()
+    server.stop()
+    return [end - start for start, end in zip(stamps, stamps[1:])]
+
+
+BENCHMARKS = [
+    Benchmark("deck_new", op=lambda _: Deck()),
+    Benchmark("deal_cards", op=GoFishGame.deal_cards, setup=_setup_deal),
+    Benchmark("ask_for_card", op=_ask, setup=_setup_ask),
+    Benchmark("book_completion", op=_complete_book, setup=_setup_book, iterations=100000),
+    Benchmark("full_game", op=_playout, setup=_started_game, iterations=1000),
+    Benchmark("controller_request", measure=_measure_controller, iterations=20000),
+]
+
+
+def _percentile(ordered: list, fraction: float) -> float:
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def run_benchmark(benchmark: Benchmark, scale: float = 1.0) -> dict:
+    iterations = max(int(benchmark.iterations * scale), 1)
+    if benchmark.measure:
+        benchmark.measure(max(iterations // 10, 1))    # warm up
+        latencies = benchmark.measure(iterations)
+    else:
+        for _ in range(max(iterations // 10, 1)):
+            benchmark.op(benchmark.setup())
+        latencies = []
+        for _ in range(iterations):
+            state = benchmark.setup()
+            start = time.perf_counter_ns()
+            benchmark.op(state)
+            latencies.append(time.perf_counter_ns() - start)
+    latencies.sort()
+    return {
+        "iterations": len(latencies),
+        "ops_per_sec": round(len(latencies) / (sum(latencies) / 1e9), 1),
+        "p50_us": round(_percentile(latencies, 0.50) / 1000, 3),
+        "p99_us": round(_percentile(latencies, 0.99) / 1000, 3),
+    }
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    """ Lists the benchmarks whose throughput or median latency is worse than
+        the baseline by more than `threshold` (a fraction) """
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        if result["ops_per_sec"] < base["ops_per_sec"] * (1 - threshold):
+            regressions.append(f"{name}: {result['ops_per_sec']} ops/sec vs {base['ops_per_sec']} in baseline")
+        if result["p50_us"] > base["p50_us"] * (1 + threshold):
+            regressions.append(f"{name}: p50 {result['p50_us']} us vs {base['p50_us']} us in baseline")
+    return regressions
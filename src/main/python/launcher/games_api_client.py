@@ -3,9 +3,8 @@ import requests
 from typing import Any
 from urllib.parse import urljoin
 
-from requests.auth import HTTPBasicAuth
-
 from .errors import AuthenticationRequiredError
+from .session_auth import SessionAuth
 
 
 logger = logging.getLogger(__name__)
@@ -17,6 +16,7 @@ class GamesApiClient:
     """
 
     GAMES_PATH = "/games"
+    MATCHMAKING_PATH = "/matchmaking"
 
     def __init__(self, base_url):
         """
@@ -28,11 +28,12 @@ class GamesApiClient:
 
     def auth(self, uid: str, password: str):
         """
-        Sets the authentication details for the API methods that require authentication
+        Sets the authentication details for the API methods that require authentication; the client logs in
+        with these and then uses a session token
         :param uid: user ID
         :param password: password
         """
-        self._auth = HTTPBasicAuth(uid, password)
+        self._auth = SessionAuth(self.base_url, uid, password)
 
     def create_game(self, players: list, custom: Any = None) -> dict:
         """
@@ -51,3 +52,32 @@ class GamesApiClient:
         response.raise_for_status()
         return response.json()
 
+    def find_match(self, size: int, preferences: dict = None) -> dict:
+        """
+        Waits in the matchmaking queue to be seated at a table with other players
+        :param size: number of players at the table
+        :param preferences: (optional) dict of simple values; players are only seated with others who gave the
+            same preferences
+        :return: result game representation from the server, with the token and server URL for this player
+        """
+        if not self._auth:
+            raise AuthenticationRequiredError()
+        url = urljoin(self.base_url, self.MATCHMAKING_PATH)
+        data = {"size": size}
+        if preferences:
+            data["preferences"] = preferences
+        response = requests.post(url, json=data, auth=self._auth)
+        while response.status_code == 202:
+            response = requests.get(url, auth=self._auth)
+        response.raise_for_status()
+        return response.json()
+
+    def leave_matchmaking(self):
+        """
+        Leaves the matchmaking queue
+        """
+        if not self._auth:
+            raise AuthenticationRequiredError()
+        response = requests.delete(urljoin(self.base_url, self.MATCHMAKING_PATH), auth=self._auth)
+        response.raise_for_status()
+
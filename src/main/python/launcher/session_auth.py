@@ -0,0 +1,88 @@
+import time
+from threading import Lock
+from typing import Optional
+from urllib.parse import urljoin
+
+import requests
+from requests.auth import AuthBase, HTTPBasicAuth
+
+
+class SessionAuth(AuthBase):
+    """
+    Authenticates requests with a session token from the API's login endpoint, so that the server doesn't
+    have to verify the user ID and password on every request.
+
+    The token is fetched with the user ID and password when it's first needed, and fetched again shortly
+    before it expires, or when the server rejects it (e.g. because the password was changed). If the
+    server has no login endpoint, requests fall back to sending the user ID and password.
+    """
+
+    LOGIN_PATH = "/auth/token"
+    EXPIRY_MARGIN_SECONDS = 30
+
+    def __init__(self, base_url: str, uid: str, password: str):
+        """
+        Creates a new instance.
+        :param base_url: base URL for the API server
+        :param uid: user ID
+        :param password: password
+        """
+        self.login_url = urljoin(base_url, self.LOGIN_PATH)
+        self.basic_auth = HTTPBasicAuth(uid, password)
+        self._token = None
+        self._expires_at = 0
+        self._supported = True
+        self._lock = Lock()
+
+    def login(self) -> Optional[str]:
+        """
+        Exchanges the user ID and password for a new session token
+        :return: the session token, or None if the server doesn't issue them
+        """
+        response = requests.post(self.login_url, auth=self.basic_auth)
+        if response.status_code == 404:
+            self._supported = False
+            return None
+        response.raise_for_status()
+        data = response.json()
+        self._token = data["token"]
+        self._expires_at = time.monotonic() + data["expires_in"] - self.EXPIRY_MARGIN_SECONDS
+        return self._token
+
+    def _current_token(self, rejected: str = None) -> Optional[str]:
+        with self._lock:
+            if self._supported and (self._token is None or self._token == rejected
+                                    or time.monotonic() >= self._expires_at):
+                self.login()
+            return self._token if self._supported else None
+
+    def _authorize(self, r, token: Optional[str]):
+        if token is None:
+            return self.basic_auth(r)
+        r.headers["Authorization"] = f"Bearer {token}"
+        return r
+
+    def __call__(self, r):
+        token = self._current_token()
+        self._authorize(r, token)
+        if token is not None:
+            r.register_hook("response", self._retry_rejected)
+        return r
+
+    def _retry_rejected(self, response, **kwargs):
+        # If the server rejected the token, log in again and resend the request once
+        if response.status_code != 401:
+            return response
+        rejected = response.request.headers["Authorization"].partition(" ")[2]
+        token = self._current_token(rejected)
+        if token == rejected:
+            return response
+
+        response.content
+        response.close()
+        retry = response.request.copy()
+        self._authorize(retry, token)
+        retry_response = response.connection.send(retry, **kwargs)
+        retry_response.history.append(response)
+        retry_response.request = retry
+        return retry_response
@@ -3,9 +3,9 @@ from typing import Any, Optional
 from urllib.parse import urljoin
 
 import requests
-from requests.auth import HTTPBasicAuth
 
 from .errors import AuthenticationRequiredError
+from .session_auth import SessionAuth
 
 logger = logging.getLogger(__name__)
 
@@ -33,11 +33,12 @@ class UsersApiClient:
 
     def auth(self, uid: str, password: str):
         """
-        Sets the authentication details for the API methods that require authentication
+        Sets the authentication details for the API methods that require authentication; the client logs in
+        with these and then uses a session token
         :param uid: user ID
         :param password: password
         """
-        self._auth = HTTPBasicAuth(uid, password)
+        self._auth = SessionAuth(self.base_url, uid, password)
 
     def create_user(self, uid: str, password: str, nickname: str = None, full_name: str = None, custom: Any = None) -> dict:
         """
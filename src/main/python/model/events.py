@@ -25,5 +25,25 @@ class PlayerChatEvent:
     message: str
 
 
-GameEvent = Union[PlayerJoinEvent, PlayerLeaveEvent, PlayerChatEvent]
+@dataclass(eq=True, frozen=True)
+class BookCompletedEvent:
+    player_name: str
+    rank: str
+
+
+@dataclass(eq=True, frozen=True)
+class CardsRequestedEvent:
+    asking_player: str
+    target_player: str
+    rank: str
+    count: int
+
+
+@dataclass(eq=True, frozen=True)
+class CardDrawnEvent:
+    player_name: str
+
+
+GameEvent = Union[PlayerJoinEvent, PlayerLeaveEvent, PlayerChatEvent, BookCompletedEvent,
+                  CardsRequestedEvent, CardDrawnEvent]
 GameObserver = Callable[[GameEvent], None]
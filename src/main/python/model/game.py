@@ -1,14 +1,50 @@
 import random
+import struct
 import threading
 import logging
-from collections import defaultdict
+from typing import Callable, Optional
+
+from .events import BookCompletedEvent, CardDrawnEvent, CardsRequestedEvent, GameEvent, GameObserver
 
 logger = logging.getLogger(__name__)
+
+RANKS = ('2', '3', '4', '5', '6', '7', '8', '9', '10', 'J', 'Q', 'K', 'A')
+SUITS = ('Hearts', 'Diamonds', 'Clubs', 'Spades')
+RANK_INDEX = {rank: i for i, rank in enumerate(RANKS)}
+SUIT_INDEX = {suit: i for i, suit in enumerate(SUITS)}
+NUM_SUITS = len(SUITS)
+FULL_SUIT_MASK = (1 << NUM_SUITS) - 1
+
+
 class Card:
+    # A card is identified by a small integer id (0-51) computed as
+    # rank_index * 4 + suit_index. The 52 cards of a deck are interned in
+    # `CARDS`, so the model only ever passes around shared instances.
+    __slots__ = ("id", "rank", "suit")
+
     def __init__(self, rank, suit):
+        self.id = RANK_INDEX[rank] * NUM_SUITS + SUIT_INDEX[suit]
         self.rank = rank
         self.suit = suit
 
+    @staticmethod
+    def from_id(card_id):
+        return CARDS[card_id]
+
+    @property
+    def rank_index(self):
+        return self.id // NUM_SUITS
+
+    @property
+    def suit_index(self):
+        return self.id % NUM_SUITS
+
+    def __eq__(self, other):
+        return isinstance(other, Card) and other.id == self.id
+
+    def __hash__(self):
+        return self.id
+
     def __repr__(self):
         return f"{self.rank} of {self.suit}"
     
@@ -19,66 +55,198 @@ class Card:
         }
 
 
+CARDS = tuple(Card(rank, suit) for rank in RANKS for suit in SUITS)
+
+# Moves that change the state of a GoFishGame. Together with the seed of the
+# game's deck, the sequence of moves is enough to rebuild the game exactly.
+MOVE_DEAL = 1       # (MOVE_DEAL, player names)
+MOVE_ASK = 2        # (MOVE_ASK, asking seat, target seat, rank index)
+MOVE_DRAW = 3       # (MOVE_DRAW, seat)
+MOVE_TURN = 4       # (MOVE_TURN,)
+MOVE_JOIN = 5       # (MOVE_JOIN, player name)
+MOVE_LEAVE = 6      # (MOVE_LEAVE, player name)
+
+SNAPSHOT_MAGIC = b"GFS1"
+_SNAPSHOT_HEADER = struct.Struct("<4sQHBHB")    # magic, seed, current player, started, players, deck size
+_SNAPSHOT_PLAYER = struct.Struct("<HBQ")        # name length, books, hand as a 52-bit mask
+
+
+INVALID_TARGET_MESSAGE = "Invalid target player."
+GO_FISH_MESSAGE = "Go Fish! No cards of that rank. Your turn is over."
+
+
+def cards_received_message(asking_player_name, target_player_name, rank, count):
+    return f"{asking_player_name} got {count} card(s) of rank {rank} from {target_player_name}."
+
+
 class Deck:
-    ranks = ['2', '3', '4', '5', '6', '7', '8', '9', '10', 'J', 'Q', 'K', 'A']
-    suits = ['Hearts', 'Diamonds', 'Clubs', 'Spades']
+    ranks = list(RANKS)
+    suits = list(SUITS)
 
-    def __init__(self):
-        self.cards = [Card(rank, suit) for rank in Deck.ranks for suit in Deck.suits]
-        random.shuffle(self.cards)
+    def __init__(self, rng: Optional[random.Random] = None):
+        self.cards = list(CARDS)
+        (rng or random).shuffle(self.cards)
 
     def draw_card(self):
         return self.cards.pop() if self.cards else None
 
 
 class Player:
-    def __init__(self, name):
+    def __init__(self, name, on_event: Optional[GameObserver] = None):
         self.name = name
-        self.hand = []
+        self.on_event = on_event
         self.books = 0
+        # For each rank (indexed as in RANKS), the number of cards held and a
+        # bitmask of the suits held; bit i is set when the SUITS[i] card is held
+        self.rank_counts = [0] * len(RANKS)
+        self.suit_masks = [0] * len(RANKS)
+        self.hand_size = 0
+
+    @property
+    def hand(self):
+        return [CARDS[rank_index * NUM_SUITS + suit_index]
+                for rank_index, mask in enumerate(self.suit_masks) if mask
+                for suit_index in range(NUM_SUITS) if mask & (1 << suit_index)]
+
+    @property
+    def hand_mask(self):
+        """ The hand as a 52-bit mask, with bit i set when the card with id i is held """
+        return sum(mask << (rank_index * NUM_SUITS) for rank_index, mask in enumerate(self.suit_masks))
+
+    def set_hand_mask(self, hand_mask):
+        for rank_index in range(len(RANKS)):
+            mask = (hand_mask >> (rank_index * NUM_SUITS)) & FULL_SUIT_MASK
+            self.suit_masks[rank_index] = mask
+            self.rank_counts[rank_index] = bin(mask).count("1")
+        self.hand_size = sum(self.rank_counts)
+
+    def add_card(self, card):
+        # Only the rank of the added card can have become a book, so book
+        # detection costs the same no matter how many cards are held
+        rank_index = card.id // NUM_SUITS
+        bit = 1 << (card.id % NUM_SUITS)
+        if not self.suit_masks[rank_index] & bit:
+            self.suit_masks[rank_index] |= bit
+            self.rank_counts[rank_index] += 1
+            self.hand_size += 1
+            if self.rank_counts[rank_index] == NUM_SUITS:
+                self._complete_book(rank_index)
+
+    def add_cards(self, cards):
+        for card in cards:
+            self.add_card(card)
 
     def draw(self, deck):
         card = deck.draw_card()
         if card:
-            self.hand.append(card)
-            self.check_for_book()
+            self.add_card(card)
         return card
 
-    def check_for_book(self):
-        rank_count = defaultdict(int)
-        for card in self.hand:
-            rank_count[card.rank] += 1
-
-        for rank, count in rank_count.items():
-            if count == 4:
-                self.books += 1
-                self.hand = [card for card in self.hand if card.rank != rank]
-                return {
-                    "action": "book done",
-                    "result": "success",
-                }
+    def _remove_rank(self, rank_index):
+        mask = self.suit_masks[rank_index]
+        self.hand_size -= self.rank_counts[rank_index]
+        self.rank_counts[rank_index] = 0
+        self.suit_masks[rank_index] = 0
+        return mask
 
+    def _complete_book(self, rank_index):
+        self.books += 1
+        self._remove_rank(rank_index)
+        if self.on_event:
+            self.on_event(BookCompletedEvent(self.name, RANKS[rank_index]))
 
     def has_rank(self, rank):
-        return any(card.rank == rank for card in self.hand)
+        rank_index = RANK_INDEX.get(rank)
+        return rank_index is not None and self.rank_counts[rank_index] > 0
 
     def give_all_rank(self, rank):
-        cards_to_give = [card for card in self.hand if card.rank == rank]
-        self.hand = [card for card in self.hand if card.rank != rank]
-        return cards_to_give
+        rank_index = RANK_INDEX.get(rank)
+        if rank_index is None:
+            return []
+        mask = self._remove_rank(rank_index)
+        return [CARDS[rank_index * NUM_SUITS + suit_index]
+                for suit_index in range(NUM_SUITS) if mask & (1 << suit_index)]
 
 
 class GoFishGame:
-    def __init__(self, player_names):
-        self.deck = Deck()
-        self.players = [Player(name) for name in player_names]
+    def __init__(self, player_names, seed=None):
+        # Each game shuffles with its own generator, so a game's deck can be
+        # reproduced from its seed
+        self.seed = seed if seed is not None else random.getrandbits(63)
+        self.deck = Deck(random.Random(self.seed))
+        self.on_move: Optional[Callable[[tuple], None]] = None
+        self._observers: list[GameObserver] = []
+        self._players: list[Player] = []
+        self._players_by_name: dict[str, Player] = {}
+        self._seats: dict[str, int] = {}
+        self.players = [Player(name, self._notify) for name in player_names]
         self.current_player_index = 0
         self.game_started = False
         self.lock = threading.Lock()
         #self.deal_cards()
 
+    @property
+    def players(self) -> list[Player]:
+        return self._players
+
+    @players.setter
+    def players(self, players: list[Player]):
+        # Keep the name and seat indexes in sync with the seating order, so
+        # that player lookups never need to scan the table
+        self._players = players
+        self._players_by_name = {player.name: player for player in players}
+        self._seats = {player.name: seat for seat, player in enumerate(players)}
+
+    def find_player(self, name) -> Optional[Player]:
+        return self._players_by_name.get(name)
+
+    def seat_of(self, name) -> Optional[int]:
+        return self._seats.get(name)
+
+    def add_player(self, name) -> Player:
+        with self.lock:
+            if name in self._players_by_name:
+                raise ValueError(f"player {name!r} is already seated")
+            player = Player(name, self._notify)
+            self._players.append(player)
+            self._players_by_name[name] = player
+            self._seats[name] = len(self._players) - 1
+            self._record(MOVE_JOIN, name)
+            return player
+
+    def remove_player(self, name):
+        with self.lock:
+            player = self._players_by_name.get(name)
+            if not player:
+                return
+            current = self._players[self.current_player_index]
+            self.players = [p for p in self._players if p is not player]
+            if current is not player:
+                # the player whose turn it is keeps the turn in their new seat
+                self.current_player_index = self._seats[current.name]
+            elif self._players:
+                self.current_player_index %= len(self._players)
+            else:
+                self.current_player_index = 0
+            self._record(MOVE_LEAVE, name)
+
+    def add_observer(self, observer: GameObserver):
+        self._observers.append(observer)
+
+    def _notify(self, event: GameEvent):
+        for observer in self._observers:
+            observer(event)
+
+    def _record(self, *move):
+        if self.on_move:
+            self.on_move(move)
+
+    @staticmethod
+    def initial_hand_size(num_players):
+        return 7 if num_players <= 3 else 5
+
     def deal_cards(self):
-        num_initial_cards = 7 if len(self.players) <= 3 else 5
+        num_initial_cards = self.initial_hand_size(len(self.players))
         for _ in range(num_initial_cards):
             for player in self.players:
                 player.draw(self.deck)
@@ -86,38 +254,60 @@ class GoFishGame:
     def start_game(self, player_names):
         with self.lock:
             if not self.game_started:
-                self.players = [Player(name) for name in player_names]
+                self.players = [Player(name, self._notify) for name in player_names]
                 self.deal_cards()
                 self.current_player_index = 0
                 self.game_started = True
+                self._record(MOVE_DEAL, tuple(player_names))
 
     def next_player(self):
         with self.lock:
             self.current_player_index = (self.current_player_index + 1) % len(self.players)
             current_player = self.players[self.current_player_index].name
-            print(f"Next player's turn: {current_player}")
-            logger.info(f"Switching to next player: {current_player}")
-            return current_player
+            self._record(MOVE_TURN)
+        logger.debug("Switching to next player: %s", current_player)
+        return current_player
+
+
+    def draw_card(self, player_name):
+        player = self._players_by_name.get(player_name)
+        card = player.draw(self.deck) if player else None
+        if card:
+            self._record(MOVE_DRAW, self._seats[player_name])
+            self._notify(CardDrawnEvent(player_name))
+        return card
 
+    def request_cards(self, asking_player_name, target_player_name, rank) -> Optional[list]:
+        """ Moves all cards of the given rank from the target player to the
+            asking player, and returns the cards moved (an empty list means
+            "Go Fish"), or None if the target player isn't valid """
+        with self.lock:
+            asking_player = self._players_by_name.get(asking_player_name)
+            target_player = self._players_by_name.get(target_player_name)
+            logger.debug("Target Player: %s", target_player)
+            if not asking_player or not target_player or target_player == asking_player:
+                return None
+
+            cards = target_player.give_all_rank(rank)
+            self._notify(CardsRequestedEvent(asking_player.name, target_player.name, rank, len(cards)))
+            asking_player.add_cards(cards)
+            if rank in RANK_INDEX:
+                self._record(MOVE_ASK, self._seats[asking_player_name], self._seats[target_player_name],
+                             RANK_INDEX[rank])
+            return cards
 
     def ask_for_card(self, asking_player_name, target_player_name, rank):
-         with self.lock:
-            asking_player = next((p for p in self.players if p.name == asking_player_name), None)
-            target_player = next((p for p in self.players if p.name == target_player_name), None)
-            logger.info(f"Target Player: {target_player}")
-            if not target_player or target_player == asking_player:
-                return "Invalid target player."
-
-            if target_player.has_rank(rank):
-                cards = target_player.give_all_rank(rank)
-                asking_player.hand.extend(cards)
-                asking_player.check_for_book()
+            cards = self.request_cards(asking_player_name, target_player_name, rank)
+            if cards is None:
+                return INVALID_TARGET_MESSAGE
+
+            if cards:
                 card_dicts = [card.to_dict() for card in cards]
                 return {
                 "action": "ask_response",
                 "result": "success",
                 "cardsReceived": True,
-                "message": f"{asking_player.name} got {len(cards)} card(s) of rank {rank} from {target_player.name}.",
+                "message": cards_received_message(asking_player_name, target_player_name, rank, len(cards)),
                 "newCards": card_dicts
             }
             else:
@@ -126,7 +316,7 @@ class GoFishGame:
                 "action": "ask_response",
                 "result": "go_fish",
                 "cardsReceived": False,
-                "message": "Go Fish! No cards of that rank. Your turn is over."
+                "message": GO_FISH_MESSAGE
             }
 
     def is_game_over(self):
@@ -134,8 +324,7 @@ class GoFishGame:
 
     def is_current_player_turn(self, player):
         check = player == self.players[self.current_player_index].name
-        logger.info(f"Checking turn for {player}. Current player: {check}")
-        logger.info(f"Checking turn for {player}. Current player: {self.players[self.current_player_index].name}")
+        logger.debug("Checking turn for %s. Current player: %s", player, check)
         return check
     
 
@@ -147,3 +336,55 @@ class GoFishGame:
             winners = [player.name for player in self.players if player.books == max_books]
             return True, winners
         return False, None
+
+    def apply_move(self, move: tuple):
+        """ Replays a move recorded through `on_move` """
+        kind = move[0]
+        if kind == MOVE_DEAL:
+            self.start_game(list(move[1]))
+        elif kind == MOVE_ASK:
+            self.ask_for_card(self.players[move[1]].name, self.players[move[2]].name, RANKS[move[3]])
+        elif kind == MOVE_DRAW:
+            self.draw_card(self.players[move[1]].name)
+        elif kind == MOVE_TURN:
+            self.next_player()
+        elif kind == MOVE_JOIN:
+            self.add_player(move[1])
+        elif kind == MOVE_LEAVE:
+            self.remove_player(move[1])
+        else:
+            raise ValueError(f"unknown move {move!r}")
+
+    def snapshot(self) -> bytes:
+        """ Encodes the complete state of the game in a compact binary form """
+        parts = [_SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, self.seed, self.current_player_index,
+                                       self.game_started, len(self.players), len(self.deck.cards)),
+                 bytes(card.id for card in self.deck.cards)]
+        for player in self.players:
+            name = player.name.encode()
+            parts.append(_SNAPSHOT_PLAYER.pack(len(name), player.books, player.hand_mask))
+            parts.append(name)
+        return b"".join(parts)
+
+    @staticmethod
+    def from_snapshot(data: bytes) -> "GoFishGame":
+        magic, seed, current, started, num_players, deck_size = _SNAPSHOT_HEADER.unpack_from(data)
+        if magic != SNAPSHOT_MAGIC:
+            raise ValueError("not a game snapshot")
+        offset = _SNAPSHOT_HEADER.size
+        game = GoFishGame([], seed)
+        game.deck.cards = [CARDS[card_id] for card_id in data[offset:offset + deck_size]]
+        offset += deck_size
+        players = []
+        for _ in range(num_players):
+            name_length, books, hand_mask = _SNAPSHOT_PLAYER.unpack_from(data, offset)
+            offset += _SNAPSHOT_PLAYER.size
+            player = Player(data[offset:offset + name_length].decode(), game._notify)
+            offset += name_length
+            player.books = books
+            player.set_hand_mask(hand_mask)
+            players.append(player)
+        game.players = players
+        game.current_player_index = current
+        game.game_started = bool(started)
+        return game
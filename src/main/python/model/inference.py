@@ -0,0 +1,228 @@
+import random
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Optional
+
+from .game import CARDS, NUM_SUITS, RANK_INDEX, RANKS, GoFishGame
+
+# Everything a player can legitimately know about the table is tracked by a
+# `TableKnowledge` from the public game messages (asks, draws and books) and
+# the player's own cards. When it is the player's turn, `choose_ask` samples
+# hands for the opponents that are consistent with that knowledge and picks
+# the move with the best expected outcome. Since a failed ask ends the turn
+# without a draw, drawing a card is one of the moves considered.
+
+NUM_RANKS = len(RANKS)
+BOOK_BONUS = 2.0        # value of completing a book, in cards
+DRAW_VALUE = 0.5        # value of a drawn card; unlike a card won by asking, no opponent loses it
+MIN_SAMPLES = 8
+
+
+@dataclass(frozen=True)
+class TableView:
+    """ A picklable snapshot of a player's knowledge, taken at the start of a turn """
+    me: int                         # seat of the player whose turn it is
+    own: tuple                      # (13) counts of each rank in our own hand
+    hand_sizes: tuple               # number of cards held by each seat
+    deck_size: int
+    booked: int                     # bitmask of ranks that have been booked
+    known: tuple                    # for each seat, (13) counts of cards known to be held
+    lacks: tuple                    # for each seat, bitmask of ranks known not to be held
+
+
+class TableKnowledge:
+
+    def __init__(self, me: str, player_names: list):
+        self.me = me
+        self.player_names = list(player_names)
+        self.seats = {name: seat for seat, name in enumerate(self.player_names)}
+        self.own = [0] * NUM_RANKS
+        self.booked = 0
+        self.draws = 0
+        self.hand_deltas = defaultdict(int)
+        self.known = [[0] * NUM_RANKS for _ in self.player_names]
+        self.lacks = [0] * len(self.player_names)
+
+    @property
+    def initial_hand_size(self) -> int:
+        return GoFishGame.initial_hand_size(len(self.player_names))
+
+    @property
+    def deck_size(self) -> int:
+        return max(len(CARDS) - self.initial_hand_size * len(self.player_names) - self.draws, 0)
+
+    def hand_size(self, name: str) -> int:
+        if name == self.me:
+            return sum(self.own)
+        return max(self.initial_hand_size + self.hand_deltas[name], 0)
+
+    def set_hand(self, cards: list):
+        self.own = [0] * NUM_RANKS
+        for card in cards:
+            self.add_own(card["rank"])
+
+    def add_own(self, rank: str):
+        rank_index = RANK_INDEX[rank]
+        if not self.booked & (1 << rank_index):
+            self.own[rank_index] += 1
+
+    def on_book(self, name: str, rank: str):
+        rank_index = RANK_INDEX[rank]
+        self.booked |= 1 << rank_index
+        if name == self.me:
+            self.own[rank_index] = 0
+        else:
+            self.hand_deltas[name] -= NUM_SUITS
+        for known in self.known:
+            known[rank_index] = 0
+
+    def on_draw(self, name: str):
+        self.draws += 1
+        if name != self.me:
+            self.hand_deltas[name] += 1
+            # the drawn card could be of any rank
+            self.lacks[self.seats[name]] = 0
+
+    def on_ask(self, asking: str, target: str, rank: str, count: int):
+        rank_index = RANK_INDEX[rank]
+        bit = 1 << rank_index
+        if self.booked & bit:
+            return
+        asker_seat, target_seat = self.seats[asking], self.seats[target]
+
+        # the asker must hold the rank, and ends up holding the target's cards too
+        if asking == self.me:
+            self.own[rank_index] += count
+        else:
+            self.hand_deltas[asking] += count
+            self.known[asker_seat][rank_index] = max(self.known[asker_seat][rank_index], 1) + count
+            self.lacks[asker_seat] &= ~bit
+
+        # the target now holds none of the rank
+        if target == self.me:
+            self.own[rank_index] = 0
+        else:
+            self.hand_deltas[target] -= count
+            self.known[target_seat][rank_index] = 0
+            self.lacks[target_seat] |= bit
+
+    def view(self) -> TableView:
+        return TableView(me=self.seats[self.me],
+                         own=tuple(self.own),
+                         hand_sizes=tuple(self.hand_size(name) for name in self.player_names),
+                         deck_size=self.deck_size,
+                         booked=self.booked,
+                         known=tuple(tuple(known) for known in self.known),
+                         lacks=tuple(self.lacks))
+
+
+def sample_hands(view: TableView, rng: random.Random) -> list:
+    """ Deals the cards we can't see to the opponents (and the deck) at random,
+        respecting what is known about each opponent's hand.
+
+    Returns:
+        tuple: for each seat, (13) sampled counts of each rank; and (13)
+               sampled counts of each rank left in the deck
+    """
+    seats = [seat for seat in range(len(view.hand_sizes)) if seat != view.me]
+    hands = [list(known) for known in view.known]
+    hands[view.me] = list(view.own)
+
+    deck = [0] * NUM_RANKS
+    hidden = []
+    for rank_index in range(NUM_RANKS):
+        if view.booked & (1 << rank_index):
+            continue
+        unseen = NUM_SUITS - view.own[rank_index] - sum(view.known[seat][rank_index] for seat in seats)
+        hidden.extend([rank_index] * max(unseen, 0))
+    rng.shuffle(hidden)
+
+    # Each unseen card goes to a free slot in an opponent's hand or the deck
+    capacity = {seat: max(view.hand_sizes[seat] - sum(view.known[seat]), 0) for seat in seats}
+    deck_slots = view.deck_size
+    for rank_index in hidden:
+        bit = 1 << rank_index
+        candidates = [seat for seat in seats if capacity[seat] and not view.lacks[seat] & bit]
+        weights = [capacity[seat] for seat in candidates]
+        total = sum(weights) + deck_slots
+        if not total:
+            break
+        pick = rng.random() * total
+        for seat, weight in zip(candidates, weights):
+            if pick < weight:
+                hands[seat][rank_index] += 1
+                capacity[seat] -= 1
+                break
+            pick -= weight
+        else:
+            deck_slots -= 1
+            deck[rank_index] += 1
+    return hands, deck
+
+
+def heuristic_ask(view: TableView, rng: Optional[random.Random] = None) -> Optional[tuple]:
+    """ A quick choice used when there is no time to sample: ask for a rank an
+        opponent is known to hold if possible, else ask the largest hand for our
+        most plentiful rank.
+
+    Returns:
+        tuple: (target seat, rank index), or None if we hold no cards
+    """
+    rng = rng or random.Random()
+    held = [rank_index for rank_index in range(NUM_RANKS) if view.own[rank_index]]
+    if not held:
+        return None
+    seats = [seat for seat in range(len(view.hand_sizes)) if seat != view.me]
+    for rank_index in sorted(held, key=lambda r: -view.own[r]):
+        holders = [seat for seat in seats if view.known[seat][rank_index]]
+        if holders:
+            return rng.choice(holders), rank_index
+    rank_index = max(held, key=lambda r: view.own[r])
+    return max(seats, key=lambda seat: (view.hand_sizes[seat], rng.random())), rank_index
+
+
+def choose_ask(view: TableView, budget: float, seed=None) -> Optional[tuple]:
+    """ Chooses the ask (or draw) with the highest expected value over as many
+        sampled deals as fit in the time budget.
+
+    Args:
+        view (TableView): what the player knows about the table
+        budget (float): seconds available for the decision
+        seed: seed for the sampler
+
+    Returns:
+        tuple: (target seat, rank index, number of samples), where the target
+               seat and rank index are None for a draw; or None if we hold
+               no cards
+    """
+    deadline = time.perf_counter() + budget
+    rng = random.Random(seed)
+    held = [rank_index for rank_index in range(NUM_RANKS) if view.own[rank_index]]
+    if not held:
+        return None
+    asks = [(seat, rank_index) for seat in range(len(view.hand_sizes)) if seat != view.me
+            for rank_index in held]
+    values = dict.fromkeys(asks, 0.0)
+    draw = (None, None)
+    if view.deck_size:
+        values[draw] = 0.0
+    almost_books = [rank_index for rank_index in held if view.own[rank_index] == NUM_SUITS - 1]
+
+    samples = 0
+    while samples < MIN_SAMPLES or time.perf_counter() < deadline:
+        hands, deck = sample_hands(view, rng)
+        if view.deck_size:
+            book_chance = sum(deck[rank_index] for rank_index in almost_books) / view.deck_size
+            values[draw] += DRAW_VALUE + BOOK_BONUS * book_chance
+        for seat, rank_index in asks:
+            count = hands[seat][rank_index]
+            if count:
+                values[seat, rank_index] += count
+                if view.own[rank_index] + count == NUM_SUITS:
+                    values[seat, rank_index] += BOOK_BONUS
+        samples += 1
+
+    best = max(values.values())
+    seat, rank_index = rng.choice([ask for ask, value in values.items() if value == best])
+    return seat, rank_index, samples
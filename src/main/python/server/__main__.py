@@ -1,15 +1,46 @@
 import logging
-import sys
 from gameauth import TokenValidator
 
 import server.config as config
+from .async_listener import AsyncGameListener
 from .listener import GameListener
+from .logs import configure_logging, parse_sample_rates
+from .shard import run_sharded
+from .token_cache import TokenCache
 
-if __name__ == "__main__":
-    logging.basicConfig(stream=sys.stdout, level=logging.INFO,
-                        format="%(levelname)s %(name)s %(threadName)s %(message)s")
 
+def setup_logging():
+    configure_logging(logging.getLevelName(config.LOG_LEVEL),
+                      "%(levelname)s %(name)s %(processName)s %(threadName)s %(message)s",
+                      parse_sample_rates(config.LOG_SAMPLING), float(config.LOG_RATE_LIMIT))
+
+
+def create_listener(owns_gid=None, worker=None):
+    if worker is not None:
+        # a worker process needs a logging thread of its own
+        setup_logging()
     enable_auth = bool(config.ENABLE_AUTH)
     token_validator = TokenValidator(config.TOKEN_ISSUER_URI, config.PUBLIC_KEY_FILE) if enable_auth else None
-    listener = GameListener(config.LOCAL_IP, int(config.WS_LISTENER_PORT), token_validator)
-    listener.run()
+    token_cache_size = int(config.TOKEN_CACHE_SIZE)
+    if token_validator and token_cache_size:
+        token_validator = TokenCache(token_validator, token_cache_size)
+    # each worker of a sharded server serves its metrics on a port of its own
+    metrics_port = int(config.METRICS_PORT)
+    if metrics_port and worker is not None:
+        metrics_port += 1 + worker
+    listener_class = AsyncGameListener if config.ASYNC_LISTENER else GameListener
+    return listener_class(config.LOCAL_IP, int(config.WS_LISTENER_PORT), token_validator,
+                          config.DATA_DIR, int(config.SNAPSHOT_INTERVAL),
+                          float(config.GAME_IDLE_TTL), float(config.ENDED_GAME_TTL),
+                          int(config.MAX_GAMES), float(config.REAP_INTERVAL), owns_gid,
+                          metrics_port)
+
+
+if __name__ == "__main__":
+    setup_logging()
+
+    workers = int(config.SHARD_WORKERS)
+    if workers == 1:
+        create_listener().run()
+    else:
+        run_sharded(config.LOCAL_IP, int(config.WS_LISTENER_PORT), workers, create_listener)
@@ -0,0 +1,223 @@
+import asyncio
+import functools
+import json
+import logging
+import socket
+from http import HTTPStatus
+from typing import Any, Callable, Dict, Optional
+from urllib.parse import parse_qs, urlparse
+
+import websockets
+from websockets.server import WebSocketServerProtocol, serve
+
+from gamecomm.server import ConnectionClosedError, ConnectionClosedOK, GameConnection
+
+from .listener import GameListener
+from .messages import message_data
+from .outbound import OutboundQueue
+from .shard import receive_socket
+
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncWsGameConnection(GameConnection):
+    """ A GameConnection over an asyncio websocket.
+
+        Receiving is a coroutine, awaited by the connection's controller on the
+        event loop. Sending may happen on any thread (usually a game's executor),
+        so the connection's outbound queue is drained by a writer task on the
+        event loop, which is woken whenever a message is queued.
+    """
+
+    def __init__(self, websocket: WebSocketServerProtocol, claims: Optional[Dict],
+                 loop: asyncio.AbstractEventLoop):
+        super().__init__(claims)
+        self._websocket = websocket
+        self._peer_address = websocket.remote_address
+        self.path = websocket.path
+        self._loop = loop
+        self._closed = False
+
+    def send(self, message: Any) -> None:
+        self.send_text(json.dumps(message))
+
+    def send_text(self, text: str) -> None:
+        self._send(text)
+
+    def send_binary(self, data: bytes) -> None:
+        self._send(data)
+
+    def _send(self, data) -> None:
+        if self._closed:
+            raise ConnectionClosedOK()
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("send %s: %s", self, data)
+        asyncio.run_coroutine_threadsafe(self._websocket.send(data), self._loop)
+
+    def start_writer(self, queue: OutboundQueue):
+        ready = asyncio.Event()
+        queue.set_notify(lambda: self._loop.call_soon_threadsafe(ready.set))
+        asyncio.run_coroutine_threadsafe(self._write(queue, ready), self._loop)
+
+    async def _write(self, queue: OutboundQueue, ready: asyncio.Event):
+        try:
+            while not queue.closed:
+                await ready.wait()
+                ready.clear()
+                for message in queue.take():
+                    await self._websocket.send(message_data(message, queue.binary))
+        except websockets.ConnectionClosed:
+            queue.close()
+        if queue.evicted:
+            await self._websocket.close()
+
+    async def recv_async(self) -> Any:
+        try:
+            message_text = await self._websocket.recv()
+        except websockets.ConnectionClosedOK:
+            raise ConnectionClosedOK()
+        except websockets.ConnectionClosedError:
+            raise ConnectionClosedError()
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("recv %s: %s", self, message_text)
+        return json.loads(message_text)
+
+    def recv(self, timeout: int = None) -> Any:
+        # for callers on other threads; controllers await recv_async instead
+        future = asyncio.run_coroutine_threadsafe(self.recv_async(), self._loop)
+        try:
+            return future.result(timeout)
+        except TimeoutError:
+            future.cancel()
+            raise
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            if not self._loop.is_closed():
+                asyncio.run_coroutine_threadsafe(self._websocket.close(), self._loop)
+
+    def __str__(self):
+        return f"ws {self._peer_address}"
+
+
+class _GameProtocol(WebSocketServerProtocol):
+    """ Authenticates the opening handshake the same way WsGameListener does,
+        keeping the resulting claims for the connection """
+
+    def __init__(self, *args, on_authenticate: Optional[Callable[[str, str], Dict]] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.on_authenticate = on_authenticate
+        self.claims = None
+
+    @staticmethod
+    def _reject(status: HTTPStatus, reason: str):
+        logger.error("authentication failed: %s", reason)
+        return status, [], b""
+
+    async def process_request(self, path, request_headers):
+        url_parts = urlparse(path)
+        gid = url_parts.path.split("/")[-1]
+        if not gid:
+            return self._reject(HTTPStatus.BAD_REQUEST, "no gid")
+
+        if not self.on_authenticate:
+            # without authentication there are no claims to take the game
+            # from, so take it from the path; this keeps games apart
+            self.claims = {"aud": gid, "sub": None, "ply": None}
+            return None
+
+        token = None
+        auth = request_headers.get("Authorization")
+        if auth:
+            if not auth.startswith("Bearer "):
+                return self._reject(HTTPStatus.UNAUTHORIZED, "invalid authorization header value")
+            token = auth[len("Bearer "):].lstrip(" ")
+
+        if not token and url_parts.query:
+            query = parse_qs(url_parts.query)
+            if "token" in query:
+                token = query["token"][0]
+
+        if not token:
+            return self._reject(HTTPStatus.UNAUTHORIZED, "token not present")
+
+        self.claims = self.on_authenticate(gid, token)
+        if not self.claims:
+            return self._reject(HTTPStatus.UNAUTHORIZED, "token not valid")
+        return None
+
+
+def _raise_open_file_limit():
+    # every connection is a file descriptor, and the default soft limit
+    # (often 1024) is far below the number of idle connections we can hold
+    try:
+        import resource
+    except ImportError:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+        logger.info("raised open file limit from %s to %s", soft, hard)
+
+
+class AsyncGameListener(GameListener):
+    """ A GameListener that serves every connection from a single asyncio event
+        loop. Each controller is a coroutine awaiting its next request, so an
+        idle connection costs a little memory rather than a thread that wakes
+        up to poll. Requests are still handled on each game's executor thread,
+        by the same GameServer and GamePublisher as the threaded listener.
+    """
+
+    async def _handle_websocket(self, websocket: _GameProtocol):
+        connection = AsyncWsGameConnection(websocket, websocket.claims, asyncio.get_running_loop())
+        try:
+            server = self._find_or_create_server(connection.gid)
+            if server:
+                await server.handle_connection_async(connection)
+        finally:
+            connection.close()
+
+    def _accept_handoff(self, handoff: socket.socket, create_protocol, done: asyncio.Future):
+        loop = asyncio.get_running_loop()
+        try:
+            sock = receive_socket(handoff)
+        except BlockingIOError:
+            return
+        if sock:
+            loop.create_task(loop.connect_accepted_socket(create_protocol, sock))
+        else:
+            loop.remove_reader(handoff)
+            done.set_result(None)
+
+    async def _serve(self, handoff: Optional[socket.socket]):
+        on_authenticate = self.handle_authentication if self.token_validator else None
+        # per-message compression keeps a pair of zlib contexts (a few hundred
+        # KB) for every connection, far more than our small messages save
+        async with serve(self._handle_websocket, self.local_ip if not handoff else "127.0.0.1",
+                         self.local_port if not handoff else 0,
+                         create_protocol=functools.partial(_GameProtocol, on_authenticate=on_authenticate),
+                         compression=None) as ws_server:
+            done = asyncio.get_running_loop().create_future()
+            if handoff:
+                # sockets handed off by the front get the same protocol that
+                # the server would give the connections it accepts
+                create_protocol = functools.partial(_GameProtocol, self._handle_websocket, ws_server,
+                                                    on_authenticate=on_authenticate, secure=False)
+                handoff.setblocking(False)
+                asyncio.get_running_loop().add_reader(handoff, self._accept_handoff, handoff, create_protocol, done)
+            await done
+
+    def run(self, handoff: Optional[socket.socket] = None):
+        if not handoff:
+            logger.info("listening on %s:%s (asyncio)", self.local_ip, self.local_port)
+        logger.info("authentication is %s", "enabled" if self.token_validator else "disabled")
+        _raise_open_file_limit()
+        self.start_reaper()
+        self.start_metrics()
+        try:
+            asyncio.run(self._serve(handoff))
+        except KeyboardInterrupt:
+            pass
+        self.handle_stop()
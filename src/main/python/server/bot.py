@@ -0,0 +1,174 @@
+import itertools
+import logging
+import multiprocessing
+import queue
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from threading import Lock
+from typing import Optional
+
+from model.game import RANKS
+from model.inference import TableKnowledge, choose_ask, heuristic_ask
+
+import server.config as config
+
+
+logger = logging.getLogger(__name__)
+
+_bot_ids = itertools.count(1)
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = Lock()
+
+
+def inference_pool() -> ProcessPoolExecutor:
+    """ Returns the process pool shared by all bots, creating it on first use """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # workers are started from a clean forkserver process rather than
+            # forked from the server, whose threads may be holding locks
+            _pool = ProcessPoolExecutor(max_workers=int(config.BOT_WORKERS) or None,
+                                        mp_context=multiprocessing.get_context("forkserver"))
+        return _pool
+
+
+def discard_inference_pool(pool: ProcessPoolExecutor):
+    """ Forgets a broken pool, so that the next turn creates a fresh one """
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False)
+
+
+class BotConnection:
+    """ Stands in for a player's GameConnection, so that a bot is served by a
+        GameController exactly like a human player.
+
+    Messages the controller sends to the "client" update the bot's knowledge
+    of the table. When it becomes the bot's turn, the choice of ask is
+    submitted to the inference process pool and the resulting request is
+    queued for the controller to receive. If the pool doesn't answer within
+    the move budget (plus a grace period), a quick heuristic choice is used
+    instead, so a bot never holds up the game.
+    """
+
+    GRACE_SECONDS = 0.100
+
+    def __init__(self, gid: str, move_budget: float = None):
+        self.gid = gid
+        self.uid = f"bot-{next(_bot_ids)}"
+        self.player_name = None
+        self.move_budget = move_budget if move_budget is not None else int(config.BOT_MOVE_BUDGET_MS) / 1000
+        self._lock = Lock()
+        self._requests = queue.Queue()
+        self._knowledge: Optional[TableKnowledge] = None
+        self._hand = []
+        self._turn_pending = False
+        self._turn = 0
+        self._deadline = None
+        self._submitted = None
+        self._requests.put({"action": "player_ready"})
+
+    def __repr__(self):
+        return f"BotConnection({self.uid}, {self.player_name})"
+
+    def send(self, message: dict):
+        with self._lock:
+            self._observe(message)
+            submitted, self._submitted = self._submitted, None
+        if submitted:
+            # registered outside the lock: a future that has already finished
+            # runs its callback right away, and the callback takes the lock
+            turn, pool, future = submitted
+            future.add_done_callback(lambda f: self._on_choice(turn, pool, f))
+
+    def recv(self, timeout: float) -> dict:
+        with self._lock:
+            if self._deadline is not None and time.monotonic() > self._deadline:
+                logger.info("%s ran out of time; using heuristic ask", self.player_name)
+                self._queue_ask(None)
+        try:
+            return self._requests.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError()
+
+    def _observe(self, message: dict):
+        action = message.get("action")
+        if action == "update_player_list":
+            if self._knowledge is None:
+                self._knowledge = TableKnowledge(self.player_name, message["playerNames"])
+                self._knowledge.set_hand(self._hand)
+            if self._turn_pending:
+                self._take_turn()
+        elif action == "initial_hand":
+            self._hand = message["cards"]
+            if self._knowledge:
+                self._knowledge.set_hand(self._hand)
+        elif action in ("book_done", "player_asked", "player_drew") and self._knowledge:
+            if action == "book_done":
+                self._knowledge.on_book(message["playerName"], message["rank"])
+            elif action == "player_asked":
+                self._knowledge.on_ask(message["playerName"], message["targetPlayerName"],
+                                       message["rank"], message["count"])
+            else:
+                self._knowledge.on_draw(message["playerName"])
+        elif "card" in message and self._knowledge:
+            self._knowledge.add_own(message["card"]["rank"])
+        elif action == "your_turn":
+            if self._knowledge is None:
+                self._turn_pending = True
+            else:
+                self._take_turn()
+
+    def _take_turn(self):
+        self._turn_pending = False
+        self._turn += 1
+        view = self._knowledge.view()
+        if not any(view.own):
+            if view.deck_size:
+                self._requests.put({"action": "draw_card"})
+            return
+        pool = None
+        try:
+            pool = inference_pool()
+            future = pool.submit(choose_ask, view, self.move_budget)
+        except Exception as err:
+            logger.error("inference pool failed for %s: %s", self.player_name, err)
+            if pool is not None:
+                discard_inference_pool(pool)
+            self._queue_ask(None)
+            return
+        self._deadline = time.monotonic() + self.move_budget + self.GRACE_SECONDS
+        self._submitted = (self._turn, pool, future)
+
+    def _on_choice(self, turn: int, pool: ProcessPoolExecutor, future: Future):
+        with self._lock:
+            if turn != self._turn or self._deadline is None:
+                return      # the heuristic already answered for this turn
+            try:
+                choice = future.result()
+            except Exception as err:
+                logger.error("inference failed for %s: %s", self.player_name, err)
+                if isinstance(err, BrokenProcessPool):
+                    discard_inference_pool(pool)
+                choice = None
+            self._queue_ask(choice)
+
+    def _queue_ask(self, choice: Optional[tuple]):
+        self._deadline = None
+        view = self._knowledge.view()
+        if choice is None:
+            choice = heuristic_ask(view)
+            if choice is None:
+                return
+        seat, rank_index = choice[0], choice[1]
+        if seat is None:
+            self._requests.put({"action": "draw_card"})
+            return
+        self._requests.put({
+            "action": "ask_for_card",
+            "targetPlayerName": self._knowledge.player_names[seat],
+            "rank": RANKS[rank_index],
+        })
@@ -0,0 +1,138 @@
+from typing import Any, Optional
+
+from model.game import CARDS, RANK_INDEX, RANKS
+
+try:
+    import msgpack
+except ImportError:     # the binary codec is optional
+    msgpack = None
+
+# Messages are sent as JSON text unless a client asks for the binary codec
+# when it connects (see GameController). A binary frame holds one or more
+# MessagePack arrays, one per message, laid out as
+#
+#   [code, seq, field, ...]
+#
+# where `code` identifies the action (and so the fields that follow, in the
+# order given below), `seq` is the message's sequence number (nil if it has
+# none), cards are one byte each (their ids, as in model.game.CARDS) and
+# ranks are their index in model.game.RANKS. Missing trailing fields are
+# left out. A message without a layout of its own is sent as [0, seq, map].
+
+JSON = "json"
+MSGPACK = "msgpack"
+CODECS = (JSON, MSGPACK) if msgpack else (JSON,)
+
+GENERIC = 0
+DRAWN_CARD = 5
+
+# code -> (action, fields); a drawn card is a message without an action
+LAYOUTS = {
+    1: ("your_turn", ()),
+    2: ("wait", ("player_turn",)),
+    3: ("start_game", ("message",)),
+    4: ("initial_hand", ("cards",)),
+    DRAWN_CARD: (None, ("card",)),
+    6: ("ask_response", ("result", "cardsReceived", "message", "newCards")),
+    7: ("player_asked", ("playerName", "targetPlayerName", "rank", "count")),
+    8: ("player_drew", ("playerName",)),
+    9: ("book_done", ("playerName", "rank")),
+    10: ("update_player_list", ("playerNames",)),
+    11: ("session", ("playerName", "resumeToken", "replayed")),
+}
+_CODES = {action: code for code, (action, _) in LAYOUTS.items()}
+_CARD_IDS = {(card.rank, card.suit): card.id for card in CARDS}
+
+
+def pack_cards(cards: list[dict]) -> bytes:
+    return bytes(_CARD_IDS[card["rank"], card["suit"]] for card in cards)
+
+
+_CARD_DICTS = [card.to_dict() for card in CARDS]
+
+
+def _unpack_card(card_id: int) -> dict:
+    return _CARD_DICTS[card_id].copy()
+
+
+def _unpack_cards(data: bytes) -> list[dict]:
+    return [_CARD_DICTS[card_id].copy() for card_id in data]
+
+
+# fields whose values are packed, as (pack, unpack)
+_PACKED = {
+    "cards": (pack_cards, _unpack_cards),
+    "newCards": (pack_cards, _unpack_cards),
+    "card": (lambda card: _CARD_IDS[card["rank"], card["suit"]], _unpack_card),
+    "rank": (RANK_INDEX.__getitem__, RANKS.__getitem__),
+}
+
+# each layout worked out once: the names a message may have, and the packed
+# fields as (index, name, pack, unpack)
+_ALLOWED = {code: frozenset(("action", "seq", *fields)) for code, (_, fields) in LAYOUTS.items()}
+_PACKED_FIELDS = {code: tuple((i, name, *_PACKED[name]) for i, name in enumerate(fields) if name in _PACKED)
+                  for code, (_, fields) in LAYOUTS.items()}
+
+
+def to_frame(payload: Any) -> list:
+    """ Lays out a message (as it would be encoded in JSON) as a frame """
+    if not isinstance(payload, dict):
+        return [GENERIC, None, payload]
+    seq = payload.get("seq")
+    code = _CODES.get(payload.get("action")) if "action" in payload else DRAWN_CARD
+    if code is not None and payload.keys() <= _ALLOWED[code]:
+        values = [payload.get(name) for name in LAYOUTS[code][1]]
+        try:
+            for i, _, pack, _ in _PACKED_FIELDS[code]:
+                if values[i] is not None:
+                    values[i] = pack(values[i])
+        except (KeyError, IndexError, TypeError):
+            pass
+        else:
+            while values and values[-1] is None:
+                values.pop()
+            return [code, seq, *values]
+    return [GENERIC, seq, {name: value for name, value in payload.items() if name != "seq"}]
+
+
+def from_frame(frame: list) -> Any:
+    """ Turns a frame back into the message it was laid out from """
+    code, seq, *values = frame
+    message = {} if seq is None else {"seq": seq}
+    if code == GENERIC:
+        if not isinstance(values[0], dict):
+            return values[0]
+        message.update(values[0])
+        return message
+    action, fields = LAYOUTS[code]
+    if action:
+        message["action"] = action
+    for i, _, _, unpack in _PACKED_FIELDS[code]:
+        if i < len(values) and values[i] is not None:
+            values[i] = unpack(values[i])
+    if None in values:
+        message.update((name, value) for name, value in zip(fields, values) if value is not None)
+    else:
+        message.update(zip(fields, values))
+    return message
+
+
+def encode(frame: list) -> bytes:
+    return msgpack.packb(frame, use_bin_type=True)
+
+
+def decode(data: bytes) -> list:
+    """ Returns the messages in a binary frame """
+    # nearly every frame holds a single message, which unpackb reads without
+    # the cost of setting up a streaming Unpacker
+    try:
+        return [from_frame(msgpack.unpackb(data, raw=False))]
+    except msgpack.ExtraData:
+        pass
+    unpacker = msgpack.Unpacker(raw=False)
+    unpacker.feed(data)
+    return [from_frame(frame) for frame in unpacker]
+
+
+def supported(codec: Optional[str]) -> bool:
+    return codec in CODECS
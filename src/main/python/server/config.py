@@ -20,6 +20,80 @@ import os
 LOCAL_IP = os.environ.get("LOCAL_IP", "127.0.0.1")
 WS_LISTENER_PORT = os.environ.get("WS_LISTENER_PORT", "10020")
 
+# Number of worker processes for a sharded server, each serving its share of
+# the games behind a front process that routes connections by game ID; "1"
+# runs a single process without a front, and "0" starts one worker per CPU
+SHARD_WORKERS = os.environ.get("SHARD_WORKERS", "1")
+
+# Serve all connections from one asyncio event loop instead of a thread per
+# connection; set to any non-empty value to enable
+ASYNC_LISTENER = os.environ.get("ASYNC_LISTENER")
+
+# Each connection's outbound messages wait in a queue of at most this many
+# messages; when a slow client lets it fill, the overflow policy applies:
+# "coalesce" (replace superseded messages, else disconnect), "drop", or
+# "disconnect"
+OUTBOUND_QUEUE_LIMIT = os.environ.get("OUTBOUND_QUEUE_LIMIT", "256")
+OUTBOUND_OVERFLOW = os.environ.get("OUTBOUND_OVERFLOW", "coalesce")
+
+# Logging is written to stdout by a thread of its own. LOG_SAMPLING keeps a
+# fraction of the messages that start with each of the given prefixes, as in
+# "received request: %s=0.01;publishing event: %s=0.1", and LOG_RATE_LIMIT
+# caps the number of messages of any one kind per second ("0" for no limit)
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
+LOG_SAMPLING = os.environ.get("LOG_SAMPLING", "")
+LOG_RATE_LIMIT = os.environ.get("LOG_RATE_LIMIT", "0")
+
+# Port for serving metrics (in the Prometheus text format) at /metrics on
+# LOCAL_IP; "0" turns it off. Workers of a sharded server use the following ports.
+# The default stays clear of the websocket port and of the API's port (10021), so
+# the API and the game server can both run with their defaults on one host
+METRICS_PORT = os.environ.get("METRICS_PORT", "10022")
+
 ENABLE_AUTH = os.environ.get("ENABLE_AUTH")
 TOKEN_ISSUER_URI = os.environ.get("TOKEN_ISSUER_URI", "urn:ece4564:token-issuer")
 PUBLIC_KEY_FILE = os.environ.get("PUBLIC_KEY_FILE", "public_key.pem")
+
+# Spectators (clients connecting with `?spectate`) are sent a game's latest
+# public state at most once every SPECTATOR_INTERVAL seconds, and only once it
+# is SPECTATOR_DELAY seconds old
+SPECTATOR_INTERVAL = os.environ.get("SPECTATOR_INTERVAL", "0.5")
+SPECTATOR_DELAY = os.environ.get("SPECTATOR_DELAY", "0")
+
+# Number of verified tokens remembered (until they expire), so that clients
+# reconnecting with the same token skip signature verification; "0" turns it off
+TOKEN_CACHE_SIZE = os.environ.get("TOKEN_CACHE_SIZE", "10000")
+
+# Directory for game move logs and snapshots, used to recover live games
+# after a restart; games are kept only in memory if this isn't set
+DATA_DIR = os.environ.get("DATA_DIR")
+SNAPSHOT_INTERVAL = os.environ.get("SNAPSHOT_INTERVAL", "50")
+
+# Games are discarded once they are over (when their players leave, or after
+# ENDED_GAME_TTL seconds) or have had nobody connected and been idle for
+# GAME_IDLE_TTL seconds, checked every REAP_INTERVAL seconds. At most
+# MAX_GAMES games are kept; when a new game would exceed that, the least
+# recently active game without players is evicted
+GAME_IDLE_TTL = os.environ.get("GAME_IDLE_TTL", "900")
+ENDED_GAME_TTL = os.environ.get("ENDED_GAME_TTL", "60")
+MAX_GAMES = os.environ.get("MAX_GAMES", "10000")
+REAP_INTERVAL = os.environ.get("REAP_INTERVAL", "30")
+
+# Number of a game's latest messages kept for clients that reconnect; a client
+# that missed more than these gets a snapshot of the game instead
+RESUME_BUFFER_SIZE = os.environ.get("RESUME_BUFFER_SIZE", "512")
+
+# Bot players: size of the shared inference process pool ("0" uses one worker
+# per CPU) and the time each bot may spend choosing a move
+BOT_WORKERS = os.environ.get("BOT_WORKERS", "0")
+BOT_MOVE_BUDGET_MS = os.environ.get("BOT_MOVE_BUDGET_MS", "200")
+
+# The scheduler for turn clocks and timeouts moves on every TIMER_TICK_MS
+# milliseconds. A player who hasn't moved within TURN_TIMEOUT seconds loses
+# the turn; a player who hasn't said it's ready within READY_TIMEOUT seconds
+# of joining, or hasn't sent anything for IDLE_TIMEOUT seconds, is
+# disconnected ("0" turns each of them off)
+TIMER_TICK_MS = os.environ.get("TIMER_TICK_MS", "100")
+TURN_TIMEOUT = os.environ.get("TURN_TIMEOUT", "60")
+READY_TIMEOUT = os.environ.get("READY_TIMEOUT", "300")
+IDLE_TIMEOUT = os.environ.get("IDLE_TIMEOUT", "1800")
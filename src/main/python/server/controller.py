@@ -1,10 +1,17 @@
 import logging
+import time
 from threading import Event
-from typing import Callable
+from typing import Callable, Optional
 
 from gamecomm.server import GameConnection, ConnectionClosedOK, ConnectionClosedError
-from model.game import GoFishGame,Player
+from model.game import GoFishGame,Player, INVALID_TARGET_MESSAGE
+from . import codec, messages, metrics
+from .executor import GameExecutor
+from .messages import EncodedMessage, negotiate_codec, send_message
+from .outbound import OutboundQueue
 from .publisher import GamePublisher
+from .scheduler import Timer
+from .session import MessageLog
 
 
 logger = logging.getLogger(__name__)
@@ -15,22 +22,55 @@ class GameController:
     RECV_TIMEOUT_SECONDS = 0.250
 
     def __init__(self, connection: GameConnection, publisher: GamePublisher,
-                 Gofishgame:GoFishGame, on_close: Callable[[GameConnection], None]):
+                 Gofishgame:GoFishGame, executor: GameExecutor, on_close: Callable[[GameConnection], None],
+                 player_name: str):
         self.connection = connection
         self.publisher = publisher
+        self.executor = executor
         self.on_close = on_close
         self._shutdown = Event()
         self.go_fish_game = Gofishgame
         self.is_ready = False
-        self.player_name = f"Player {len(publisher.subscribers) + 1}"
+        self.player_name = player_name
         self.initial_hand_sent = False
+        self.outbound: Optional[OutboundQueue] = None
+        self.message_log: Optional[MessageLog] = None
+        self.codec = negotiate_codec(connection)
+        # timeouts kept by the game server (see scheduler.py)
+        self.ready_timer: Optional[Timer] = None
+        self.idle_timer: Optional[Timer] = None
+        self.last_request = time.monotonic()
+
+    @property
+    def binary(self) -> bool:
+        return self.codec != codec.JSON
+
+    def cancel_timers(self):
+        for timer in (self.ready_timer, self.idle_timer):
+            if timer:
+                timer.cancel()
+        self.ready_timer = self.idle_timer = None
+
+    def send(self, message):
+        # game messages are numbered, so that a client that reconnects can
+        # say which ones it has seen
+        if self.message_log:
+            message = self.message_log.record(message, self.player_name)
+        self.send_unsequenced(message)
+
+    def send_unsequenced(self, message):
+        # messages go through the connection's outbound queue once it is
+        # subscribed, so they stay in order with the game's broadcasts
+        if self.outbound:
+            self.outbound.put(message)
+        else:
+            send_message(self.connection, message, self.binary)
 
     def send_initial_hand(self):
         if self.go_fish_game.game_started  and not self.initial_hand_sent:
-            player = next((p for p in self.go_fish_game.players if p.name == self.player_name), None)
+            player = self.go_fish_game.find_player(self.player_name)
             if player:
-                hand = [card.to_dict() for card in player.hand]
-                self.connection.send({"action": "initial_hand", "cards": hand})
+                self.send(messages.initial_hand(player.hand))
                 self.initial_hand_sent = True 
 
 
@@ -40,74 +80,137 @@ class GameController:
 
     def draw_card(self, player_name):
         try:
-            player = next((p for p in self.go_fish_game.players if p.name == player_name), None)
+            player = self.go_fish_game.find_player(player_name)
             if player:
-                card = player.draw(self.go_fish_game.deck)
+                card = self.go_fish_game.draw_card(player_name)
                 if card:
-                        logger.info(f"{player_name} drew a card: {card}")
-                        return {"card": card.to_dict()}  # Convert card to dict
+                        logger.info("%s drew a card: %s", player_name, card)
+                        return messages.drawn_card(card)
                 else:
                         return {"error": "No more cards in the deck"}
             else:
                 return None
         except Exception as e:
-            logger.error(f"Error drawing card: {e}")
+            logger.error("Error drawing card: %s", e)
             return {"error": str(e)}
 
 
     def notify_turn(self, player_name):
         if self.player_name == player_name:
-            self.connection.send({"action": "your_turn"})
+            self.send(messages.YOUR_TURN)
         else:
-            self.connection.send({"action": "wait", "player_turn": player_name})     
+            self.send(messages.wait_turn(player_name))
+
 
 
+    def handle_request(self, request, received: float = None):
+        # Runs on the game's executor thread, so it has the game to itself.
+        # The messages a request causes are held and then sent together, as
+        # one frame to each client that asked for batches
+        self.publisher.hold_messages()
+        try:
+            self._handle_request(request)
+        finally:
+            self.publisher.release_messages()
+            self.publisher.game_server.request_handled(self)
+            if received is not None:
+                metrics.observe_request(request.get("action") if isinstance(request, dict) else None,
+                                        time.perf_counter() - received)
+
+    def _handle_request(self, request):
+        try:
+            if "action" in request:
+                    if request["action"] == "player_ready":
+                        self.set_player_ready()
+                        self.publisher.check_all_players_ready()
+                    elif request["action"] == "options":
+                        if "batch" in request and self.outbound:
+                            self.outbound.set_batching(bool(request["batch"]))
+                        self.send_unsequenced({"action": "options",
+                                               "batch": bool(self.outbound and self.outbound.batching),
+                                               "codec": self.codec})
+                    elif request["action"] == "resume":
+                        self.publisher.game_server.resume(self, request.get("resumeToken"), request.get("lastSeq"))
+                    elif request["action"] == "add_bot":
+                        bot_name = self.publisher.game_server.add_bot()
+                        if not bot_name:
+                            self.send({"status": "error", "error": {"message": "game has already started"}})
+                    elif request["action"] == "draw_card":
+                         if self.go_fish_game.is_current_player_turn(self.player_name):
+                            response = self.draw_card(self.player_name)
+                            logger.info("Sending response: %s", response)
+                            self.send(response)
+                            if isinstance(response, EncodedMessage):
+                                next_player = self.go_fish_game.next_player()
+                                self.publisher.notify_all_players_of_turn(next_player)
+                    elif request["action"] == "ask_for_card":
+                        # Extract the target player name and rank from the request
+                        target_player_name = request.get("targetPlayerName")
+                        rank = request.get("rank")
+                        # Ensure both target player name and rank are provided
+                        if target_player_name and rank:
+                            cards = self.go_fish_game.request_cards(self.player_name, target_player_name, rank)
+                            if cards is None:
+                                response = INVALID_TARGET_MESSAGE
+                            elif cards:
+                                response = messages.cards_received(self.player_name, target_player_name, rank, cards)
+                            else:
+                                response = messages.GO_FISH
+                            logger.info("response: %s", response)
+                            self.send(response)
+                            if cards is not None:
+                                  next_player = self.go_fish_game.next_player()
+                                  self.publisher.notify_all_players_of_turn(next_player)
+                        else:
+                            self.send({"status": "error", "error": {"message": "Target player name or rank missing"}})
+            else:
+                self.send({"status": "error", "error": {"message": "must specify command"}})
+        except (ConnectionClosedOK, ConnectionClosedError) as err:
+            logger.info("unable to respond to %s: %s", self.connection, err)
 
     def run(self):
-        logger.info(f"connected to {self.connection} for user {self.connection.uid} in game {self.connection.gid}")
+        logger.info("connected to %s for user %s in game %s",
+                    self.connection, self.connection.uid, self.connection.gid)
         try:
             while not self._shutdown.is_set():
                 try:
                     request = self.connection.recv(self.RECV_TIMEOUT_SECONDS)
-                    logger.info(f"received request: {request}")
-                    if "action" in request:
-                            if request["action"] == "player_ready":
-                                self.set_player_ready()
-                                self.publisher.check_all_players_ready()
-                            elif request["action"] == "draw_card":
-                                 if self.go_fish_game.is_current_player_turn(self.player_name):
-                                    response = self.draw_card(self.player_name)
-                                    logger.info(f"Sending response: {response}")
-                                    self.connection.send(response)
-                                    if response and "card" in response:
-                                        next_player = self.go_fish_game.next_player()
-                                        self.publisher.notify_all_players_of_turn(next_player)
-                            elif request["action"] == "ask_for_card":
-                                # Extract the target player name and rank from the request
-                                target_player_name = request.get("targetPlayerName")
-                                rank = request.get("rank")
-                                # Ensure both target player name and rank are provided
-                                if target_player_name and rank:
-                                    response = self.go_fish_game.ask_for_card(self.player_name, target_player_name, rank)
-                                    logger.info(f"response: {response}")
-                                    self.connection.send(response)
-                                    if response["result"]:
-                                          next_player = self.go_fish_game.next_player()
-                                          self.publisher.notify_all_players_of_turn(next_player)
-                                else:
-                                    self.connection.send({"status": "error", "error": {"message": "Target player name or rank missing"}})
-                    else:
-                        self.connection.send({"status": "error", "error": {"message": "must specify command"}})
+                    logger.info("received request: %s", request)
+                    self.executor.submit(self.handle_request, request, time.perf_counter())
                 except TimeoutError:
                     pass
         except ConnectionClosedOK:
             pass
         except ConnectionClosedError as err:
-            logger.error(f"error communicating with client: {err}")
+            logger.error("error communicating with client: %s", err)
+
+        self.on_close(self.connection)
+        logger.info("disconnected from %s for user %s in game %s",
+                    self.connection, self.connection.uid, self.connection.gid)
+
+    async def run_async(self):
+        """ Like run, for a connection on an asyncio event loop: awaits each
+            request rather than polling for it """
+        logger.info("connected to %s for user %s in game %s",
+                    self.connection, self.connection.uid, self.connection.gid)
+        try:
+            while not self._shutdown.is_set():
+                request = await self.connection.recv_async()
+                logger.info("received request: %s", request)
+                self.executor.submit(self.handle_request, request, time.perf_counter())
+        except ConnectionClosedOK:
+            pass
+        except ConnectionClosedError as err:
+            logger.error("error communicating with client: %s", err)
 
         self.on_close(self.connection)
-        logger.info(f"disconnected from {self.connection} for user {self.connection.uid} in game {self.connection.gid}")
+        logger.info("disconnected from %s for user %s in game %s",
+                    self.connection, self.connection.uid, self.connection.gid)
 
     def stop(self):
         logger.info("handling stop")
         self._shutdown.set()
+        # a coroutine awaiting its next request only wakes up when the
+        # connection closes
+        if hasattr(self.connection, "recv_async"):
+            self.connection.close()
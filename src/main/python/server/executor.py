@@ -0,0 +1,63 @@
+import logging
+import queue
+import time
+from threading import Thread
+from typing import Callable
+
+
+logger = logging.getLogger(__name__)
+
+
+class GameExecutor:
+    """ Applies the commands for one game, one at a time and in the order they
+        were submitted, on a single thread.
+
+    Because every change to a game (and every message that reports one) is
+    made on the game's executor thread, controllers never contend for the
+    game's state; they only submit commands. The depth of the command queue
+    shows how far the executor is behind its connections.
+    """
+
+    _STOP = object()
+
+    def __init__(self, gid: str):
+        self.gid = gid
+        self._queue = queue.SimpleQueue()
+        self.commands_executed = 0
+        self.max_queue_depth = 0
+        self.last_active = time.monotonic()
+        self._thread = Thread(target=self._run, name=f"game-{gid}", daemon=True)
+        self._thread.start()
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def submit(self, command: Callable, *args):
+        self._queue.put((command, args))
+        depth = self._queue.qsize()
+        if depth > self.max_queue_depth:
+            self.max_queue_depth = depth
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self.queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "commands_executed": self.commands_executed,
+        }
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is self._STOP:
+                break
+            command, args = item
+            try:
+                command(*args)
+            except Exception as err:
+                logger.exception("error executing command for game %s: %s", self.gid, err)
+            self.commands_executed += 1
+            self.last_active = time.monotonic()
+
+    def stop(self):
+        self._queue.put(self._STOP)
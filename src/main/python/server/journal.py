@@ -0,0 +1,234 @@
+import logging
+import os
+import struct
+from typing import Callable, Optional
+from urllib.parse import quote, unquote
+
+from model.game import (GoFishGame, MOVE_ASK, MOVE_DEAL, MOVE_DRAW, MOVE_JOIN, MOVE_LEAVE, MOVE_TURN)
+
+
+logger = logging.getLogger(__name__)
+
+# Each game has an append-only move log, `<gid>.log`, and at most one
+# snapshot, `<gid>.snap`. The log starts with a header holding the seed of
+# the game's deck, followed by one compact record per move (see
+# `encode_move`). A snapshot holds the log offset it was taken at, so a game
+# is recovered by restoring the snapshot and replaying the rest of the log.
+#
+# The seats given out in the game (a player name, user ID and resume token;
+# see session.py) are appended to `<gid>.seats` as they are given out, so
+# that the players of a recovered game can take their seats back.
+
+LOG_SUFFIX = ".log"
+SNAPSHOT_SUFFIX = ".snap"
+SEATS_SUFFIX = ".seats"
+
+_LOG_HEADER = struct.Struct("<4sQ")         # magic, seed
+_LOG_MAGIC = b"GFL1"
+_SNAPSHOT_HEADER = struct.Struct("<4sQ")    # magic, log offset
+_SNAPSHOT_MAGIC = b"GFJS"
+_NAME_LENGTH = struct.Struct("<H")
+
+
+def _encode_name(name: str) -> bytes:
+    data = name.encode()
+    return _NAME_LENGTH.pack(len(data)) + data
+
+
+def _decode_name(data: bytes, offset: int) -> tuple[str, int]:
+    (length,) = _NAME_LENGTH.unpack_from(data, offset)
+    offset += _NAME_LENGTH.size
+    if offset + length > len(data):
+        raise struct.error("truncated name")
+    return data[offset:offset + length].decode(), offset + length
+
+
+def encode_move(move: tuple) -> bytes:
+    kind = move[0]
+    if kind == MOVE_ASK:
+        return bytes((kind, move[1], move[2], move[3]))
+    if kind == MOVE_DRAW:
+        return bytes((kind, move[1]))
+    if kind == MOVE_TURN:
+        return bytes((kind,))
+    if kind == MOVE_DEAL:
+        return bytes((kind, len(move[1]))) + b"".join(_encode_name(name) for name in move[1])
+    if kind in (MOVE_JOIN, MOVE_LEAVE):
+        return bytes((kind,)) + _encode_name(move[1])
+    raise ValueError(f"unknown move {move!r}")
+
+
+def decode_moves(data: bytes, offset: int = 0) -> tuple[list, int]:
+    """ Decodes the move records in `data` starting at `offset`.
+
+    Returns:
+        tuple[list, int]: the moves, and the offset just past the last
+                          complete record (a crash can leave a partial
+                          record at the end of a log)
+    """
+    moves = []
+    while offset < len(data):
+        kind = data[offset]
+        try:
+            if kind == MOVE_ASK:
+                if offset + 4 > len(data):
+                    break
+                move, end = (kind, data[offset + 1], data[offset + 2], data[offset + 3]), offset + 4
+            elif kind == MOVE_DRAW:
+                if offset + 2 > len(data):
+                    break
+                move, end = (kind, data[offset + 1]), offset + 2
+            elif kind == MOVE_TURN:
+                move, end = (kind,), offset + 1
+            elif kind == MOVE_DEAL:
+                if offset + 2 > len(data):
+                    break
+                names, end = [], offset + 2
+                for _ in range(data[offset + 1]):
+                    name, end = _decode_name(data, end)
+                    names.append(name)
+                move = (kind, tuple(names))
+            elif kind in (MOVE_JOIN, MOVE_LEAVE):
+                name, end = _decode_name(data, offset + 1)
+                move = (kind, name)
+            else:
+                raise ValueError(f"unknown move type {kind} at offset {offset}")
+        except struct.error:
+            break
+        moves.append(move)
+        offset = end
+    return moves, offset
+
+
+class GameJournal:
+    """ Records the moves of one game and periodically snapshots it """
+
+    def __init__(self, directory: str, gid: str, snapshot_interval: int):
+        self.gid = gid
+        self.snapshot_interval = snapshot_interval
+        base = os.path.join(directory, quote(gid, safe=""))
+        self.log_path = base + LOG_SUFFIX
+        self.snapshot_path = base + SNAPSHOT_SUFFIX
+        self.seats_path = base + SEATS_SUFFIX
+        self._file = None
+        self._seats_file = None
+        self._game: Optional[GoFishGame] = None
+        self._moves_since_snapshot = 0
+
+    def attach(self, game: GoFishGame):
+        """ Starts recording the moves of `game` (a new or a recovered game) """
+        self._file = open(self.log_path, "ab")
+        if self._file.tell() == 0:
+            self._file.write(_LOG_HEADER.pack(_LOG_MAGIC, game.seed))
+            self._file.flush()
+        self._game = game
+        game.on_move = self.record
+
+    def record(self, move: tuple):
+        # called by the game while it holds its lock, so the game is in a
+        # consistent state for a snapshot
+        self._file.write(encode_move(move))
+        self._file.flush()
+        self._moves_since_snapshot += 1
+        if self._moves_since_snapshot >= self.snapshot_interval:
+            self.snapshot()
+
+    def snapshot(self):
+        data = _SNAPSHOT_HEADER.pack(_SNAPSHOT_MAGIC, self._file.tell()) + self._game.snapshot()
+        temp_path = self.snapshot_path + ".tmp"
+        with open(temp_path, "wb") as file:
+            file.write(data)
+        os.replace(temp_path, self.snapshot_path)
+        self._moves_since_snapshot = 0
+
+    def record_seat(self, player_name: str, uid: Optional[str], token: str):
+        if self._seats_file is None:
+            self._seats_file = open(self.seats_path, "ab")
+        self._seats_file.write(_encode_name(token) + _encode_name(player_name) + _encode_name(uid or ""))
+        self._seats_file.flush()
+
+    def recover_seats(self) -> list[tuple[str, Optional[str], str]]:
+        """ Reads back the seats recorded for the game, as (player name, user
+            ID, resume token), oldest first """
+        if not os.path.exists(self.seats_path):
+            return []
+        with open(self.seats_path, "rb") as file:
+            data = file.read()
+        seats, offset = [], 0
+        while offset < len(data):
+            try:
+                token, end = _decode_name(data, offset)
+                player_name, end = _decode_name(data, end)
+                uid, end = _decode_name(data, end)
+            except struct.error:
+                break
+            seats.append((player_name, uid or None, token))
+            offset = end
+        if offset < len(data):
+            logger.warning("discarding %s bytes of partial record at end of %s", len(data) - offset, self.seats_path)
+            with open(self.seats_path, "r+b") as file:
+                file.truncate(offset)
+        return seats
+
+    def close(self):
+        if self._game:
+            self._game.on_move = None
+        for file in (self._file, self._seats_file):
+            if file:
+                file.close()
+        self._file = self._seats_file = None
+
+    def delete(self):
+        """ Closes the journal and removes its files, e.g. once the game is over """
+        self.close()
+        for path in (self.log_path, self.snapshot_path, self.seats_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def recover_game(directory: str, gid: str) -> GoFishGame:
+    """ Rebuilds a game from its newest snapshot (if any) and the tail of its log """
+    journal = GameJournal(directory, gid, 0)
+    with open(journal.log_path, "rb") as file:
+        data = file.read()
+    magic, seed = _LOG_HEADER.unpack_from(data)
+    if magic != _LOG_MAGIC:
+        raise ValueError(f"{journal.log_path} is not a game log")
+
+    offset = _LOG_HEADER.size
+    game = None
+    if os.path.exists(journal.snapshot_path):
+        with open(journal.snapshot_path, "rb") as file:
+            snapshot = file.read()
+        magic, snapshot_offset = _SNAPSHOT_HEADER.unpack_from(snapshot)
+        if magic == _SNAPSHOT_MAGIC and snapshot_offset <= len(data):
+            game = GoFishGame.from_snapshot(snapshot[_SNAPSHOT_HEADER.size:])
+            offset = snapshot_offset
+    if game is None:
+        game = GoFishGame([], seed)
+
+    moves, end = decode_moves(data, offset)
+    for move in moves:
+        game.apply_move(move)
+    if end < len(data):
+        logger.warning("discarding %s bytes of partial record at end of %s", len(data) - end, journal.log_path)
+        with open(journal.log_path, "r+b") as file:
+            file.truncate(end)
+    return game
+
+
+def recover_games(directory: str, include: Optional[Callable[[str], bool]] = None) -> dict[str, GoFishGame]:
+    """ Rebuilds every game that has a log in `directory`, or just the games
+        whose IDs satisfy `include` """
+    games = {}
+    for filename in os.listdir(directory):
+        if not filename.endswith(LOG_SUFFIX):
+            continue
+        gid = unquote(filename[:-len(LOG_SUFFIX)])
+        if include and not include(gid):
+            continue
+        try:
+            games[gid] = recover_game(directory, gid)
+        except (OSError, ValueError, struct.error) as err:
+            logger.error("unable to recover game %s: %s", gid, err)
+    return games
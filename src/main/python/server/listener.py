@@ -1,30 +1,251 @@
+import gc
 import logging
-from threading import Lock
+import os
+import socket
+import sys
+import time
+import types
+from threading import Event, Thread
+from typing import Callable, Optional
+from urllib.parse import urlparse
 
 from gameauth import TokenValidator, InvalidTokenError
 from gamecomm.server import WsGameListener
 
-from .server import GameServer
+from model.game import Card
+from . import metrics, outbound
+from .journal import GameJournal, recover_games
+from .scheduler import scheduler
+from .server import GameServer, timeouts
+from .messages import request_path
+from .shard import receive_socket
+from .token_cache import TokenCache
 
 
 logger = logging.getLogger(__name__)
 
+# shared or global objects that a game refers to but doesn't own
+_NOT_OWNED = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType, types.MethodType, Card)
+
+
+def _deep_size(root) -> int:
+    """ Estimates the memory held by an object and everything it (alone) refers to """
+    seen = set()
+    pending = [root]
+    size = 0
+    while pending:
+        obj = pending.pop()
+        if id(obj) in seen or isinstance(obj, _NOT_OWNED):
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        pending.extend(gc.get_referents(obj))
+    return size
+
+
+class HandoffAdapter:
+    """ Serves sockets handed off by the front of a sharded server on a
+        gamecomm `WsGameListener`, just as it serves those it accepts.
+
+    gamecomm has no public way to do this, so this class alone relies on two
+    internals: the listener keeps its websockets server in `_server` once its
+    service thread is running, and that (sync) server serves an accepted
+    socket with `handler(sock, peer_address)`. If either is missing, or the
+    server doesn't start, this raises RuntimeError rather than quietly
+    serving nothing.
+    """
+
+    STARTUP_TIMEOUT_SECONDS = 5
+
+    def __init__(self, listener: WsGameListener):
+        if not hasattr(listener, "_server"):
+            raise RuntimeError("this version of gamecomm's WsGameListener can't serve handed-off sockets")
+        self.listener = listener
+        self._handler = None
+
+    def start(self):
+        """ Starts the listener and waits for its websockets server """
+        self.listener.start()
+        deadline = time.monotonic() + self.STARTUP_TIMEOUT_SECONDS
+        while (ws_server := self.listener._server) is None:
+            if time.monotonic() > deadline:
+                raise RuntimeError("websocket server didn't start")
+            time.sleep(0.010)
+        self._handler = getattr(ws_server, "handler", None)
+        if not callable(self._handler):
+            raise RuntimeError("this version of websockets can't serve handed-off sockets")
+
+    def serve(self, sock: socket.socket):
+        try:
+            peer_address = sock.getpeername()
+        except OSError:
+            sock.close()
+            return
+        Thread(target=self._handler, args=(sock, peer_address)).start()
+
 
 class GameListener:
 
-    def __init__(self, local_ip, local_port, token_validator: TokenValidator):
+    def __init__(self, local_ip, local_port, token_validator: TokenValidator | TokenCache,
+                 data_dir: Optional[str] = None, snapshot_interval: int = 50,
+                 idle_ttl: float = 900, ended_ttl: float = 60, max_games: int = 10000,
+                 reap_interval: float = 30, owns_gid: Optional[Callable[[str], bool]] = None,
+                 metrics_port: int = 0):
         self.local_ip = local_ip
         self.local_port = local_port
         self.token_validator = token_validator
+        self.data_dir = data_dir
+        self.snapshot_interval = snapshot_interval
+        self.idle_ttl = idle_ttl
+        self.ended_ttl = ended_ttl
+        self.max_games = max_games
+        self.reap_interval = reap_interval
+        # in a sharded server, tells which games belong to this worker
+        self.owns_gid = owns_gid
+        self.metrics_port = metrics_port
         self._servers: dict[str, GameServer] = {}
-        self._lock = Lock()
+        self._lock = metrics.TimedLock(metrics.lock_wait_histogram("listener"))
+        self._stopped = Event()
+        self.games_reaped = {"ended": 0, "idle": 0, "evicted": 0}
+        self.bytes_reclaimed = 0
+        self._register_metrics()
+        if data_dir:
+            os.makedirs(data_dir, exist_ok=True)
+            self._recover_servers()
+
+    def _journal(self, gid: str) -> Optional[GameJournal]:
+        return GameJournal(self.data_dir, gid, self.snapshot_interval) if self.data_dir else None
 
-    def _find_or_create_server(self, gid: str):
+    def _recover_servers(self):
+        start = time.perf_counter()
+        for gid, game in recover_games(self.data_dir, self.owns_gid).items():
+            self._servers[gid] = GameServer(gid, game, self._journal(gid))
+        if self._servers:
+            logger.info("recovered %s games from %s in %.3f seconds",
+                        len(self._servers), self.data_dir, time.perf_counter() - start)
+
+    def _find_or_create_server(self, gid: str) -> Optional[GameServer]:
+        evicted = None
         with self._lock:
-            if gid not in self._servers:
-                self._servers[gid] = GameServer(gid)
-                logger.info(f"created new server for gid {gid}")
-            return self._servers[gid]
+            server = self._servers.get(gid)
+            if server:
+                return server
+            if len(self._servers) >= self.max_games:
+                evicted = self._least_recently_used_abandoned()
+                if not evicted:
+                    logger.warning("refusing new game %s: %s games are in play", gid, len(self._servers))
+                    return None
+                del self._servers[evicted.gid]
+            server = GameServer(gid, journal=self._journal(gid))
+            self._servers[gid] = server
+            logger.info("created new server for gid %s", gid)
+        if evicted:
+            self._discard(evicted, "evicted")
+        return server
+
+    def _least_recently_used_abandoned(self) -> Optional[GameServer]:
+        # an abandoned game is one without any players connected
+        abandoned = [server for server in self._servers.values() if not server.player_count()]
+        return min(abandoned, key=lambda server: server.last_activity, default=None)
+
+    def _discard(self, server: GameServer, reason: str) -> int:
+        size = _deep_size(server.go_fish_game)
+        server.stop()
+        if server.journal:
+            server.journal.delete()
+        self.games_reaped[reason] += 1
+        self.bytes_reclaimed += size
+        logger.info("discarded %s game %s, reclaiming about %s bytes", reason, server.gid, size)
+        return size
+
+    def reap(self):
+        """ Discards the games that are over (once their players have left, or
+            after `ended_ttl` seconds) and the games that nobody is connected
+            to and that have been idle for longer than `idle_ttl` seconds;
+            silent players are dropped by their own idle timeouts instead """
+        now = time.monotonic()
+        expired = []
+        with self._lock:
+            for server in self._servers.values():
+                if server.is_over():
+                    if server.ended_at is None:
+                        server.ended_at = now
+                    if not server.player_count() or now - server.ended_at > self.ended_ttl:
+                        expired.append((server, "ended"))
+                elif now - server.last_activity > self.idle_ttl and not server.player_count() \
+                        and not server.spectators.count():
+                    expired.append((server, "idle"))
+            for server, _ in expired:
+                del self._servers[server.gid]
+        if expired:
+            reclaimed = sum(self._discard(server, reason) for server, reason in expired)
+            logger.info("reaped %s games in %.3f seconds, reclaiming about %s KiB; %s games remain",
+                        len(expired), time.monotonic() - now, reclaimed // 1024, len(self._servers))
+
+    def _run_reaper(self):
+        while not self._stopped.wait(self.reap_interval):
+            try:
+                self.reap()
+            except Exception as err:
+                logger.exception("error reaping games: %s", err)
+
+    def start_reaper(self):
+        Thread(target=self._run_reaper, name="reaper", daemon=True).start()
+
+    def _server_list(self) -> list[GameServer]:
+        with self._lock:
+            return list(self._servers.values())
+
+    def _register_metrics(self):
+        def outbound_stat(name):
+            return lambda: outbound.metrics.stats()[name]
+
+        registry = metrics.registry
+        registry.add(metrics.Gauge("gofish_live_games", "Games held in memory", lambda: len(self._servers)))
+        registry.add(metrics.Gauge("gofish_connections", "Connected clients, including bots",
+                                   lambda: sum(server.connection_count() for server in self._server_list())))
+        registry.add(metrics.Gauge("gofish_spectators", "Clients watching games",
+                                   lambda: sum(server.spectators.count() for server in self._server_list())))
+        registry.add(metrics.Gauge("gofish_executor_queue_depth", "Requests waiting for the game executors",
+                                   lambda: sum(server.executor.queue_depth for server in self._server_list())))
+        registry.add(metrics.Gauge("gofish_outbound_queue_depth", "Messages waiting to be written to clients",
+                                   outbound_stat("queue_depth")))
+        registry.add(metrics.Gauge("gofish_outbound_queue_max_depth", "Deepest outbound queue of a client",
+                                   outbound_stat("max_queue_depth")))
+        for name in ("coalesced", "dropped", "evicted"):
+            registry.add(metrics.CounterGauge("gofish_outbound_overflows_total",
+                                              "Outbound queue overflows, by how they were resolved",
+                                              outbound_stat(name), {"result": name}))
+        for reason in self.games_reaped:
+            registry.add(metrics.CounterGauge("gofish_games_reaped_total", "Games discarded, by reason",
+                                              lambda reason=reason: self.games_reaped[reason], {"reason": reason}))
+        registry.add(metrics.Gauge("gofish_timers_pending", "Turn clocks and timeouts scheduled",
+                                   lambda: scheduler.pending))
+        for kind in timeouts:
+            registry.add(metrics.CounterGauge("gofish_timeouts_total", "Turn clocks and timeouts that ran out, by kind",
+                                              lambda kind=kind: timeouts[kind], {"kind": kind}))
+        if isinstance(self.token_validator, TokenCache):
+            cache = self.token_validator
+            for result in ("hits", "misses", "expired"):
+                registry.add(metrics.CounterGauge("gofish_token_cache_lookups_total",
+                                                  "Verified token cache lookups, by result",
+                                                  lambda result=result: getattr(cache, result), {"result": result}))
+            registry.add(metrics.Gauge("gofish_token_cache_entries", "Verified tokens in the cache",
+                                       lambda: cache.stats()["entries"]))
+
+    def start_metrics(self):
+        if self.metrics_port:
+            metrics.start_http_server(self.local_ip, self.metrics_port)
+
+    def stats(self) -> dict:
+        with self._lock:
+            live_games = len(self._servers)
+        return {
+            "live_games": live_games,
+            "games_reaped": dict(self.games_reaped),
+            "bytes_reclaimed": self.bytes_reclaimed,
+            "token_cache": self.token_validator.stats() if isinstance(self.token_validator, TokenCache) else None,
+        }
 
     def handle_authentication(self, gid: str, token: str):
         try:
@@ -33,20 +254,48 @@ class GameListener:
             return None
 
     def handle_connection(self, connection):
-        server = self._find_or_create_server(connection.gid)
-        server.handle_connection(connection)
+        gid = connection.gid
+        if gid is None:
+            # without authentication there are no claims to take the game
+            # from, so take it from the path, as the asyncio listener does
+            path = request_path(connection)
+            gid = urlparse(path).path.split("/")[-1] if path else None
+        server = self._find_or_create_server(gid)
+        if server:
+            server.handle_connection(connection)
         #connection.send({'action': 'set_gid', 'gid': connection.gid})
 
     def handle_stop(self):
+        self._stopped.set()
         with self._lock:
             for server in self._servers.values():
                 server.stop()
 
-    def run(self):
-        logger.info(f"listening on {self.local_ip}:{self.local_port}")
-        logger.info(f"authentication is {'enabled' if self.token_validator else 'disabled'}")
-        listener = WsGameListener(self.local_ip, self.local_port,
+    @staticmethod
+    def _serve_handoffs(adapter: HandoffAdapter, handoff: socket.socket):
+        while sock := receive_socket(handoff):
+            adapter.serve(sock)
+
+    def run(self, handoff: Optional[socket.socket] = None):
+        """ Runs the listener until interrupted. In a worker of a sharded
+            server, the connections are received over the `handoff` channel
+            from the front instead. """
+        if not handoff:
+            logger.info("listening on %s:%s", self.local_ip, self.local_port)
+        logger.info("authentication is %s", "enabled" if self.token_validator else "disabled")
+        self.start_reaper()
+        self.start_metrics()
+        listener = WsGameListener(self.local_ip if not handoff else "127.0.0.1", self.local_port if not handoff else 0,
                                   on_connection=self.handle_connection,
                                   on_authenticate=self.handle_authentication if self.token_validator else None,
                                   on_stop=self.handle_stop)
-        listener.run()
+        if not handoff:
+            listener.run()
+            return
+        adapter = HandoffAdapter(listener)
+        adapter.start()
+        try:
+            self._serve_handoffs(adapter, handoff)
+        except KeyboardInterrupt:
+            pass
+        listener.stop()
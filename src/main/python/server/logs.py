@@ -0,0 +1,119 @@
+import atexit
+import logging
+import queue
+import sys
+import time
+from logging.handlers import QueueHandler, QueueListener
+from threading import Lock
+from typing import Optional
+
+# Logging for the server's hot paths. Records are put on a queue by the
+# threads that log them, and formatted and written by a listener thread, so
+# a request thread never waits for stdout; messages use %-style arguments,
+# so nothing is formatted for records that are filtered out. Chatty message
+# types can be sampled (keeping one record in N) or rate limited.
+#
+# Because formatting happens later, on the listener's thread, an argument
+# that is changed after it is logged may be logged as changed.
+
+
+def parse_sample_rates(spec: str) -> dict[str, float]:
+    """ Parses "message prefix=fraction;..." into a dict """
+    rates = {}
+    for item in filter(None, (part.strip() for part in spec.split(";"))):
+        prefix, _, fraction = item.rpartition("=")
+        rates[prefix] = float(fraction)
+    return rates
+
+
+class _MessageType:
+
+    __slots__ = ("every", "count", "tokens", "updated", "suppressed")
+
+    def __init__(self, every: int, burst: float):
+        self.every = every
+        self.count = 0
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.suppressed = 0
+
+
+class SamplingFilter(logging.Filter):
+    """ Samples and rate limits records by message type, which is the
+        (unformatted) message they were logged with.
+
+    A message type that starts with a prefix in `sample_rates` is sampled:
+    with a rate of 0.01, one record in a hundred is kept. Then, if there is
+    a `rate_limit`, at most that many records of each type are kept per
+    second; the next record kept after some were dropped says how many.
+    Warnings and errors are never sampled, but they are rate limited.
+    """
+
+    def __init__(self, sample_rates: Optional[dict[str, float]] = None, rate_limit: float = 0):
+        super().__init__()
+        self.sample_rates = sample_rates or {}
+        self.rate_limit = rate_limit
+        self._types: dict[str, _MessageType] = {}
+        self._lock = Lock()
+
+    def _sampling_interval(self, msg: str) -> int:
+        for prefix, rate in self.sample_rates.items():
+            if msg.startswith(prefix):
+                return max(round(1 / rate), 1) if rate > 0 else 0
+        return 1
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        msg = str(record.msg)
+        with self._lock:
+            message_type = self._types.get(msg)
+            if message_type is None:
+                message_type = _MessageType(self._sampling_interval(msg), self.rate_limit)
+                self._types[msg] = message_type
+
+            if record.levelno < logging.WARNING and message_type.every != 1:
+                message_type.count += 1
+                if not message_type.every or message_type.count % message_type.every:
+                    return False
+
+            if self.rate_limit:
+                now = time.monotonic()
+                message_type.tokens = min(self.rate_limit,
+                                          message_type.tokens + (now - message_type.updated) * self.rate_limit)
+                message_type.updated = now
+                if message_type.tokens < 1:
+                    message_type.suppressed += 1
+                    return False
+                message_type.tokens -= 1
+                suppressed, message_type.suppressed = message_type.suppressed, 0
+                if suppressed and isinstance(record.args, tuple):
+                    record.msg = msg + " (%d similar messages suppressed)"
+                    record.args = record.args + (suppressed,)
+        return True
+
+
+class _LazyQueueHandler(QueueHandler):
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # QueueHandler would format the message here, on the logging thread
+        return record
+
+
+def configure_logging(level: int = logging.INFO, format: str = logging.BASIC_FORMAT,
+                      sample_rates: Optional[dict[str, float]] = None, rate_limit: float = 0) -> QueueListener:
+    """ Sends all logging through a queue to a thread that writes it to stdout """
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter(format))
+    records = queue.SimpleQueue()
+    queue_handler = _LazyQueueHandler(records)
+    queue_handler.addFilter(SamplingFilter(sample_rates, rate_limit))
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(queue_handler)
+
+    listener = QueueListener(records, handler)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
@@ -0,0 +1,235 @@
+import json
+import logging
+from functools import lru_cache
+from typing import Any, Optional
+from urllib.parse import parse_qs, urlparse
+
+import websockets
+from gamecomm.server import ConnectionClosedError, ConnectionClosedOK, GameConnection
+from gamecomm.server.game_connection import WsGameConnection
+
+from model.game import CARDS, GO_FISH_MESSAGE, cards_received_message
+from . import codec
+
+
+logger = logging.getLogger(__name__)
+
+# gamecomm's WsGameConnection can only send what it encodes itself, as JSON
+# text, and can neither close its connection nor tell what path the client
+# connected with. This module alone relies on one of its internals to do
+# those things: it keeps its websocket in `_connection`. If a gamecomm
+# release drops that attribute, its connections are sent JSON through the
+# public `send`, and a client can't ask for a codec (or, without auth, a
+# game) by its path.
+_WS_INTERNALS = "_connection" in WsGameConnection.__init__.__code__.co_names
+if not _WS_INTERNALS:
+    logger.warning("this version of gamecomm hides its websockets; binary codecs are unavailable")
+
+# This module assembles outgoing messages directly as JSON text, from
+# fragments that are encoded once, so the send path neither builds a dict
+# for every card nor encodes the same broadcast once per recipient. The text
+# is exactly what `json.dumps` produces for the equivalent dict, which is
+# what GameConnection.send puts on the wire. A message's binary encoding
+# (see codec.py) is only made when a client that asked for it is sent it.
+
+CARD_JSON = tuple(json.dumps(card.to_dict()) for card in CARDS)
+
+
+class EncodedMessage:
+    """ A message whose JSON text has already been encoded """
+
+    __slots__ = ("text", "_payload", "key", "_frame", "_binary")
+
+    def __init__(self, text: str, payload: Any = None, key: str = None, frame: Optional[list] = None):
+        self.text = text
+        self._payload = payload
+        # messages with the same key supersede one another (see outbound.py)
+        self.key = key
+        self._frame = frame
+        self._binary: Optional[bytes] = None
+
+    @staticmethod
+    def of(payload: Any, key: str = None) -> "EncodedMessage":
+        return EncodedMessage(json.dumps(payload), payload, key)
+
+    @property
+    def payload(self) -> Any:
+        """ The message as a Python object, for connections that need one """
+        if self._payload is None:
+            self._payload = json.loads(self.text)
+        return self._payload
+
+    @property
+    def binary(self) -> bytes:
+        """ The message in the binary codec, encoded once for all recipients """
+        if self._binary is None:
+            if self._frame is None:
+                self._frame = codec.to_frame(self.payload)
+            self._binary = codec.encode(self._frame)
+        return self._binary
+
+    def with_seq(self, seq: int) -> "EncodedMessage":
+        """ Returns the message with a `seq` property added in front of the
+            others, without decoding its text """
+        if self.text == "{}":
+            text = f'{{"seq": {seq}}}'
+        else:
+            text = f'{{"seq": {seq}, ' + self.text[1:]
+        payload = {"seq": seq, **self._payload} if isinstance(self._payload, dict) else None
+        frame = [self._frame[0], seq, *self._frame[2:]] if self._frame is not None else None
+        return EncodedMessage(text, payload, self.key, frame)
+
+    def __str__(self):
+        return self.text
+
+
+def _cards_json(cards) -> str:
+    return "[" + ", ".join(CARD_JSON[card.id] for card in cards) + "]"
+
+
+def _card_ids(cards) -> bytes:
+    return bytes(card.id for card in cards)
+
+
+START_GAME = EncodedMessage.of({"action": "start_game", "message": "The game has started."})
+YOUR_TURN = EncodedMessage.of({"action": "your_turn"}, key="turn")
+GO_FISH = EncodedMessage.of({
+    "action": "ask_response",
+    "result": "go_fish",
+    "cardsReceived": False,
+    "message": GO_FISH_MESSAGE
+})
+
+
+def initial_hand(cards) -> EncodedMessage:
+    return EncodedMessage('{"action": "initial_hand", "cards": ' + _cards_json(cards) + '}',
+                          frame=[4, None, _card_ids(cards)])
+
+
+def drawn_card(card) -> EncodedMessage:
+    return EncodedMessage('{"card": ' + CARD_JSON[card.id] + '}', frame=[codec.DRAWN_CARD, None, card.id])
+
+
+def cards_received(asking_player_name, target_player_name, rank, cards) -> EncodedMessage:
+    message = cards_received_message(asking_player_name, target_player_name, rank, len(cards))
+    return EncodedMessage('{"action": "ask_response", "result": "success", "cardsReceived": true, '
+                          '"message": ' + json.dumps(message) + ', "newCards": ' + _cards_json(cards) + '}',
+                          frame=[6, None, "success", True, message, _card_ids(cards)])
+
+
+@lru_cache(maxsize=1024)
+def wait_turn(player_name) -> EncodedMessage:
+    return EncodedMessage.of({"action": "wait", "player_turn": player_name}, key="turn")
+
+
+def player_list(player_names) -> EncodedMessage:
+    return EncodedMessage.of({"action": "update_player_list", "playerNames": list(player_names)},
+                             key="player_list")
+
+
+def session(player_name, resume_token, replayed=None) -> dict:
+    message = {"action": "session", "playerName": player_name, "resumeToken": resume_token}
+    if replayed is not None:
+        message["replayed"] = replayed
+    return message
+
+
+def message_text(message: Any) -> str:
+    return message.text if isinstance(message, EncodedMessage) else json.dumps(message)
+
+
+def message_binary(message: Any) -> bytes:
+    if isinstance(message, EncodedMessage):
+        return message.binary
+    if isinstance(message, bytes):
+        # already a binary frame, such as a batch
+        return message
+    return codec.encode(codec.to_frame(message))
+
+
+def message_data(message: Any, binary: bool = False):
+    """ The message as it goes on the wire: JSON text, or a binary frame """
+    return message_binary(message) if binary else message_text(message)
+
+
+def batch(messages) -> EncodedMessage:
+    """ An envelope for several messages, to be sent in one frame """
+    return EncodedMessage('{"action": "batch", "messages": [' + ", ".join(map(message_text, messages)) + ']}')
+
+
+def binary_batch(messages) -> bytes:
+    """ Several messages as one binary frame, which holds them one after
+        another (so it needs no envelope) """
+    return b"".join(map(message_binary, messages))
+
+
+def _websocket(connection: GameConnection):
+    # the websocket under a gamecomm WsGameConnection, if it can be reached
+    if _WS_INTERNALS and isinstance(connection, WsGameConnection):
+        return connection._connection
+    return None
+
+
+def can_send_binary(connection: GameConnection) -> bool:
+    return _websocket(connection) is not None or hasattr(connection, "send_binary")
+
+
+def send_message(connection: GameConnection, message: Any, binary: bool = False):
+    """ Sends a message, which may be an EncodedMessage, on a connection,
+        in the binary codec if `binary` is set """
+    if binary:
+        data = message_binary(message)
+    elif isinstance(message, EncodedMessage):
+        data = message.text
+    else:
+        connection.send(message)
+        return
+    websocket = _websocket(connection)
+    if websocket is not None:
+        # WsGameConnection.send would encode the message again, so hand the
+        # data directly to its websocket
+        try:
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("send %s: %s", connection, data)
+            websocket.send(data)
+        except websockets.ConnectionClosedError:
+            raise ConnectionClosedError()
+        except websockets.ConnectionClosedOK:
+            raise ConnectionClosedOK()
+    elif binary:
+        connection.send_binary(data)
+    elif hasattr(connection, "send_text"):
+        connection.send_text(data)
+    else:
+        connection.send(message.payload)
+
+
+def request_path(connection: GameConnection) -> Optional[str]:
+    """ The path (and query) that a websocket client connected with """
+    websocket = _websocket(connection)
+    if websocket is not None:
+        return websocket.request.path
+    return getattr(connection, "path", None)
+
+
+def negotiate_codec(connection: GameConnection) -> str:
+    """ The codec to send to a client in: a client asks for the binary codec
+        when it connects, with a path like `/<gid>?codec=msgpack` (which may
+        also ask to spectate); anything else gets JSON """
+    path = request_path(connection)
+    requested = parse_qs(urlparse(path).query).get("codec", [codec.JSON])[0] if path else codec.JSON
+    if requested == codec.JSON:
+        return codec.JSON
+    if not codec.supported(requested) or not can_send_binary(connection):
+        logger.warning("codec %s is not available to %s; using json", requested, connection)
+        return codec.JSON
+    return requested
+
+
+def close_connection(connection: GameConnection):
+    """ Closes a connection from the server's side """
+    websocket = _websocket(connection)
+    if websocket is not None:
+        websocket.close()
+    elif hasattr(connection, "close"):
+        connection.close()
@@ -0,0 +1,185 @@
+import bisect
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Optional
+
+
+logger = logging.getLogger(__name__)
+
+# A small, dependency-free metrics registry, rendered in the Prometheus text
+# exposition format. Recording a value costs a bisect and an uncontended lock,
+# so instrumentation can stay on in production; gauges are computed only when
+# the metrics are scraped.
+
+LATENCY_BUCKETS = (0.000_05, 0.000_1, 0.000_25, 0.000_5, 0.001, 0.002_5, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+
+def _labels(labels: dict, **extra) -> str:
+    pairs = {**labels, **extra}
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in pairs.items()) + "}"
+
+
+class Histogram:
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Optional[dict] = None, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels or {}
+        self.buckets = buckets
+        self._counts = [0] * (len(buckets) + 1)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[i] += 1
+            self._sum += value
+
+    def samples(self):
+        with self._lock:
+            counts = list(self._counts)
+            total = self._sum
+        cumulative = 0
+        for bound, count in zip(self.buckets, counts):
+            cumulative += count
+            yield f"{self.name}_bucket{_labels(self.labels, le=bound)} {cumulative}"
+        cumulative += counts[-1]
+        yield f"{self.name}_bucket{_labels(self.labels, le='+Inf')} {cumulative}"
+        yield f"{self.name}_sum{_labels(self.labels)} {total}"
+        yield f"{self.name}_count{_labels(self.labels)} {cumulative}"
+
+
+class Gauge:
+    """ A value that is read from a function whenever the metrics are scraped """
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, read: Callable[[], float], labels: Optional[dict] = None):
+        self.name = name
+        self.help = help
+        self.labels = labels or {}
+        self.read = read
+
+    def samples(self):
+        yield f"{self.name}{_labels(self.labels)} {self.read()}"
+
+
+class CounterGauge(Gauge):
+    """ A counter that is kept elsewhere and read when scraped """
+
+    kind = "counter"
+
+
+class Registry:
+
+    def __init__(self):
+        self._metrics: dict[tuple, object] = {}
+        self._lock = threading.Lock()
+
+    def add(self, metric):
+        # a metric with the same name and labels replaces an earlier one
+        with self._lock:
+            self._metrics[(metric.name, tuple(metric.labels.items()))] = metric
+        return metric
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        described = set()
+        for metric in sorted(metrics, key=lambda metric: metric.name):
+            if metric.name not in described:
+                described.add(metric.name)
+                lines.append(f"# HELP {metric.name} {metric.help}")
+                lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+class TimedLock:
+    """ A lock that records how long each acquisition waited for it """
+
+    def __init__(self, histogram: Histogram):
+        self._lock = threading.Lock()
+        self._histogram = histogram
+
+    def acquire(self, blocking: bool = True, timeout: float = -1) -> bool:
+        if self._lock.acquire(False):
+            self._histogram.observe(0.0)
+            return True
+        if not blocking:
+            return False
+        start = time.perf_counter()
+        acquired = self._lock.acquire(True, timeout)
+        self._histogram.observe(time.perf_counter() - start)
+        return acquired
+
+    def release(self):
+        self._lock.release()
+
+    def locked(self) -> bool:
+        return self._lock.locked()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *args):
+        self._lock.release()
+
+
+def lock_wait_histogram(lock_name: str) -> Histogram:
+    return registry.add(Histogram("gofish_lock_wait_seconds", "Time spent waiting to acquire a lock",
+                                  {"lock": lock_name}))
+
+
+REQUEST_ACTIONS = ("player_ready", "draw_card", "ask_for_card", "add_bot", "resume", "options")
+
+request_latency = {
+    action: registry.add(Histogram("gofish_request_seconds",
+                                   "Time from receiving a request to having handled it, by action",
+                                   {"action": action}))
+    for action in REQUEST_ACTIONS + ("other",)
+}
+
+game_lock_wait = lock_wait_histogram("game")
+
+
+def observe_request(action: str, seconds: float):
+    request_latency.get(action, request_latency["other"]).observe(seconds)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(local_ip: str, local_port: int) -> ThreadingHTTPServer:
+    """ Serves the metrics at /metrics on a thread of its own """
+    server = ThreadingHTTPServer((local_ip, local_port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    logger.info("serving metrics on http://%s:%s/metrics", local_ip, local_port)
+    return server
@@ -0,0 +1,211 @@
+import logging
+from collections import deque
+from threading import Condition, Lock, Thread
+from typing import Any, Callable, Optional
+from weakref import WeakSet
+
+from gamecomm.server import ConnectionClosed, GameConnection
+from gamecomm.server.game_connection import WsGameConnection
+
+import server.config as config
+from .messages import batch, binary_batch, close_connection, send_message
+
+
+logger = logging.getLogger(__name__)
+
+# What to do with a message for a subscriber whose outbound queue is full
+COALESCE = "coalesce"       # replace a queued message that the new one supersedes
+DROP = "drop"               # discard the new message
+DISCONNECT = "disconnect"   # evict the subscriber as a slow consumer
+OVERFLOW_POLICIES = (COALESCE, DROP, DISCONNECT)
+
+
+class OutboundMetrics:
+    """ Counts overflows across all outbound queues in the process """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._queues = WeakSet()
+        self.coalesced = 0
+        self.dropped = 0
+        self.evicted = 0
+
+    def add(self, queue: "OutboundQueue"):
+        with self._lock:
+            self._queues.add(queue)
+
+    def count(self, name: str):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def stats(self) -> dict:
+        with self._lock:
+            depths = [queue.depth for queue in self._queues if not queue.inline]
+            return {
+                "queues": len(depths),
+                "queue_depth": sum(depths),
+                "max_queue_depth": max(depths, default=0),
+                "coalesced": self.coalesced,
+                "dropped": self.dropped,
+                "evicted": self.evicted,
+            }
+
+
+metrics = OutboundMetrics()
+
+
+class OutboundQueue:
+    """ The messages waiting to be written to one subscriber's connection.
+
+    Putting a message never blocks: the queue is drained by a writer of its
+    own, so a slow client holds up nobody but itself. When the queue is full
+    the overflow policy decides what gives. A message with a `key` (such as
+    a turn notification) supersedes any queued message with the same key, so
+    under COALESCE the older one is removed to make room; if there is nothing
+    to coalesce, the subscriber is disconnected rather than silently missing
+    a move.
+    """
+
+    def __init__(self, connection: GameConnection, limit: Optional[int] = None, policy: Optional[str] = None):
+        self.connection = connection
+        self.limit = limit or int(config.OUTBOUND_QUEUE_LIMIT)
+        self.policy = policy or config.OUTBOUND_OVERFLOW
+        if self.policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"unknown overflow policy: {self.policy}")
+        self.max_depth = 0
+        self.closed = False
+        self.evicted = False
+        # an in-process connection (such as a bot's) is written directly
+        self.inline = False
+        # the client takes the messages of each transition as one batch
+        self.batching = False
+        # the client asked for the binary codec
+        self.binary = False
+        self._holding = False
+        self._held: list[Any] = []
+        self._messages: deque[Any] = deque()
+        self._ready = Condition()
+        self._notify: Optional[Callable[[], None]] = None
+        metrics.add(self)
+
+    @property
+    def depth(self) -> int:
+        return len(self._messages)
+
+    def set_notify(self, notify: Callable[[], None]):
+        """ Sets a function to be called whenever there is something to write,
+            for a writer that can't wait on the queue's condition """
+        self._notify = notify
+
+    def set_batching(self, enabled: bool):
+        self.batching = enabled and not self.inline
+
+    def set_binary(self, enabled: bool):
+        self.binary = enabled
+
+    def hold(self):
+        """ Holds the messages put from now on, to be queued as one batch """
+        if self.batching:
+            self._holding = True
+
+    def release(self):
+        with self._ready:
+            held, self._held = self._held, []
+            self._holding = False
+        if len(held) > 1:
+            self.put(binary_batch(held) if self.binary else batch(held))
+        elif held:
+            self.put(held[0])
+
+    def put(self, message: Any):
+        if self.inline:
+            send_message(self.connection, message, self.binary)
+            return
+        if self._holding:
+            with self._ready:
+                if self._holding:
+                    self._held.append(message)
+                    return
+        with self._ready:
+            if self.closed:
+                return
+            if len(self._messages) < self.limit or self._make_room(message):
+                self._messages.append(message)
+                if len(self._messages) > self.max_depth:
+                    self.max_depth = len(self._messages)
+                self._ready.notify()
+            elif not self.evicted:
+                return
+        if self._notify:
+            self._notify()
+
+    def _make_room(self, message: Any) -> bool:
+        if self.policy == COALESCE:
+            key = getattr(message, "key", None)
+            if key is not None:
+                for i, queued in enumerate(self._messages):
+                    if getattr(queued, "key", None) == key:
+                        del self._messages[i]
+                        metrics.count("coalesced")
+                        return True
+        elif self.policy == DROP:
+            metrics.count("dropped")
+            return False
+
+        logger.warning("evicting slow consumer %s with %s messages queued", self.connection, len(self._messages))
+        metrics.count("evicted")
+        self.evicted = True
+        self._close()
+        return False
+
+    def take(self) -> list:
+        """ Removes and returns everything queued """
+        with self._ready:
+            messages = list(self._messages)
+            self._messages.clear()
+            return messages
+
+    def wait(self) -> list:
+        """ Waits for messages, then removes and returns them; returns an
+            empty list once the queue is closed """
+        with self._ready:
+            while not self._messages and not self.closed:
+                self._ready.wait()
+            messages = list(self._messages)
+            self._messages.clear()
+            return messages
+
+    def _close(self):
+        self.closed = True
+        self._messages.clear()
+        self._ready.notify_all()
+
+    def close(self):
+        with self._ready:
+            self._close()
+        if self._notify:
+            self._notify()
+
+
+def _write(queue: OutboundQueue):
+    connection = queue.connection
+    try:
+        while messages := queue.wait():
+            for message in messages:
+                send_message(connection, message, queue.binary)
+    except ConnectionClosed:
+        queue.close()
+    if queue.evicted:
+        close_connection(connection)
+
+
+def open_queue(connection: GameConnection) -> OutboundQueue:
+    """ Creates an outbound queue for a connection and starts its writer """
+    queue = OutboundQueue(connection)
+    if hasattr(connection, "start_writer"):
+        connection.start_writer(queue)
+    elif isinstance(connection, WsGameConnection):
+        Thread(target=_write, args=(queue,), name=f"writer-{connection}", daemon=True).start()
+    else:
+        queue.inline = True
+    return queue
@@ -3,50 +3,93 @@ from threading import Lock
 
 from gamecomm.server import GameConnection
 
+from .messages import EncodedMessage
+from .outbound import OutboundQueue, open_queue
+
 logger = logging.getLogger(__name__)
 
 
 class GamePublisher:
 
     def __init__(self, game_server):
-        self._subscribers: list[GameConnection] = []
+        self._subscribers: dict[GameConnection, OutboundQueue] = {}
         self._lock = Lock()
         self._controllers = []
         self.game_server = game_server
 
 
     def add_controller(self, controller):
-        self._controllers.append(controller)
+        with self._lock:
+            self._controllers.append(controller)
+
+    def remove_controller(self, controller):
+        with self._lock:
+            self._controllers.remove(controller)
 
     def get_all_controllers(self):
-        return self._controllers
+        with self._lock:
+            return list(self._controllers)
     
-    def add_subscriber(self, connection: GameConnection):
-        logger.info(f"adding subscriber {connection}")
+    def add_subscriber(self, connection: GameConnection, binary: bool = False) -> OutboundQueue:
+        logger.info("adding subscriber %s", connection)
+        queue = open_queue(connection)
+        # each message is encoded once, in each codec that its subscribers use
+        queue.set_binary(binary)
         with self._lock:
-            self._subscribers.append(connection)
+            self._subscribers[connection] = queue
+        return queue
 
     def remove_subscriber(self, connection: GameConnection):
-        logger.info(f"removing subscriber {connection}")
+        logger.info("removing subscriber %s", connection)
         with self._lock:
-            self._subscribers.remove(connection)
+            queue = self._subscribers.pop(connection)
+        queue.close()
 
     def publish_event(self, event):
-        logger.info(f"publishing event: {event}")
+        logger.info("publishing event: %s", event)
+        with self._lock:
+            queues = list(self._subscribers.values())
+        # encode once for all the subscribers; each queue's writer sends it
+        message = self.game_server.message_log.record(EncodedMessage.of(event))
+        for queue in queues:
+            queue.put(message)
+
+    def hold_messages(self):
+        """ Holds the messages for subscribers that receive batches until
+            release_messages is called """
+        with self._lock:
+            queues = list(self._subscribers.values())
+        for queue in queues:
+            queue.hold()
+
+    def release_messages(self):
         with self._lock:
-            subscribers = list(self._subscribers)
-        for subscriber in subscribers:
-            subscriber.send(event)
+            queues = list(self._subscribers.values())
+        for queue in queues:
+            queue.release()
 
     def notify_all_players_of_turn(self, current_player_name):
-        for controller in self._controllers:
+        for controller in self.get_all_controllers():
             controller.notify_turn(current_player_name)
+        self.game_server.start_turn_clock(current_player_name)
+
+    MIN_PLAYERS = 2
 
     def check_all_players_ready(self):
-        if not self.game_server.game_started and all(controller.is_ready for controller in self.get_all_controllers()):
+        controllers = self.get_all_controllers()
+        # a bot is always ready, so a lone bot must not start the game by itself
+        if len(controllers) < self.MIN_PLAYERS:
+            return
+        if not self.game_server.game_started and all(controller.is_ready for controller in controllers):
             # Logic to notify GameServer to start the game
             self.game_server.start_game()
     
+    def outbound_stats(self) -> list[dict]:
+        with self._lock:
+            queues = list(self._subscribers.values())
+        return [{"subscriber": str(queue.connection), "queue_depth": queue.depth, "max_queue_depth": queue.max_depth}
+                for queue in queues if not queue.inline]
+
     @property
     def subscribers(self):
         with self._lock:
@@ -0,0 +1,151 @@
+import logging
+import time
+from threading import Condition, Thread
+from typing import Callable, Optional
+
+import server.config as config
+
+
+logger = logging.getLogger(__name__)
+
+
+class Timer:
+    """ A callback scheduled on a TimingWheel; cancel it with `cancel` """
+
+    __slots__ = ("wheel", "expires", "callback", "args", "_slot")
+
+    def __init__(self, wheel: "TimingWheel", expires: int, callback: Callable, args: tuple):
+        self.wheel = wheel
+        # the tick at which the timer fires
+        self.expires = expires
+        self.callback = callback
+        self.args = args
+        self._slot: Optional[dict] = None
+
+    @property
+    def pending(self) -> bool:
+        return self._slot is not None
+
+    def cancel(self):
+        self.wheel.cancel(self)
+
+
+class TimingWheel:
+    """ Runs callbacks after a delay, for every game in the process, on one
+        thread.
+
+    Timers are kept in `levels` wheels of `slots` slots each. The first wheel
+    has a slot for each of the next `slots` ticks; each wheel after it has a
+    slot for each `slots` turns of the one before, so four wheels of 64 slots
+    reach 64**4 ticks ahead (almost three weeks, at 0.1 seconds a tick); a
+    longer delay is cut to that. A slot is a dict of timers, so scheduling
+    and cancelling a timer are O(1) however many are pending. Whenever a
+    wheel comes round, the timers in the next wheel's current slot are moved
+    down to where they now belong.
+
+    A timer fires on the first tick at or after its deadline, so it may be
+    late by up to a tick (more if the thread falls behind). Callbacks run on
+    the scheduler's thread, and must be quick: they should hand any real
+    work to a game's executor.
+    """
+
+    def __init__(self, tick: float = 0.1, slots: int = 64, levels: int = 4):
+        if slots & (slots - 1):
+            raise ValueError("the number of slots must be a power of two")
+        self.tick = tick
+        self._bits = slots.bit_length() - 1
+        self._mask = slots - 1
+        self._levels = levels
+        self._wheels: list[list[dict]] = [[{} for _ in range(slots)] for _ in range(levels)]
+        self._max_ticks = (1 << (self._bits * levels)) - 1
+        self._top_bit = self._bits * levels - 1
+        self._ticks = 0
+        self._started_at = time.monotonic()
+        self._thread: Optional[Thread] = None
+        self._stopped = False
+        self._cond = Condition()
+        self.pending = 0
+        self.fired = 0
+
+    def schedule(self, delay: float, callback: Callable, *args) -> Timer:
+        """ Calls `callback(*args)` after `delay` seconds """
+        with self._cond:
+            if not self._thread:
+                self._start()
+            # the first tick at or after the deadline, as the current tick
+            # may have begun some time ago
+            expires = -int(-(time.monotonic() + delay - self._started_at) // self.tick)
+            expires = min(max(expires, self._ticks + 1), self._ticks + self._max_ticks)
+            timer = Timer(self, expires, callback, args)
+            self._place(timer)
+            self.pending += 1
+        return timer
+
+    def cancel(self, timer: Timer):
+        with self._cond:
+            if timer._slot is not None:
+                del timer._slot[timer]
+                timer._slot = None
+                self.pending -= 1
+
+    def _place(self, timer: Timer):
+        # the caller holds the lock
+        # the wheel whose slots span the time to go, which is 0 for a timer
+        # due on the tick being cascaded
+        due = timer.expires - self._ticks
+        level = min(max(due.bit_length() - 1, 0), self._top_bit) // self._bits
+        slot = self._wheels[level][(timer.expires >> (self._bits * level)) & self._mask]
+        slot[timer] = None
+        timer._slot = slot
+
+    def _advance(self) -> list[Timer]:
+        """ Moves on a tick; returns the timers that are due """
+        with self._cond:
+            self._ticks += 1
+            ticks = self._ticks
+            # the wheels that have come round, from the outermost in
+            level = 1
+            while level < self._levels and not ticks & ((1 << (self._bits * level)) - 1):
+                level += 1
+            for outer in range(level - 1, 0, -1):
+                wheel = self._wheels[outer]
+                index = (ticks >> (self._bits * outer)) & self._mask
+                timers, wheel[index] = wheel[index], {}
+                for timer in timers:
+                    self._place(timer)
+            index = ticks & self._mask
+            due, self._wheels[0][index] = self._wheels[0][index], {}
+            for timer in due:
+                timer._slot = None
+            self.pending -= len(due)
+            self.fired += len(due)
+            return list(due)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if self._stopped:
+                    return
+                delay = self._started_at + (self._ticks + 1) * self.tick - time.monotonic()
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+            for timer in self._advance():
+                try:
+                    timer.callback(*timer.args)
+                except Exception as err:
+                    logger.exception("error running timer %s: %s", timer.callback, err)
+
+    def _start(self):
+        # the caller holds the lock
+        self._started_at = time.monotonic() - self._ticks * self.tick
+        self._thread = Thread(target=self._run, name="scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+
+
+scheduler = TimingWheel(int(config.TIMER_TICK_MS) / 1000)
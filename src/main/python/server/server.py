@@ -1,70 +1,417 @@
 import logging
-from threading import Lock
+import time
+from threading import Lock, Thread
+from typing import Optional
 
-from gamecomm.server import GameConnection
+from gamecomm.server import ConnectionClosed, GameConnection
 
+from model.events import BookCompletedEvent, CardDrawnEvent, CardsRequestedEvent, GameEvent
 from model.game import GoFishGame
 
+import server.config as config
+from .bot import BotConnection
 from .controller import GameController
+from .executor import GameExecutor
+from .journal import GameJournal
+from . import metrics
+from . import messages
 from .publisher import GamePublisher
+from .scheduler import Timer, scheduler
+from .session import MessageLog, Seat
+from .spectators import GameSnapshot, SpectatorChannel, is_spectator
 
 
 logger = logging.getLogger(__name__)
 
+# the timeouts that have run out, by kind, in all the games of the process
+timeouts = {"turn": 0, "ready": 0, "idle": 0}
+
 
 class GameServer:
 
-    def __init__(self, gid: str):
+    def __init__(self, gid: str, game: Optional[GoFishGame] = None, journal: Optional[GameJournal] = None):
         self.gid = gid
         self.publisher = GamePublisher(self)
+        self.spectators = SpectatorChannel(gid)
+        self.executor = GameExecutor(gid)
         self._controllers: dict[GameConnection, GameController] = {}
+        self._seats: dict[str, Seat] = {}
+        # tokens of the seats restored from the journal of a recovered game
+        self._recovered_seats: set[str] = set()
+        self.message_log = MessageLog(int(config.RESUME_BUFFER_SIZE))
         self._lock = Lock()
         self.connected_ = []
-        self.go_fish_game = GoFishGame([])
-        self.game_started = False
+        self.go_fish_game = game or GoFishGame([])
+        self.go_fish_game.lock = metrics.TimedLock(metrics.game_lock_wait)
+        self.go_fish_game.add_observer(self.handle_game_event)
+        self.game_started = self.go_fish_game.game_started
+        self.journal = journal
+        self._last_connection_change = time.monotonic()
+        # when the listener's reaper first saw that the game was over
+        self.ended_at: Optional[float] = None
+        self.turn_timeout = float(config.TURN_TIMEOUT)
+        self.ready_timeout = float(config.READY_TIMEOUT)
+        self.idle_timeout = float(config.IDLE_TIMEOUT)
+        self._turn_timer: Optional[Timer] = None
+        self._turn_started = time.monotonic()
+        # events from the deal, held back until the players have their hands
+        self._deal_events: Optional[list[dict]] = None
+        if journal:
+            journal.attach(self.go_fish_game)
+            self._restore_seats(journal)
+
+    def _restore_seats(self, journal: GameJournal):
+        # the seats of players still in a recovered game can be resumed
+        for player_name, uid, token in journal.recover_seats():
+            if self.go_fish_game.find_player(player_name):
+                self._seats[token] = Seat(player_name, uid, token)
+        self._recovered_seats = set(self._seats)
+        if self._seats:
+            logger.info("restored %s seats in game %s", len(self._seats), self.gid)
+
+    def handle_game_event(self, event: GameEvent):
+        if isinstance(event, BookCompletedEvent):
+            message = {
+                "action": "book_done",
+                "playerName": event.player_name,
+                "rank": event.rank
+            }
+        elif isinstance(event, CardsRequestedEvent):
+            message = {
+                "action": "player_asked",
+                "playerName": event.asking_player,
+                "targetPlayerName": event.target_player,
+                "rank": event.rank,
+                "count": event.count
+            }
+        elif isinstance(event, CardDrawnEvent):
+            message = {
+                "action": "player_drew",
+                "playerName": event.player_name
+            }
+        else:
+            return
+        if self._deal_events is not None:
+            self._deal_events.append(message)
+        else:
+            self.publisher.publish_event(message)
+
+    @property
+    def last_activity(self) -> float:
+        """ The time (on the monotonic clock) of the last request or connection change """
+        return max(self.executor.last_active, self._last_connection_change)
+
+    def connection_count(self) -> int:
+        with self._lock:
+            return len(self._controllers)
+
+    def player_count(self) -> int:
+        """ The number of connected players, not counting bots """
+        with self._lock:
+            return sum(1 for connection in self._controllers if not isinstance(connection, BotConnection))
+
+    def is_over(self) -> bool:
+        return self.game_started and self.go_fish_game.check_game_end()[0]
+
+    def _controller_list(self) -> list[GameController]:
+        # connections come and go on their own threads, so iterate over a copy
+        with self._lock:
+            return list(self._controllers.values())
 
     def send_player_list_to_all(self):
-        player_names = [player.name for player in self.go_fish_game.players]
-        for controller in self._controllers.values():
-            controller.connection.send({
-                "action": "update_player_list",
-                "playerNames": player_names
-            })
+        message = messages.player_list(player.name for player in self.go_fish_game.players)
+        for controller in self._controller_list():
+            controller.send(message)
 
     def handle_close(self, connection: GameConnection):
         with self._lock:
-            self._controllers.pop(connection)
+            controller = self._controllers.pop(connection)
+            controller.cancel_timers()
+            self._last_connection_change = time.monotonic()
             self.publisher.remove_subscriber(connection)
+            self.publisher.remove_controller(controller)
+            # a seat in a game that has started is kept for the player to
+            # resume; before then, another player may as well have it
+            if not self.game_started and not self._seated(controller.player_name):
+                self._seats = {token: seat for token, seat in self._seats.items()
+                               if seat.player_name != controller.player_name}
 
-    def handle_connection(self, connection):
-        controller = GameController(connection, self.publisher,self.go_fish_game, on_close=self.handle_close)
+    def _seated(self, player_name: str) -> Optional[GameController]:
+        # the caller holds the lock
+        for controller in self._controllers.values():
+            if controller.player_name == player_name:
+                return controller
+        return None
+
+    def _next_player_name(self) -> str:
+        # the caller holds the lock; names of players who might resume, or
+        # who are still in the game, stay taken
+        taken = {controller.player_name for controller in self._controllers.values()}
+        taken.update(seat.player_name for seat in self._seats.values())
+        taken.update(player.name for player in self.go_fish_game.players)
+        number = 1
+        while f"Player {number}" in taken:
+            number += 1
+        return f"Player {number}"
+
+    def _unclaimed_seat(self, uid: Optional[str]) -> Optional[Seat]:
+        # the caller holds the lock; a player of a recovered game who lost
+        # its resume token can still take its seat back as the same user
+        if not uid:
+            return None
+        for token in self._recovered_seats:
+            seat = self._seats.get(token)
+            if seat and seat.uid == uid and not self._seated(seat.player_name):
+                return seat
+        return None
+
+    def _add_controller(self, connection) -> GameController:
         with self._lock:
+            seat = self._unclaimed_seat(connection.uid)
+            claimed = seat is not None
+            if not claimed:
+                seat = Seat.open(self._next_player_name(), connection.uid)
+                self._seats[seat.token] = seat
+                if self.journal and not isinstance(connection, BotConnection):
+                    self.journal.record_seat(seat.player_name, seat.uid, seat.token)
+            controller = GameController(connection, self.publisher,self.go_fish_game, self.executor,
+                                        on_close=self.handle_close, player_name=seat.player_name)
+            controller.message_log = self.message_log
             self._controllers[connection] = controller
-            self.publisher.add_subscriber(connection)
+            self._last_connection_change = time.monotonic()
+            controller.outbound = self.publisher.add_subscriber(connection, controller.binary)
             self.publisher.add_controller(controller)
+            if not isinstance(connection, BotConnection):
+                if self.ready_timeout and not self.game_started:
+                    controller.ready_timer = scheduler.schedule(self.ready_timeout, self.executor.submit,
+                                                                self._ready_expired, controller)
+                if self.idle_timeout:
+                    self._arm_idle_timer(controller, self.idle_timeout)
+        controller.send_unsequenced(messages.session(seat.player_name, seat.token))
+        if claimed:
+            logger.info("%s took back seat %s in recovered game %s", connection.uid, seat.player_name, self.gid)
+            self._send_seat(controller, seat, None)
+        return controller
+
+    def resume(self, controller: GameController, token: str, seq: Optional[int]):
+        """ Gives a reconnected client back its seat: sends the messages it
+            missed since `seq`, or a snapshot of its view of the game if
+            those are no longer kept (or it doesn't know where it was) """
+        if not isinstance(seq, int):
+            seq = None
+        with self._lock:
+            seat = self._seats.get(token)
+            if not seat or (seat.uid and seat.uid != controller.connection.uid):
+                seat = None
+            else:
+                previous = self._seated(seat.player_name)
+                if previous and previous is not controller:
+                    # the old connection may not have noticed that it's gone
+                    previous.outbound.close()
+                    previous.stop()
+                abandoned = controller.player_name
+                controller.player_name = seat.player_name
+                if not self._seated(abandoned):
+                    self._seats = {token: seat for token, seat in self._seats.items()
+                                   if seat.player_name != abandoned}
+        if not seat:
+            controller.send_unsequenced({"status": "error", "error": {"message": "invalid resume token"}})
+            return
 
+        logger.info("%s resumed in game %s after message %s", seat.player_name, self.gid, seq)
+        self._send_seat(controller, seat, seq)
+
+    def _send_seat(self, controller: GameController, seat: Seat, seq: Optional[int]):
+        # catches a client that has (re)taken a seat up with the game
+        player = self.go_fish_game.find_player(seat.player_name)
+        controller.is_ready = controller.initial_hand_sent = player is not None
+        missed = self.message_log.since(seq, seat.player_name) if seq is not None else None
+        if missed is None:
+            controller.send_unsequenced(self._resync_message(seat.player_name))
+            return
+        controller.send_unsequenced(messages.session(seat.player_name, seat.token, len(missed)))
+        for message in missed:
+            controller.send_unsequenced(message)
+
+    def _resync_message(self, player_name: str) -> dict:
+        game = self.go_fish_game
+        player = game.find_player(player_name)
+        return {
+            "action": "resync",
+            "seq": self.message_log.seq,
+            "playerName": player_name,
+            "gameStarted": self.game_started,
+            "playerNames": [p.name for p in game.players],
+            "currentPlayer": game.players[game.current_player_index].name if self.game_started else None,
+            "books": {p.name: p.books for p in game.players},
+            "handSizes": {p.name: p.hand_size for p in game.players},
+            "deckSize": len(game.deck.cards),
+            "cards": [card.to_dict() for card in player.hand] if player else [],
+        }
+
+    def publish_snapshot(self, force: bool = False):
+        """ Hands the game's public state to its spectators, if it has any and
+            the game has changed since the last snapshot; runs on the game's
+            executor thread, so the game can be read without its lock """
+        if not self.spectators.watched:
+            return
+        if not force and self.spectators.published_seq == self.message_log.seq:
+            return
+        game = self.go_fish_game
+        players = game.players
+        over, winners = game.check_game_end() if self.game_started else (False, None)
+        if self.game_started:
+            player_names = tuple(player.name for player in players)
+        else:
+            player_names = tuple(controller.player_name for controller in self._controller_list())
+        self.spectators.publish(GameSnapshot(
+            seq=self.message_log.seq,
+            game_started=self.game_started,
+            player_names=player_names,
+            current_player=players[game.current_player_index].name if self.game_started and not over else None,
+            books=tuple(player.books for player in players) if self.game_started else (0,) * len(player_names),
+            hand_sizes=tuple(player.hand_size for player in players) if self.game_started else (0,) * len(player_names),
+            deck_size=len(game.deck.cards),
+            winners=tuple(winners) if over else None,
+        ))
+
+    def request_handled(self, controller: GameController):
+        """ Runs on the game's executor thread after each of a client's requests """
+        self.publish_snapshot()
+        # the idle timer isn't moved for every request; it checks this when it fires
+        controller.last_request = time.monotonic()
+
+    def start_turn_clock(self, player_name: str):
+        """ Gives the player whose turn it now is `turn_timeout` seconds to
+            move; runs on the game's executor thread. The game's one timer
+            isn't moved on every turn: when it fires, it checks how long the
+            current turn has actually taken """
+        self._turn_started = time.monotonic()
+        if self.turn_timeout and not self._turn_timer and not self.is_over():
+            self._turn_timer = scheduler.schedule(self.turn_timeout, self.executor.submit, self._turn_expired)
+
+    def _turn_expired(self):
+        self._turn_timer = None
+        # the clock stops when everyone has left, so the game can be reaped;
+        # the next turn starts it again
+        if self.is_over() or not self.player_count():
+            return
+        remaining = self.turn_timeout - (time.monotonic() - self._turn_started)
+        if remaining > 0:
+            self._turn_timer = scheduler.schedule(remaining, self.executor.submit, self._turn_expired)
+            return
+        game = self.go_fish_game
+        player_name = game.players[game.current_player_index].name
+        timeouts["turn"] += 1
+        logger.info("%s ran out of time in game %s", player_name, self.gid)
+        self.publisher.hold_messages()
+        try:
+            self.publisher.publish_event({"action": "turn_timeout", "playerName": player_name})
+            self.publisher.notify_all_players_of_turn(game.next_player())
+        finally:
+            self.publisher.release_messages()
+        self.publish_snapshot()
+
+    def _arm_idle_timer(self, controller: GameController, delay: float):
+        controller.idle_timer = scheduler.schedule(delay, self.executor.submit, self._idle_expired, controller)
+
+    def _ready_expired(self, controller: GameController):
+        if controller.is_ready or self.game_started or controller.connection not in self._controllers:
+            return
+        timeouts["ready"] += 1
+        self._disconnect(controller, "not ready in time")
+
+    def _idle_expired(self, controller: GameController):
+        if controller.connection not in self._controllers:
+            return
+        remaining = self.idle_timeout - (time.monotonic() - controller.last_request)
+        if remaining > 0:
+            self._arm_idle_timer(controller, remaining)
+            return
+        timeouts["idle"] += 1
+        self._disconnect(controller, "idle for too long")
+
+    def _disconnect(self, controller: GameController, reason: str):
+        logger.info("disconnecting %s from game %s: %s", controller.player_name, self.gid, reason)
+        controller.cancel_timers()
+        try:
+            # straight to the connection, as it is closed right after
+            messages.send_message(controller.connection, {"status": "error", "error": {"message": reason}},
+                                  controller.binary)
+        except ConnectionClosed:
+            pass
+        messages.close_connection(controller.connection)
+        controller.stop()
+
+    def _add_spectator(self, connection):
+        self.spectators.add(connection)
+        # the first snapshot for the newcomer is taken on the executor too
+        self.executor.submit(self.publish_snapshot, True)
+
+    def handle_connection(self, connection):
+        if is_spectator(connection):
+            self._add_spectator(connection)
+            self.spectators.watch(connection)
+            return
+        controller = self._add_controller(connection)
         controller.run()
 
+    async def handle_connection_async(self, connection):
+        if is_spectator(connection):
+            self._add_spectator(connection)
+            await self.spectators.watch_async(connection)
+            return
+        controller = self._add_controller(connection)
+        await controller.run_async()
+
+    def add_bot(self):
+        """ Fills a seat with a bot player, served by its own controller thread
+            just like a player connection """
+        if self.game_started:
+            return None
+        connection = BotConnection(self.gid)
+        controller = self._add_controller(connection)
+        connection.player_name = controller.player_name
+        Thread(target=controller.run, name=f"{connection.uid}-{self.gid}", daemon=True).start()
+        logger.info("added bot %s to game %s", connection.player_name, self.gid)
+        return connection.player_name
+
     #def check_all_players_ready(self):
         #if all(controller.is_ready for controller in self._controllers.values()) and not self.game_started:
             #self.start_game()
 
     def start_game(self):
         if not self.game_started:  
-            player_names = [controller.player_name for controller in self._controllers.values()]
-            self.go_fish_game.start_game(player_names)
+            controllers = self._controller_list()
+            player_names = [controller.player_name for controller in controllers]
+            # books completed by the deal are only announced once every player
+            # has been told the game started and who is playing
+            self._deal_events = []
+            try:
+                self.go_fish_game.start_game(player_names)
+            finally:
+                deal_events, self._deal_events = self._deal_events, None
             self.game_started = True
-            for controller in self._controllers.values():
-                controller.connection.send({"action": "start_game", "message": "The game has started."})
+            for controller in controllers:
+                controller.send(messages.START_GAME)
                 controller.send_initial_hand()
-                
+            self.send_player_list_to_all()
+            for message in deal_events:
+                self.publisher.publish_event(message)
+
             first_player = self.go_fish_game.players[0].name
             self.publisher.notify_all_players_of_turn(first_player)
-            self.send_player_list_to_all()
 
 
 
     def stop(self):
+        if self._turn_timer:
+            self._turn_timer.cancel()
         with self._lock:
             for controller in self._controllers.values():
+                controller.cancel_timers()
                 controller.stop()
+        self.spectators.close()
+        self.executor.stop()
+        if self.journal:
+            self.journal.close()
@@ -0,0 +1,60 @@
+import secrets
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Optional
+
+from .messages import EncodedMessage
+
+
+@dataclass
+class Seat:
+    """ A player's place in a game, which a client can take back after its
+        connection drops by presenting the seat's resume token """
+    player_name: str
+    uid: Optional[str]
+    token: str
+
+    @staticmethod
+    def open(player_name: str, uid: Optional[str]) -> "Seat":
+        return Seat(player_name, uid, secrets.token_urlsafe(16))
+
+
+def sequenced(message: Any, seq: int) -> Any:
+    """ Returns the message with a `seq` property added in front of the
+        others, without decoding its text """
+    if isinstance(message, dict):
+        return EncodedMessage.of({"seq": seq, **message})
+    if not isinstance(message, EncodedMessage) or not message.text.startswith("{"):
+        return message
+    return message.with_seq(seq)
+
+
+class MessageLog:
+    """ Numbers a game's outgoing messages and keeps the latest of them, so
+        that a client that reconnects can be sent just the ones it missed.
+
+    The numbers are shared by all the game's players; each player sees
+    only the numbers of the messages sent to it, which are increasing but
+    not consecutive. Messages are recorded on the game's executor thread.
+    """
+
+    def __init__(self, capacity: int):
+        self.seq = 0
+        # (seq, player name or None for a broadcast, message)
+        self._entries: deque[tuple[int, Optional[str], Any]] = deque(maxlen=capacity)
+
+    def record(self, message: Any, player_name: Optional[str] = None) -> Any:
+        self.seq += 1
+        message = sequenced(message, self.seq)
+        self._entries.append((self.seq, player_name, message))
+        return message
+
+    def since(self, seq: int, player_name: str) -> Optional[list]:
+        """ Returns the messages for a player numbered after `seq`, or None if
+            some of them are no longer kept """
+        if seq > self.seq:
+            return None
+        if seq < self.seq and (not self._entries or self._entries[0][0] > seq + 1):
+            return None
+        return [message for entry_seq, recipient, message in self._entries
+                if entry_seq > seq and recipient in (None, player_name)]
@@ -0,0 +1,166 @@
+import bisect
+import hashlib
+import logging
+import multiprocessing
+import os
+import selectors
+import socket
+import time
+from typing import Callable, Optional
+from urllib.parse import urlparse
+
+
+logger = logging.getLogger(__name__)
+
+# A sharded server runs a game listener in each of several worker processes.
+# A front process accepts every connection and peeks at the request line of
+# its websocket handshake, without consuming it, to find the game ID. It then
+# hands the socket itself (not a copy of its data) to the worker that owns the
+# game, chosen by consistent hashing, and forgets about it; the worker
+# completes the handshake and serves the connection as if it had accepted it.
+# So all the players of a game meet in one process, and the front never
+# touches the game's traffic.
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """ Maps keys to nodes by consistent hashing, so that changing the number
+        of nodes moves only a fair share of the keys """
+
+    def __init__(self, nodes: int, replicas: int = 64):
+        points = sorted((_hash(f"{node}:{replica}"), node) for node in range(nodes) for replica in range(replicas))
+        self._hashes = [point for point, _ in points]
+        self._nodes = [node for _, node in points]
+
+    def node_for(self, key: str) -> int:
+        i = bisect.bisect(self._hashes, _hash(key)) % len(self._hashes)
+        return self._nodes[i]
+
+
+def gid_from_request_line(data: bytes) -> Optional[str]:
+    """ Finds the game ID in the path of an HTTP request line, the same way
+        the listeners do: the last segment of the path """
+    try:
+        method, target, _ = data.split(b"\r\n", 1)[0].decode("latin-1").split(" ")
+    except ValueError:
+        return None
+    return urlparse(target).path.split("/")[-1] or None
+
+
+def receive_socket(channel: socket.socket) -> Optional[socket.socket]:
+    """ Receives a socket handed off by the front; returns None once the
+        front has closed the channel """
+    _, fds, _, _ = socket.recv_fds(channel, 1, 1)
+    return socket.socket(fileno=fds[0]) if fds else None
+
+
+class ShardFront:
+
+    MAX_REQUEST_LINE = 8192
+    HANDSHAKE_TIMEOUT_SECONDS = 10
+    # the selector is level-triggered, so a socket holding only part of its
+    # request line is set aside for this long before it is peeked at again
+    REARM_DELAY_SECONDS = 0.05
+
+    def __init__(self, local_ip: str, local_port: int, channels: list[socket.socket]):
+        self.local_ip = local_ip
+        self.local_port = local_port
+        self.channels = channels
+        self.ring = HashRing(len(channels))
+        self.handed_off = [0] * len(channels)
+
+    def _hand_off(self, sock: socket.socket, data: bytes):
+        gid = gid_from_request_line(data)
+        # a request without a game ID is rejected by whichever worker gets it
+        worker = self.ring.node_for(gid) if gid else 0
+        socket.send_fds(self.channels[worker], [b"s"], [sock.fileno()])
+        self.handed_off[worker] += 1
+
+    def run(self):
+        selector = selectors.DefaultSelector()
+        with socket.create_server((self.local_ip, self.local_port), backlog=1024) as server:
+            server.setblocking(False)
+            selector.register(server, selectors.EVENT_READ)
+            logger.info("front listening on %s:%s for %s workers", self.local_ip, self.local_port, len(self.channels))
+            pending: dict[socket.socket, float] = {}
+            deferred: dict[socket.socket, float] = {}
+            while True:
+                timeout = 1.0
+                if deferred:
+                    timeout = max(0.0, min(timeout, min(deferred.values()) - time.monotonic()))
+                for key, _ in selector.select(timeout):
+                    if key.fileobj is server:
+                        try:
+                            sock, _ = server.accept()
+                        except BlockingIOError:
+                            continue
+                        selector.register(sock, selectors.EVENT_READ)
+                        pending[sock] = time.monotonic()
+                        continue
+                    sock = key.fileobj
+                    try:
+                        data = sock.recv(self.MAX_REQUEST_LINE, socket.MSG_PEEK)
+                    except OSError:
+                        data = b""
+                    selector.unregister(sock)
+                    if data and b"\r\n" not in data and len(data) < self.MAX_REQUEST_LINE:
+                        # wait for the rest of the request line
+                        deferred[sock] = time.monotonic() + self.REARM_DELAY_SECONDS
+                        continue
+                    del pending[sock]
+                    if data:
+                        self._hand_off(sock, data)
+                    sock.close()
+                now = time.monotonic()
+                for sock in [sock for sock, rearm_at in deferred.items() if rearm_at <= now]:
+                    del deferred[sock]
+                    selector.register(sock, selectors.EVENT_READ)
+                expired = now - self.HANDSHAKE_TIMEOUT_SECONDS
+                for sock in [sock for sock, accepted in pending.items() if accepted < expired]:
+                    if sock in deferred:
+                        del deferred[sock]
+                    else:
+                        selector.unregister(sock)
+                    del pending[sock]
+                    sock.close()
+
+
+def _run_worker(index: int, workers: int, channel: socket.socket,
+                create_listener: Callable[[Callable[[str], bool], int], object]):
+    ring = HashRing(workers)
+    listener = create_listener(lambda gid: ring.node_for(gid) == index, index)
+    listener.run(handoff=channel)
+
+
+def run_sharded(local_ip: str, local_port: int, workers: int,
+                create_listener: Callable[[Callable[[str], bool], int], object]):
+    """ Runs a listener in each of `workers` processes behind a front that
+        routes each connection by its game ID.
+
+    :param create_listener: called in each worker with a predicate that tells
+        whether a game ID belongs to the worker, and the worker's index;
+        returns the worker's listener
+    """
+    workers = workers or os.cpu_count()
+    channels = []
+    processes = []
+    for index in range(workers):
+        front_end, worker_end = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        process = multiprocessing.Process(target=_run_worker, name=f"worker-{index}",
+                                          args=(index, workers, worker_end, create_listener))
+        process.start()
+        worker_end.close()
+        channels.append(front_end)
+        processes.append(process)
+
+    try:
+        ShardFront(local_ip, local_port, channels).run()
+    except KeyboardInterrupt:
+        pass
+    for channel in channels:
+        channel.close()
+    for process in processes:
+        process.join()
@@ -0,0 +1,200 @@
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass
+from threading import Lock, Thread
+from typing import Optional
+from urllib.parse import parse_qs, urlparse
+
+from gamecomm.server import ConnectionClosed, GameConnection
+
+import server.config as config
+from . import codec
+from .messages import EncodedMessage, close_connection, negotiate_codec, request_path
+from .outbound import OutboundQueue, open_queue
+
+
+logger = logging.getLogger(__name__)
+
+
+def is_spectator(connection: GameConnection) -> bool:
+    """ Tells whether a client connected to watch its game (with a path
+        like `/<gid>?spectate`) rather than to take a seat in it """
+    path = request_path(connection)
+    if not path:
+        return False
+    return "spectate" in parse_qs(urlparse(path).query, keep_blank_values=True)
+
+
+@dataclass(frozen=True)
+class GameSnapshot:
+    """ The public state of a game (nobody's cards), as of message `seq` """
+    seq: int
+    game_started: bool
+    player_names: tuple[str, ...]
+    current_player: Optional[str]
+    books: tuple[int, ...]
+    hand_sizes: tuple[int, ...]
+    deck_size: int
+    winners: Optional[tuple[str, ...]]
+
+    def to_message(self) -> dict:
+        return {
+            "action": "spectate",
+            "seq": self.seq,
+            "gameStarted": self.game_started,
+            "playerNames": list(self.player_names),
+            "currentPlayer": self.current_player,
+            "books": dict(zip(self.player_names, self.books)),
+            "handSizes": dict(zip(self.player_names, self.hand_sizes)),
+            "deckSize": self.deck_size,
+            "winners": list(self.winners) if self.winners is not None else None,
+        }
+
+
+class SpectatorChannel:
+    """ Sends the snapshots of one game to the clients watching it.
+
+    A snapshot is taken on the game's executor thread after a request that
+    changed the game, so it never needs the game's lock; it is immutable,
+    so the feed thread can encode and send it while the game moves on. The
+    feed sends only the latest snapshot that is at least `delay` seconds
+    old, so spectators see every few transitions coalesced into one, and
+    nothing a spectator does reaches the game's executor or its players.
+    """
+
+    def __init__(self, gid: str):
+        self.gid = gid
+        self._queues: dict[GameConnection, OutboundQueue] = {}
+        # spectators that haven't been sent a snapshot yet
+        self._joined: list[OutboundQueue] = []
+        self._pending: deque[tuple[float, GameSnapshot]] = deque()
+        self._current: Optional[EncodedMessage] = None
+        self._lock = Lock()
+        self.published_seq: Optional[int] = None
+
+    @property
+    def watched(self) -> bool:
+        return bool(self._queues)
+
+    def count(self) -> int:
+        with self._lock:
+            return len(self._queues)
+
+    def publish(self, snapshot: GameSnapshot):
+        self.published_seq = snapshot.seq
+        self._pending.append((time.monotonic(), snapshot))
+
+    def add(self, connection: GameConnection) -> OutboundQueue:
+        queue = open_queue(connection)
+        # spectators can ask for the binary codec too, as in `?spectate&codec=msgpack`
+        queue.set_binary(negotiate_codec(connection) != codec.JSON)
+        with self._lock:
+            self._queues[connection] = queue
+            self._joined.append(queue)
+            feed.add(self)
+        logger.info("spectator %s joined game %s", connection, self.gid)
+        return queue
+
+    def remove(self, connection: GameConnection):
+        with self._lock:
+            queue = self._queues.pop(connection, None)
+            if queue in self._joined:
+                self._joined.remove(queue)
+            if not self._queues:
+                feed.remove(self)
+        if queue:
+            queue.close()
+            logger.info("spectator %s left game %s", connection, self.gid)
+
+    def watch(self, connection: GameConnection):
+        """ Serves a spectator added on a connection's own thread, until it
+            goes away; anything it sends is ignored """
+        try:
+            while self._queues.get(connection):
+                try:
+                    connection.recv(0.250)
+                except (TimeoutError, ValueError):
+                    pass
+        except ConnectionClosed:
+            pass
+        finally:
+            self.remove(connection)
+
+    async def watch_async(self, connection: GameConnection):
+        """ Like watch, for a connection on an asyncio event loop """
+        try:
+            while True:
+                try:
+                    await connection.recv_async()
+                except ValueError:
+                    pass
+        except ConnectionClosed:
+            pass
+        finally:
+            self.remove(connection)
+
+    def flush(self, cutoff: float):
+        """ Sends the latest snapshot published before `cutoff` (on the
+            monotonic clock) to every spectator, or the current one to those
+            who have just joined """
+        snapshot = None
+        while self._pending and self._pending[0][0] <= cutoff:
+            _, snapshot = self._pending.popleft()
+        with self._lock:
+            if snapshot:
+                self._current = EncodedMessage.of(snapshot.to_message(), key="spectate")
+                queues = list(self._queues.values())
+            elif self._current and self._joined:
+                queues = list(self._joined)
+            else:
+                return
+            self._joined.clear()
+            message = self._current
+        for queue in queues:
+            queue.put(message)
+
+    def close(self):
+        with self._lock:
+            connections = list(self._queues)
+        for connection in connections:
+            self.remove(connection)
+            close_connection(connection)
+
+
+class SpectatorFeed:
+    """ The one thread (for the whole process) that flushes the snapshots of
+        every watched game, once every `interval` seconds """
+
+    def __init__(self, interval: float, delay: float):
+        self.interval = interval
+        self.delay = delay
+        self._channels: set[SpectatorChannel] = set()
+        self._lock = Lock()
+        self._thread: Optional[Thread] = None
+
+    def add(self, channel: SpectatorChannel):
+        with self._lock:
+            self._channels.add(channel)
+            if not self._thread:
+                self._thread = Thread(target=self._run, name="spectator-feed", daemon=True)
+                self._thread.start()
+
+    def remove(self, channel: SpectatorChannel):
+        with self._lock:
+            self._channels.discard(channel)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                channels = list(self._channels)
+            cutoff = time.monotonic() - self.delay
+            for channel in channels:
+                try:
+                    channel.flush(cutoff)
+                except Exception as err:
+                    logger.exception("error sending snapshots of game %s: %s", channel.gid, err)
+
+
+feed = SpectatorFeed(float(config.SPECTATOR_INTERVAL), float(config.SPECTATOR_DELAY))
@@ -0,0 +1,61 @@
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from gameauth import TokenValidator
+
+
+class TokenCache:
+    """ Remembers the claims of tokens that have been verified, so that a
+        client that reconnects with the same token (for the same game) isn't
+        put through another signature verification.
+
+    An entry is dropped when its token expires (allowing the validator's
+    leeway, as the validator itself does), and the least recently used
+    entries are evicted to keep at most `capacity` of them. Tokens that fail
+    validation aren't cached.
+    """
+
+    def __init__(self, validator: TokenValidator, capacity: int = 10000):
+        self.validator = validator
+        self.capacity = capacity
+        self._entries: OrderedDict[tuple[str, str], tuple[dict, float]] = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+
+    def validate(self, gid: str, token: str) -> dict:
+        """ Returns the token's claims, like TokenValidator.validate (which
+            raises InvalidTokenError for a token that isn't valid) """
+        key = (gid, token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry:
+                claims, expires = entry
+                if time.time() < expires:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return claims
+                del self._entries[key]
+                self.expired += 1
+            self.misses += 1
+
+        claims = self.validator.validate(gid, token)
+        expires = claims["exp"] + self.validator.token_leeway_seconds
+        with self._lock:
+            self._entries[key] = (claims, expires)
+            if len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+        return claims
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "expired": self.expired,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
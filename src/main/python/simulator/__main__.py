@@ -0,0 +1,53 @@
+import argparse
+import json
+import time
+
+from .engine import END_ALL_BOOKS, END_DECK_EMPTY, HouseRules, SimulationResult, simulate
+from .reference import verify
+from .strategies import STRATEGIES
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--games", type=int, default=100000, help="number of games to play")
+    parser.add_argument("-p", "--players", type=int, default=4, help="players per game")
+    parser.add_argument("--hand-size", type=int, help="cards dealt to each player (default: 7 for 3 or fewer players, else 5)")
+    parser.add_argument("--end-rule", choices=(END_DECK_EMPTY, END_ALL_BOOKS), default=END_DECK_EMPTY,
+                        help="condition that ends a game")
+    parser.add_argument("--no-draw-on-go-fish", action="store_true",
+                        help="don't draw a card after a failed ask")
+    parser.add_argument("--max-turns", type=int, default=2000, help="truncate games after this many turns")
+    parser.add_argument("-s", "--strategy", nargs="+", choices=sorted(STRATEGIES), default=["random"],
+                        help="ask strategy for all seats, or one strategy per seat")
+    parser.add_argument("--batch", type=int, default=100000, help="games simulated at once")
+    parser.add_argument("--seed", type=int, help="seed for the random number generator")
+    parser.add_argument("--verify", type=int, metavar="N",
+                        help="also replay N recorded games on GoFishGame and compare the outcomes")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    rules = HouseRules(num_players=args.players, hand_size=args.hand_size, end_rule=args.end_rule,
+                       draw_on_go_fish=not args.no_draw_on_go_fish, max_turns=args.max_turns)
+    strategies = args.strategy if len(args.strategy) > 1 else args.strategy[0]
+
+    if args.verify:
+        mismatches = verify(simulate(args.verify, rules, strategies, seed=args.seed, record=True))
+        print(f"verified {args.verify} games against GoFishGame: {len(mismatches)} mismatches")
+        if mismatches:
+            raise SystemExit(1)
+
+    start = time.perf_counter()
+    results = []
+    remaining = args.games
+    seed = args.seed
+    while remaining > 0:
+        results.append(simulate(min(remaining, args.batch), rules, strategies, seed=seed))
+        remaining -= results[-1].num_games
+        seed = None if seed is None else seed + 1
+    elapsed = time.perf_counter() - start
+
+    summary = SimulationResult.concatenate(results).summary()
+    summary["games_per_minute"] = round(args.games / elapsed * 60)
+    print(json.dumps(summary, indent=2))
@@ -0,0 +1,220 @@
+from dataclasses import dataclass
+from typing import Callable, Optional, Sequence, Union
+
+import numpy as np
+
+from model.game import CARDS, NUM_SUITS, RANKS, GoFishGame
+
+from .strategies import STRATEGIES
+
+Strategy = Callable[..., tuple]
+
+END_DECK_EMPTY = "deck_empty"   # GoFishGame.check_game_end
+END_ALL_BOOKS = "all_books"     # GoFishGame.is_game_over
+
+DRAW = -1                       # rank recorded for a turn on which the player drew instead of asking
+
+NUM_RANKS = len(RANKS)
+DECK_SIZE = len(CARDS)
+
+
+@dataclass(frozen=True)
+class HouseRules:
+    """ The rules under which a batch of games is played.
+
+    As in GameController, each turn is a single ask (or a draw when the hand
+    is empty) and the turn always passes afterwards. By default the asking
+    player also draws after a failed ask; without that draw the deck only
+    shrinks when a hand runs out, and most games never reach an end.
+    """
+    num_players: int = 4
+    hand_size: Optional[int] = None     # None uses GoFishGame.deal_cards: 7 cards for 3 or fewer players, else 5
+    end_rule: str = END_DECK_EMPTY
+    draw_on_go_fish: bool = True
+    max_turns: int = 2000               # games still running after this many turns are truncated
+
+    @property
+    def initial_cards(self) -> int:
+        if self.hand_size is not None:
+            return self.hand_size
+        return GoFishGame.initial_hand_size(self.num_players)
+
+    def validate(self):
+        if self.num_players < 2:
+            raise ValueError("must have at least two players")
+        if self.initial_cards < 0 or self.initial_cards * self.num_players > DECK_SIZE:
+            raise ValueError(f"cannot deal {self.initial_cards} cards to {self.num_players} players")
+        if self.end_rule not in (END_DECK_EMPTY, END_ALL_BOOKS):
+            raise ValueError(f"unknown end rule '{self.end_rule}'")
+
+
+@dataclass
+class SimulationResult:
+    rules: HouseRules
+    books: np.ndarray           # (games, players) books completed by each player
+    turns: np.ndarray           # (games,) number of turns played
+    truncated: np.ndarray       # (games,) True if the game hit rules.max_turns
+    decks: Optional[np.ndarray] = None      # (games, 52) deck order (card ids, drawn from the end), if recorded
+    moves: Optional[np.ndarray] = None      # (turns, games, 2) target seat and rank (or DRAW) per turn, if recorded
+
+    @staticmethod
+    def concatenate(results: Sequence["SimulationResult"]) -> "SimulationResult":
+        """ Combines the outcomes (but not the recordings) of batches played under the same rules """
+        return SimulationResult(results[0].rules,
+                                np.concatenate([result.books for result in results]),
+                                np.concatenate([result.turns for result in results]),
+                                np.concatenate([result.truncated for result in results]))
+
+    @property
+    def num_games(self) -> int:
+        return len(self.turns)
+
+    @property
+    def winners(self) -> np.ndarray:
+        """ (games, players) mask of the players with the most books; ties share the win """
+        return (self.books == self.books.max(axis=1, keepdims=True)) & ~self.truncated[:, None]
+
+    def win_rates(self) -> np.ndarray:
+        """ Share of finished games won (or tied for the win) by each seat """
+        finished = max(int((~self.truncated).sum()), 1)
+        return self.winners.sum(axis=0) / finished
+
+    def book_distribution(self) -> np.ndarray:
+        """ Share of player-games ending with 0, 1, ... 13 books """
+        counts = np.bincount(self.books.ravel(), minlength=NUM_RANKS + 1)
+        return counts / max(self.books.size, 1)
+
+    def summary(self) -> dict:
+        winners = self.winners
+        return {
+            "games": self.num_games,
+            "truncated": int(self.truncated.sum()),
+            "win_rates": self.win_rates().round(4).tolist(),
+            "tie_rate": round(float((winners.sum(axis=1) > 1).mean()), 4),
+            "turns": {
+                "mean": round(float(self.turns.mean()), 2),
+                "p50": int(np.percentile(self.turns, 50)),
+                "p99": int(np.percentile(self.turns, 99)),
+                "max": int(self.turns.max()),
+            },
+            "mean_books": self.books.mean(axis=0).round(3).tolist(),
+            "book_distribution": self.book_distribution().round(4).tolist(),
+        }
+
+
+def _resolve(strategies, num_players) -> list[Strategy]:
+    if strategies is None or callable(strategies) or isinstance(strategies, str):
+        strategies = [strategies or "random"] * num_players
+    if len(strategies) != num_players:
+        raise ValueError(f"need one strategy per seat, got {len(strategies)} for {num_players} players")
+    return [STRATEGIES[s] if isinstance(s, str) else s for s in strategies]
+
+
+def simulate(num_games: int, rules: HouseRules = HouseRules(),
+             strategies: Union[str, Strategy, Sequence[Union[str, Strategy]], None] = None,
+             seed=None, record: bool = False) -> SimulationResult:
+    """ Plays a batch of games at once.
+
+    Each player's hand is a row of 13 rank counts; suits never affect the
+    outcome so they are only tracked in the recorded deck order. All games
+    in the batch advance one turn per step of the main loop, and finished
+    games drop out of the working set.
+
+    Args:
+        num_games (int): number of games to play
+        rules (HouseRules): rules for every game in the batch
+        strategies: ask strategy for every seat (a name from STRATEGIES or a
+            function), or a sequence giving one strategy per seat
+        seed: seed for the numpy random Generator
+        record (bool): if True, keep the deck order and every move so that
+            the games can be replayed (see simulator.reference)
+
+    Returns:
+        SimulationResult: per-game books, lengths and (optionally) move logs
+    """
+    rules.validate()
+    num_players = rules.num_players
+    seat_strategies = _resolve(strategies, num_players)
+    rng = np.random.default_rng(seed)
+
+    decks = rng.permuted(np.tile(np.arange(DECK_SIZE, dtype=np.int8), (num_games, 1)), axis=1)
+    deck_ranks = decks // NUM_SUITS
+    top = np.full(num_games, DECK_SIZE - 1, dtype=np.int16)     # like Deck.draw_card, cards come off the end
+
+    hands = np.zeros((num_games, num_players, NUM_RANKS), dtype=np.int8)
+    books = np.zeros((num_games, num_players), dtype=np.int16)
+    turns = np.zeros(num_games, dtype=np.int32)
+    current = np.zeros(num_games, dtype=np.int64)
+    moves = np.full((rules.max_turns, num_games, 2), DRAW, dtype=np.int8) if record else None
+    games = np.arange(num_games)
+
+    # Deal round robin, as GoFishGame.deal_cards does. Cards are never removed
+    # while dealing, so a rank reaching four cards is exactly a completed book.
+    dealt = rules.initial_cards * num_players
+    if dealt:
+        seats = np.tile(np.arange(num_players), rules.initial_cards)
+        ranks = deck_ranks[:, DECK_SIZE - 1 - np.arange(dealt)]
+        np.add.at(hands, (np.repeat(games, dealt), np.tile(seats, num_games), ranks.ravel()), 1)
+        top -= dealt
+        booked = hands == NUM_SUITS
+        books += booked.sum(axis=2, dtype=np.int16)
+        hands[booked] = 0
+
+    def add_cards(g, seat, rank, count):
+        hands[g, seat, rank] += count
+        full = hands[g, seat, rank] == NUM_SUITS
+        books[g[full], seat[full]] += 1
+        hands[g[full], seat[full], rank[full]] = 0
+
+    def draw(g, seat):
+        rank = deck_ranks[g, top[g]]
+        top[g] -= 1
+        add_cards(g, seat, rank, 1)
+
+    def is_over(g):
+        over = top[g] < 0
+        if rules.end_rule == END_ALL_BOOKS:
+            over |= (books[g] >= 1).all(axis=1)
+        return over
+
+    active = games[~is_over(games)]
+    while len(active):
+        seat = current[active]
+        own = hands[active, seat]
+        empty = ~own.any(axis=1)
+
+        # An empty hand can only draw
+        drawing = active[empty]
+        if len(drawing):
+            draw(drawing, seat[empty])
+
+        asking, asker = active[~empty], seat[~empty]
+        if len(asking):
+            target = np.empty(len(asking), dtype=np.int64)
+            rank = np.empty(len(asking), dtype=np.int64)
+            asker_hands = own[~empty]
+            hand_sizes = hands[asking].sum(axis=2, dtype=np.int16)
+            for s, strategy in enumerate(seat_strategies):
+                mine = asker == s
+                if mine.any():
+                    target[mine], rank[mine] = strategy(asker_hands[mine], hand_sizes[mine], asker[mine], rng)
+            given = hands[asking, target, rank]
+            hit = given > 0
+            hands[asking[hit], target[hit], rank[hit]] = 0
+            add_cards(asking[hit], asker[hit], rank[hit], given[hit])
+            if rules.draw_on_go_fish:
+                fish = asking[~hit]
+                fish = fish[top[fish] >= 0]
+                draw(fish, current[fish])
+            if record:
+                moves[turns[asking], asking, 0] = target
+                moves[turns[asking], asking, 1] = rank
+
+        current[active] = (seat + 1) % num_players
+        turns[active] += 1
+        active = active[~is_over(active) & (turns[active] < rules.max_turns)]
+
+    truncated = ~is_over(games)
+    if record:
+        moves = moves[:int(turns.max(initial=0))]
+    return SimulationResult(rules, books, turns, truncated, decks if record else None, moves)
@@ -0,0 +1,77 @@
+import numpy as np
+
+from model.game import CARDS, RANKS, GoFishGame, Player
+
+from .engine import DRAW, END_ALL_BOOKS, HouseRules, SimulationResult
+
+
+def _start(game: GoFishGame, names: list, rules: HouseRules):
+    if rules.hand_size is None:
+        game.start_game(names)
+        return
+    # GoFishGame.deal_cards hard-codes the hand size, so deal the same way by hand
+    game.players = [Player(name, game._notify) for name in names]
+    for _ in range(rules.hand_size):
+        for player in game.players:
+            player.draw(game.deck)
+    game.game_started = True
+
+
+def _is_over(game: GoFishGame, rules: HouseRules) -> bool:
+    if rules.end_rule == END_ALL_BOOKS:
+        return game.is_game_over()
+    return game.check_game_end()[0]
+
+
+def replay(deck: np.ndarray, moves: np.ndarray, rules: HouseRules) -> tuple[GoFishGame, int]:
+    """ Replays one recorded game on the reference GoFishGame engine.
+
+    Args:
+        deck (np.ndarray): card ids in deck order, drawn from the end
+        moves (np.ndarray): (turns, 2) target seat and rank index per turn,
+            with DRAW as the rank on turns where the player drew
+        rules (HouseRules): rules the game was simulated under
+
+    Returns:
+        tuple[GoFishGame, int]: the game in its final state and the number
+                                of turns played before it ended
+    """
+    game = GoFishGame([])
+    game.deck.cards = [CARDS[card_id] for card_id in deck]
+    names = [f"Player {i + 1}" for i in range(rules.num_players)]
+    _start(game, names, rules)
+
+    turns = 0
+    for target, rank in moves:
+        if _is_over(game, rules):
+            break
+        player = game.players[game.current_player_index]
+        if rank == DRAW:
+            player.draw(game.deck)
+        else:
+            response = game.ask_for_card(player.name, names[target], RANKS[rank])
+            if response["result"] == "go_fish" and rules.draw_on_go_fish:
+                player.draw(game.deck)
+        game.next_player()
+        turns += 1
+    return game, turns
+
+
+def verify(result: SimulationResult) -> list[int]:
+    """ Replays every game of a recorded simulation on GoFishGame.
+
+    Returns:
+        list[int]: indexes of the games whose books or length differ from
+                   the reference engine (empty when the engines agree)
+    """
+    if result.decks is None or result.moves is None:
+        raise ValueError("simulation must be run with record=True")
+    mismatches = []
+    for g in range(result.num_games):
+        turns = int(result.turns[g])
+        game, played = replay(result.decks[g], result.moves[:turns, g], result.rules)
+        books = [player.books for player in game.players]
+        if (books != result.books[g].tolist() or played != turns
+                or _is_over(game, result.rules) == bool(result.truncated[g])):
+            mismatches.append(g)
+    return mismatches
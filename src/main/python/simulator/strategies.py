@@ -0,0 +1,42 @@
+import numpy as np
+
+# An ask strategy decides, for a batch of games in which it is a player's
+# turn, which opponent to ask and which rank to ask for. It is called with
+#
+#   hands       (n, 13) array with the current player's count of each rank
+#   hand_sizes  (n, players) array with the number of cards each player holds
+#   current     (n,) array with the seat of the current player
+#   rng         the simulator's numpy Generator
+#
+# and returns two (n,) integer arrays: the target seat and the rank index
+# (into model.game.RANKS). Every row passed in has at least one card in the
+# current player's hand, and the strategy must ask for a rank that the
+# current player holds and must not target the current player.
+
+
+def random_ask(hands, hand_sizes, current, rng):
+    """ Asks a uniformly chosen opponent for a uniformly chosen held rank """
+    num_players = hand_sizes.shape[1]
+    ranks = np.argmax(rng.random(hands.shape) * (hands > 0), axis=1)
+    targets = (current + rng.integers(1, num_players, len(current))) % num_players
+    return targets, ranks
+
+
+def most_held(hands, hand_sizes, current, rng):
+    """ Asks the next player for the rank held most often (lowest rank on ties) """
+    num_players = hand_sizes.shape[1]
+    return (current + 1) % num_players, np.argmax(hands, axis=1)
+
+
+def largest_hand(hands, hand_sizes, current, rng):
+    """ Asks the opponent holding the most cards for the rank held most often """
+    sizes = hand_sizes.astype(np.int16)
+    sizes[np.arange(len(current)), current] = -1
+    return np.argmax(sizes, axis=1), np.argmax(hands, axis=1)
+
+
+STRATEGIES = {
+    "random": random_ask,
+    "most_held": most_held,
+    "largest_hand": largest_hand,
+}